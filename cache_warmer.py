@@ -0,0 +1,112 @@
+# cache_warmer.py
+"""Precarga en segundo plano de los datos más consultados.
+
+Un hilo del proceso (se inicia una vez, al crear el cliente de Odoo en connection.py) ejecuta
+tareas de precarga que vuelven a consultar Odoo y reemplazan lo guardado en memoria antes de
+que venza, así las páginas casi siempre encuentran el dato en caché:
+
+- datos de referencia (equipos de venta) y catálogo de paquetes activos, desde el inicio,
+- la cuadratura precalculada de los paquetes activos (ver reconciliation_snapshot.py),
+- las tareas que registran las páginas con `registrar_precarga` (p. ej. las ventas del mes
+  actual y del anterior), desde la primera vez que se abren.
+
+Cada tarea se repite cada `PRECARGA_INTERVALO` segundos, menos que los TTL en memoria, con una
+variación aleatoria (`VARIACION_PRECARGA`); al iniciar, las tareas se escalonan
+(`ESCALON_PRECARGA`) para no llegar todas juntas a Odoo. Con `PRECARGA_ACTIVA=0` no se inicia.
+"""
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from catalog_store import precargar_catalogos
+from reconciliation_snapshot import INTERVALO_SNAPSHOT, actualizar_snapshot
+from reference_data import equipos
+
+PRECARGA_INTERVALO = int(os.getenv('PRECARGA_INTERVALO', '240'))
+VARIACION_PRECARGA = 0.1
+ESCALON_PRECARGA = 15
+PAUSA_PRECARGA = 5
+
+_TAREAS = {}
+_HILO = {'hilo': None}
+_LOCK = threading.Lock()
+
+
+def precarga_activa():
+    """True salvo que el entorno la desactive (PRECARGA_ACTIVA=0)."""
+    return os.getenv('PRECARGA_ACTIVA', '1').strip().lower() not in ('0', 'false', 'no')
+
+
+def meses_recientes(hoy=None):
+    """(inicio del mes anterior, fin del mes actual): rango de las ventas que se precargan."""
+    hoy = hoy or date.today()
+    inicio_mes = hoy.replace(day=1)
+    inicio_anterior = (inicio_mes - timedelta(days=1)).replace(day=1)
+    fin_mes = (inicio_mes.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return inicio_anterior, fin_mes
+
+
+def _espera(intervalo):
+    return intervalo * random.uniform(1 - VARIACION_PRECARGA, 1 + VARIACION_PRECARGA)
+
+
+def registrar_precarga(nombre, funcion, intervalo=None, inmediata=False):
+    """Registra (o actualiza) la tarea `nombre`: `funcion(odoo)` se ejecuta cada `intervalo` segundos.
+
+    Volver a registrar una tarea solo reemplaza su función, sin mover su próxima ejecución.
+    Sin `inmediata`, la primera ejecución es después de un intervalo (quien registra ya cargó
+    los datos).
+    """
+    intervalo = intervalo or PRECARGA_INTERVALO
+    with _LOCK:
+        tarea = _TAREAS.get(nombre)
+        if tarea is not None:
+            tarea['funcion'] = funcion
+            return
+        if inmediata:
+            proxima = time.monotonic() + ESCALON_PRECARGA * len(_TAREAS) + random.uniform(0, ESCALON_PRECARGA)
+        else:
+            proxima = time.monotonic() + _espera(intervalo)
+        _TAREAS[nombre] = {'funcion': funcion, 'intervalo': intervalo, 'proxima': proxima}
+
+
+def _ejecutar_pendientes(odoo):
+    ahora = time.monotonic()
+    with _LOCK:
+        pendientes = sorted(
+            (tarea['proxima'], nombre) for nombre, tarea in _TAREAS.items() if tarea['proxima'] <= ahora
+        )
+    for _, nombre in pendientes:
+        tarea = _TAREAS[nombre]
+        try:
+            tarea['funcion'](odoo)
+        except Exception as e:
+            print(f"Error en la precarga '{nombre}': {str(e)}")
+        with _LOCK:
+            tarea['proxima'] = time.monotonic() + _espera(tarea['intervalo'])
+
+
+def _bucle(odoo):
+    while True:
+        _ejecutar_pendientes(odoo)
+        time.sleep(PAUSA_PRECARGA)
+
+
+def iniciar_precarga(odoo):
+    """Inicia el hilo de precarga del proceso (una sola vez). Devuelve True si lo inició."""
+    if not precarga_activa():
+        return False
+    with _LOCK:
+        if _HILO['hilo'] is not None:
+            return False
+        _HILO['hilo'] = threading.Thread(target=_bucle, args=(odoo,), name='precarga', daemon=True)
+    _HILO['hilo'].start()
+    return True
+
+
+# Tareas del proceso: no dependen de que se abra una página
+registrar_precarga('referencias', lambda odoo: equipos(odoo, refrescar=True), inmediata=True)
+registrar_precarga('catalogo', precargar_catalogos, inmediata=True)
+registrar_precarga('conciliacion', actualizar_snapshot, intervalo=INTERVALO_SNAPSHOT, inmediata=True)
@@ -0,0 +1,172 @@
+# catalog_store.py
+"""Catálogo de paquetes (product.template) filtrado en Odoo y guardado en memoria.
+
+Los filtros de estado, ventana de fecha de salida, destino y lote se traducen a un dominio de
+Odoo, así que solo se descargan los paquetes vigentes y no todo el histórico. La descarga se
+hace en páginas (`TAMANO_PAGINA`) y cada catálogo queda en memoria por `TTL_CATALOGO` segundos,
+compartido entre sesiones.
+
+Si se pide un subconjunto (p. ej. un destino) de un catálogo que ya está en memoria, se filtra
+localmente en vez de volver a consultar Odoo. Las plazas reservadas/pagadas/disponibles
+pueden calcularse localmente (ver seat_counters.py). Los catálogos por defecto de las páginas
+se refrescan en segundo plano (`precargar_catalogos`, ver cache_warmer.py), y un catálogo
+vencido puede servirse mientras se refresca (ver staleness.py).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from seat_counters import load_frame_con_plazas
+from staleness import revalidar, servir_vencido
+
+CAMPOS_CATALOGO = [
+    'id', 'name', 'default_code', 'x_studio_lote', 'x_studio_destino',
+    'x_studio_transporte', 'x_studio_ida_fecha_salida', 'x_studio_boletos_totales',
+    'x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf',
+    'x_studio_boletos_disponibles', 'x_studio_tipo_de_cupo', 'x_studio_estado_viaje',
+    'list_price', 'x_studio_comision_agencia'
+]
+
+# Campos necesarios para armar las opciones de los filtros
+CAMPOS_OPCIONES = ['id', 'x_studio_destino', 'x_studio_lote', 'x_studio_tipo_de_cupo', 'x_studio_ida_fecha_salida']
+
+# Todos los paquetes, sin filtro, para los filtros de Cuadratura de Pagos
+CAMPOS_CUADRATURA = [
+    'id', 'name', 'default_code', 'x_studio_lote', 'x_studio_destino',
+    'x_studio_ida_fecha_salida', 'x_studio_tipo_de_cupo', 'x_studio_estado_viaje'
+]
+
+# Filtros por defecto de Ocupación de Paquetes: estados Activo y Validación, salidas del último año
+ESTADOS_ACTIVOS = [3, 4]
+VENTANA_SALIDA_DIAS = 365
+
+TAMANO_PAGINA = 500
+TTL_CATALOGO = 300
+MAX_CATALOGOS = 16
+
+_CATALOGOS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def dominio_catalogo(estados=None, fecha_desde=None, fecha_hasta=None, destinos=None, lotes=None):
+    """Dominio de product.template para los filtros dados (None o vacío = sin filtro).
+
+    Los paquetes sin fecha de salida se mantienen dentro de la ventana de fechas.
+    """
+    dominio = []
+    if estados:
+        dominio.append(('x_studio_estado_viaje', 'in', sorted(int(e) for e in estados)))
+    if fecha_desde:
+        dominio += ['|', ('x_studio_ida_fecha_salida', '=', False), ('x_studio_ida_fecha_salida', '>=', str(fecha_desde))]
+    if fecha_hasta:
+        dominio += ['|', ('x_studio_ida_fecha_salida', '=', False), ('x_studio_ida_fecha_salida', '<=', str(fecha_hasta))]
+    if destinos:
+        dominio.append(('x_studio_destino', 'in', sorted(destinos)))
+    if lotes:
+        dominio.append(('x_studio_lote', 'in', sorted(lotes)))
+    return dominio
+
+
+def _clave(dominio, campos):
+    hojas = tuple(
+        (h[0], h[1], tuple(h[2]) if isinstance(h[2], list) else h[2]) if isinstance(h, tuple) else h
+        for h in dominio
+    )
+    return hojas, tuple(campos)
+
+
+def _vigente(odoo, clave, antiguedad_maxima=None):
+    """Catálogo en memoria para `clave` si está vigente, o vencido hace menos de `antiguedad_maxima`
+    segundos (en ese caso se devuelve igual y se refresca en segundo plano, ver staleness.py)."""
+    with _LOCK:
+        entrada = _CATALOGOS.get(clave)
+        if entrada is None:
+            return None
+        momento, df, dominio = entrada
+        edad = time.monotonic() - momento
+        vencido = servir_vencido(edad, TTL_CATALOGO, antiguedad_maxima)
+        if edad > TTL_CATALOGO and not vencido:
+            return None
+        _CATALOGOS.move_to_end(clave)
+    if vencido:
+        revalidar('catalogo', clave, lambda: _cargar(odoo, clave, dominio))
+    return df
+
+
+def _cargar(odoo, clave, dominio):
+    """Consulta el catálogo en Odoo (en páginas) y lo guarda en memoria."""
+    df = load_frame_con_plazas(
+        odoo, 'product.template', domain=dominio, fields=list(clave[1]), page_size=TAMANO_PAGINA
+    )
+    df.attrs['cargado'] = time.time()
+    with _LOCK:
+        _CATALOGOS[clave] = (time.monotonic(), df, dominio)
+        _CATALOGOS.move_to_end(clave)
+        while len(_CATALOGOS) > MAX_CATALOGOS:
+            _CATALOGOS.popitem(last=False)
+    return df
+
+
+def _desde_memoria(odoo, dominio_base, campos, destinos, lotes, antiguedad_maxima):
+    """Busca en memoria un catálogo que contenga al pedido y lo filtra localmente."""
+    with _LOCK:
+        candidatos = [clave for clave in _CATALOGOS if clave[0] == _clave(dominio_base, campos)[0]]
+    for clave in candidatos:
+        if not set(campos) <= set(clave[1]):
+            continue
+        df = _vigente(odoo, clave, antiguedad_maxima)
+        if df is None:
+            continue
+        if destinos:
+            df = df[df['x_studio_destino'].isin(destinos)]
+        if lotes:
+            df = df[df['x_studio_lote'].isin(lotes)]
+        return df[list(campos)]
+    return None
+
+
+def cargar_catalogo(odoo, estados=None, fecha_desde=None, fecha_hasta=None, destinos=None, lotes=None,
+                    campos=None, refrescar=False, antiguedad_maxima=None):
+    """Devuelve el catálogo tipado (ver schemas.py) para los filtros dados.
+
+    Orden de búsqueda: mismo catálogo en memoria, catálogo en memoria sin filtro de destino/lote
+    (o con más campos), y por último Odoo con el dominio completo, en páginas. Con `refrescar`
+    se consulta Odoo directamente y se reemplaza lo guardado. Con `antiguedad_maxima` se aceptan
+    catálogos vencidos hasta esa edad, que se refrescan en segundo plano.
+    `df.attrs['cargado']` indica cuándo se consultó Odoo (time.time()).
+    """
+    campos = list(campos or CAMPOS_CATALOGO)
+    dominio = dominio_catalogo(estados, fecha_desde, fecha_hasta, destinos, lotes)
+    clave = _clave(dominio, campos)
+
+    df = None
+    if not refrescar:
+        df = _vigente(odoo, clave, antiguedad_maxima)
+        if df is None:
+            df = _desde_memoria(
+                odoo, dominio_catalogo(estados, fecha_desde, fecha_hasta), campos, destinos, lotes, antiguedad_maxima
+            )
+    if df is None:
+        df = _cargar(odoo, clave, dominio)
+    return df.copy()
+
+
+def cargar_opciones(odoo, estados=None, fecha_desde=None, fecha_hasta=None, antiguedad_maxima=None):
+    """Valores de destino, lote, tipo de cupo y fecha de salida disponibles para los filtros."""
+    return cargar_catalogo(
+        odoo, estados, fecha_desde, fecha_hasta, campos=CAMPOS_OPCIONES, antiguedad_maxima=antiguedad_maxima
+    )
+
+
+def precargar_catalogos(odoo):
+    """Refresca en memoria los catálogos por defecto de Ocupación y de Cuadratura de Pagos."""
+    fecha_desde = date.today() - timedelta(days=VENTANA_SALIDA_DIAS)
+    cargar_catalogo(odoo, estados=ESTADOS_ACTIVOS, fecha_desde=fecha_desde, refrescar=True)
+    cargar_catalogo(odoo, campos=CAMPOS_CUADRATURA, refrescar=True)
+
+
+def limpiar_catalogos():
+    """Descarta todos los catálogos en memoria (la próxima consulta va a Odoo)."""
+    with _LOCK:
+        _CATALOGOS.clear()
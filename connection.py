@@ -0,0 +1,23 @@
+# connection.py
+"""Cliente de Odoo compartido por las páginas de Streamlit.
+
+Construir `OdooClient` consulta la versión del servidor y autentica. Con `st.cache_resource` se
+hace una sola vez por proceso, y no en cada rerun ni en cada fragmento. Si la sesión de Odoo vence
+(o el servidor se reinicia), el cliente vuelve a autenticar solo; cada hilo (sesiones, precarga y
+revalidación) usa su propia conexión HTTP.
+"""
+import streamlit as st
+
+from cache_warmer import iniciar_precarga
+from odoo_client import OdooClient
+
+
+@st.cache_resource(show_spinner="Conectando con Odoo...")
+def get_odoo_client():
+    """Devuelve el OdooClient autenticado del proceso (se crea en la primera llamada).
+
+    Al crearlo se inicia la precarga en segundo plano (ver cache_warmer.py).
+    """
+    odoo = OdooClient()
+    iniciar_precarga(odoo)
+    return odoo
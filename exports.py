@@ -0,0 +1,261 @@
+# exports.py
+"""Exportación de tablas a archivos descargables, generados solo cuando se piden.
+
+Los botones de exportación no serializan ni copian nada al renderizar la página: el archivo se
+genera al hacer clic y los bytes quedan en caché por (versión del dataset, nombre, columnas,
+formato). La versión la entrega la página (p. ej. la hora de carga de los datos y la firma de los
+filtros aplicados), así un rerun con los mismos datos reutiliza el archivo sin recorrer el frame.
+
+Formatos:
+- 'xlsx': openpyxl en modo `write_only` (fila a fila, memoria constante).
+- 'parquet': pyarrow directo desde el DataFrame tipado (columnar, comprimido).
+- 'csv.gz': CSV comprimido con gzip.
+Varias tablas pueden exportarse juntas en un .zip (`export_bundle`).
+"""
+import hashlib
+import io
+import threading
+import zipfile
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# formato -> (nombre visible, extensión, mime)
+FORMATOS_EXPORTACION = {
+    'xlsx': ('Excel', 'xlsx', MIME_EXCEL),
+    'parquet': ('Parquet', 'parquet', 'application/vnd.apache.parquet'),
+    'csv.gz': ('CSV comprimido', 'csv.gz', 'application/gzip'),
+}
+
+# Archivos generados que se mantienen en memoria (compartidos entre sesiones)
+MAX_ARCHIVOS_EN_CACHE = 32
+
+_CACHE = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def version_dataframe(df):
+    """Huella del contenido de un DataFrame (valores, índice y columnas), calculada en bloque.
+
+    Recorre todo el frame: solo se usa cuando la página no entrega una versión propia.
+    """
+    try:
+        hashes = pd.util.hash_pandas_object(df, index=True)
+    except TypeError:
+        # Columnas con listas (x2many) u otros objetos no hasheables
+        hashes = pd.util.hash_pandas_object(df.astype(str), index=True)
+    huella = hashlib.sha1(hashes.to_numpy().tobytes())
+    huella.update(repr(list(df.columns)).encode('utf-8'))
+    return huella.hexdigest()
+
+
+def _celda(valor):
+    """Convierte valores que openpyxl no sabe escribir (listas, períodos, etc.) a texto."""
+    if isinstance(valor, (list, tuple, dict, set, pd.Period)):
+        return str(valor)
+    return valor
+
+
+def _filas(df):
+    """Itera las filas de `df` como tuplas listas para openpyxl (vacíos como None)."""
+    datos = df.astype(object).where(df.notna(), None)
+    for columna in datos.columns:
+        if df[columna].dtype == object or isinstance(df[columna].dtype, pd.PeriodDtype):
+            datos[columna] = datos[columna].map(_celda)
+    return datos.itertuples(index=False, name=None)
+
+
+def _relleno(css):
+    """Traduce 'background-color: #rrggbb' a un PatternFill de openpyxl."""
+    color = css.split(':', 1)[1].strip().lstrip('#').upper()
+    return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+
+def dataframe_a_excel(df, sheet_name='Sheet1', colores_fila=None):
+    """Escribe `df` en un libro XLSX en modo streaming y devuelve los bytes.
+
+    `colores_fila` es un array de CSS por fila (ver tables.semaforo); las filas con color se
+    escriben con relleno de fondo.
+    """
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(title=sheet_name[:31])
+    hoja.append([str(c) for c in df.columns])
+
+    if colores_fila is None:
+        for fila in _filas(df):
+            hoja.append(fila)
+    else:
+        rellenos = {}
+        for fila, css in zip(_filas(df), colores_fila, strict=True):
+            if not css:
+                hoja.append(fila)
+                continue
+            relleno = rellenos.setdefault(css, _relleno(css))
+            celdas = []
+            for valor in fila:
+                celda = WriteOnlyCell(hoja, value=valor)
+                celda.fill = relleno
+                celdas.append(celda)
+            hoja.append(celdas)
+
+    output = io.BytesIO()
+    libro.save(output)
+    return output.getvalue()
+
+
+def _tabla_arrow(df):
+    """Convierte `df` a una tabla Arrow; las columnas de objetos mixtos se pasan a texto."""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        df = df.copy()
+        for columna in [c for c in df.columns if pd.api.types.is_object_dtype(df[c])]:
+            df[columna] = df[columna].map(lambda v: None if v is None else _celda(v)).astype('string')
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def dataframe_a_parquet(df):
+    """Serializa `df` a Parquet (compresión zstd) y devuelve los bytes."""
+    output = io.BytesIO()
+    pq.write_table(_tabla_arrow(df), output, compression='zstd')
+    return output.getvalue()
+
+
+def dataframe_a_csv(df, comprimir=True):
+    """Serializa `df` a CSV UTF-8 (gzip si `comprimir`) y devuelve los bytes."""
+    output = io.BytesIO()
+    df.to_csv(output, index=False, encoding='utf-8', compression='gzip' if comprimir else None)
+    return output.getvalue()
+
+
+def dataframe_a_bytes(df, formato, sheet_name='Sheet1', colores_fila=None):
+    """Serializa `df` en el formato indicado ('xlsx', 'parquet' o 'csv.gz')."""
+    if formato == 'xlsx':
+        return dataframe_a_excel(df, sheet_name, colores_fila)
+    if formato == 'parquet':
+        return dataframe_a_parquet(df)
+    if formato == 'csv.gz':
+        return dataframe_a_csv(df)
+    raise ValueError(f"Formato de exportación no soportado: {formato}")
+
+
+def tablas_a_zip(tablas, formato='parquet'):
+    """Empaqueta varias tablas ({nombre: DataFrame}) en un .zip, un archivo por tabla.
+
+    Dentro del zip el CSV va sin gzip (el zip ya comprime).
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archivo:
+        for nombre, df in tablas.items():
+            if formato == 'csv.gz':
+                archivo.writestr(f"{nombre}.csv", dataframe_a_csv(df, comprimir=False))
+            elif formato == 'parquet':
+                # Parquet ya viene comprimido
+                archivo.writestr(f"{nombre}.parquet", dataframe_a_parquet(df), compress_type=zipfile.ZIP_STORED)
+            else:
+                archivo.writestr(f"{nombre}.xlsx", dataframe_a_excel(df, sheet_name=nombre))
+    return output.getvalue()
+
+
+def _clave(df, version, formato, nombre, sheet_name=None, colores_fila=None):
+    """Clave de caché del archivo: versión de los datos (o huella del frame si no hay), nombre y columnas."""
+    if version is None:
+        version = version_dataframe(df)
+    return (repr(version), nombre, tuple(map(str, df.columns)), formato, sheet_name, colores_fila is not None)
+
+
+def _obtener(clave):
+    with _LOCK:
+        datos = _CACHE.get(clave)
+        if datos is not None:
+            _CACHE.move_to_end(clave)
+        return datos
+
+
+def _guardar(clave, datos):
+    with _LOCK:
+        _CACHE[clave] = datos
+        _CACHE.move_to_end(clave)
+        while len(_CACHE) > MAX_ARCHIVOS_EN_CACHE:
+            _CACHE.popitem(last=False)
+
+
+def _boton_descarga(clave, generar, filename, mime, label, key):
+    """Botón para generar (una vez) y descargar un archivo; ver export_dataframe_to_excel.
+
+    `generar()` arma los bytes; solo se llama al hacer clic.
+    """
+    datos = _obtener(clave)
+
+    if datos is None:
+        if not st.button(label, key=key):
+            return None
+        try:
+            with st.spinner("Generando archivo..."):
+                datos = generar()
+        except Exception as e:
+            st.error(f"No se pudo generar {filename}: {str(e)}")
+            return None
+        _guardar(clave, datos)
+
+    return st.download_button(
+        label=f"⬇️ Descargar {filename}",
+        data=datos,
+        file_name=filename,
+        mime=mime,
+        key=f"{key}_descargar"
+    )
+
+
+def export_dataframe_to_excel(df, filename, sheet_name='Sheet1', colores_fila=None,
+                              label="📥 Exportar a Excel", key=None, version=None):
+    """Botón de exportación a Excel que genera el archivo solo cuando se pide.
+
+    Si el archivo para estos datos ya existe en caché, se muestra directamente el botón de
+    descarga. Si no, se muestra un botón para generarlo; al hacer clic se arma mostrando un spinner.
+
+    `version` identifica los datos de `df` (p. ej. (hora de carga, filtros)); sin ella se calcula
+    una huella del frame completo en cada ejecución. `colores_fila` puede ser una función
+    `colores_fila(df)`, que se evalúa recién al generar el archivo.
+    """
+    def generar():
+        datos = df.copy()
+        colores = colores_fila(datos) if callable(colores_fila) else colores_fila
+        return dataframe_a_excel(datos, sheet_name, colores)
+
+    return _boton_descarga(
+        _clave(df, version, 'xlsx', filename, sheet_name, colores_fila),
+        generar, filename, MIME_EXCEL, label, key or f"exportar_{filename}"
+    )
+
+
+def export_dataframe(df, nombre_base, formato='parquet', label=None, key=None, version=None):
+    """Botón de exportación de una tabla en el formato indicado (ver FORMATOS_EXPORTACION)."""
+    nombre_formato, extension, mime = FORMATOS_EXPORTACION[formato]
+    filename = f"{nombre_base}.{extension}"
+    return _boton_descarga(
+        _clave(df, version, formato, filename),
+        lambda: dataframe_a_bytes(df.copy(), formato),
+        filename, mime, label or f"📥 Exportar a {nombre_formato}", key or f"exportar_{filename}"
+    )
+
+
+def export_bundle(tablas, nombre_base, formato='parquet', label=None, key=None, version=None):
+    """Botón de exportación de varias tablas ({nombre: DataFrame}) en un solo .zip."""
+    nombre_formato = FORMATOS_EXPORTACION[formato][0]
+    filename = f"{nombre_base}.zip"
+    clave = ('zip', formato) + tuple((nombre, _clave(df, version, formato, nombre)) for nombre, df in tablas.items())
+    return _boton_descarga(
+        clave,
+        lambda: tablas_a_zip({nombre: df.copy() for nombre, df in tablas.items()}, formato),
+        filename, 'application/zip', label or f"📦 Exportar todo ({nombre_formato}, .zip)",
+        key or f"exportar_{filename}_{formato}"
+    )
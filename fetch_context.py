@@ -0,0 +1,44 @@
+# fetch_context.py
+"""Consultas compartidas dentro de una misma ejecución de página.
+
+Cuando varias funciones de una página piden el mismo modelo con el mismo dominio (con distintos
+campos), un `ContextoConsultas` lo lee una sola vez con la unión de los campos y entrega el mismo
+frame a todas. Los campos que se van a necesitar se pueden declarar antes con `pedir`, así la
+primera lectura ya trae todos; si después se piden campos nuevos, se vuelve a leer con la unión.
+
+El contexto vive solo durante la ejecución (no es una caché): se crea al empezar la consulta y se
+pasa a las funciones que la comparten.
+"""
+from schemas import load_frame
+
+
+class ContextoConsultas:
+    def __init__(self, odoo, cargador=load_frame):
+        """`cargador(odoo, model, domain=..., fields=..., **opciones)` lee un frame (p. ej. load_frame
+        o seat_counters.load_frame_con_plazas)."""
+        self.odoo = odoo
+        self.cargador = cargador
+        self._campos = {}   # (modelo, dominio, opciones) -> [campos pedidos]
+        self._frames = {}   # misma clave -> DataFrame leído
+
+    @staticmethod
+    def _clave(model, domain, opciones):
+        return model, repr(domain), repr(sorted(opciones.items()))
+
+    def pedir(self, model, domain, fields, **opciones):
+        """Declara que se van a necesitar `fields` de (model, domain)."""
+        campos = self._campos.setdefault(self._clave(model, domain, opciones), [])
+        campos.extend(c for c in fields if c not in campos)
+
+    def load_frame(self, model, domain=None, fields=None, **opciones):
+        """Frame de (model, domain) con al menos `fields`, leído una vez por ejecución.
+
+        Puede traer más columnas (las de los otros pedidos); se devuelve una copia.
+        """
+        self.pedir(model, domain, fields, **opciones)
+        clave = self._clave(model, domain, opciones)
+        df = self._frames.get(clave)
+        if df is None or not set(fields) <= set(df.columns):
+            df = self.cargador(self.odoo, model, domain=domain, fields=list(self._campos[clave]), **opciones)
+            self._frames[clave] = df
+        return df.copy()
@@ -0,0 +1,237 @@
+# month_store.py
+"""Datos de ventas guardados por mes (particiones) y armados para cualquier rango de fechas.
+
+Cada consulta (`nombre` + `parametros`, p. ej. filtros de agencia o estado) se guarda por mes
+calendario. Un rango de fechas (varios meses, un trimestre, el mismo período del año anterior)
+se arma concatenando las particiones de sus meses: solo los meses que faltan se consultan en
+Odoo.
+
+Cada partición lleva un índice datetime64 ordenado (de la columna de fecha, descendente como
+date_order desc) y los totales diarios de sus columnas numéricas, calculados una sola vez al
+guardarla. Los bordes de un rango se recortan con búsqueda binaria sobre ese índice, sin
+recorrer ni comparar textos de toda la tabla, y los agregados por día/semana/mes salen de los
+totales diarios (`agregados_rango`). Los cubos de ventas por dimensiones (ver sales_cube.py)
+también se calculan una vez por partición y se suman por rango (`cubo_rango`).
+
+Niveles de caché por partición:
+- memoria (compartida entre sesiones) por `TTL_PARTICION` segundos; con `antiguedad_maxima`,
+  una partición vencida se sirve igual y se refresca en segundo plano (ver staleness.py),
+- disco para los meses cerrados (ver period_cache.py),
+- Odoo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from period_cache import cargar_periodo
+from sales_cube import construir_cubo, sumar_cubos
+from staleness import revalidar, servir_vencido
+
+TTL_PARTICION = 300
+MAX_PARTICIONES = 96
+
+_PARTICIONES = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _como_fecha(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def meses_del_rango(fecha_inicio, fecha_fin):
+    """Lista de (primer día, último día) de cada mes calendario que toca el rango."""
+    inicio = _como_fecha(fecha_inicio).replace(day=1)
+    fin = _como_fecha(fecha_fin)
+    meses = []
+    while inicio <= fin:
+        siguiente = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+        meses.append((inicio, siguiente - timedelta(days=1)))
+        inicio = siguiente
+    return meses
+
+
+def _indexar(df, columna_fecha):
+    """Partición lista para consultar: filas con índice de fecha descendente y totales diarios."""
+    if df.empty:
+        return {'filas': df, 'claves': np.empty(0, dtype='int64'), 'diario': pd.DataFrame(), 'cargado': time.time()}
+
+    indice = pd.DatetimeIndex(pd.to_datetime(df[columna_fecha], format='ISO8601'), name='fecha')
+    filas = df.set_index(indice).sort_index(ascending=False, kind='mergesort')
+    diario = filas.select_dtypes('number').groupby(filas.index.normalize()).sum()
+    return {
+        'filas': filas,
+        # Claves ascendentes (fecha negada) para np.searchsorted sobre el índice descendente
+        'claves': -filas.index.asi8,
+        'diario': diario,
+        'cargado': time.time(),
+    }
+
+
+def _cortar(df, claves, fecha_inicio, fecha_fin):
+    """Filas con fecha en [fecha_inicio 00:00, fecha_fin 23:59:59], por búsqueda binaria."""
+    desde = pd.Timestamp(fecha_inicio).value
+    hasta = (pd.Timestamp(fecha_fin) + pd.Timedelta(days=1)).value
+    inicio = np.searchsorted(claves, -hasta, side='right')
+    fin = np.searchsorted(claves, -desde, side='right')
+    return df.iloc[inicio:fin]
+
+
+def _clave_particion(nombre, parametros, inicio_mes):
+    return nombre, repr(parametros), inicio_mes
+
+
+def _particion(odoo, nombre, parametros, inicio_mes, fin_mes, cargar_mes, vigilados_mes, columna_fecha,
+               refrescar=False, antiguedad_maxima=None):
+    clave = _clave_particion(nombre, parametros, inicio_mes)
+    particion, vencida = None, False
+    with _LOCK:
+        entrada = None if refrescar else _PARTICIONES.get(clave)
+        if entrada is not None:
+            edad = time.monotonic() - entrada[0]
+            vencida = servir_vencido(edad, TTL_PARTICION, antiguedad_maxima)
+            if edad <= TTL_PARTICION or vencida:
+                _PARTICIONES.move_to_end(clave)
+                particion = entrada[1]
+    if vencida:
+        # Se sirve la partición vencida y se vuelve a consultar el mes en segundo plano
+        revalidar(nombre, clave, lambda: _particion(
+            odoo, nombre, parametros, inicio_mes, fin_mes, cargar_mes, vigilados_mes, columna_fecha, refrescar=True
+        ))
+    if particion is not None:
+        return particion
+
+    df = cargar_periodo(
+        odoo,
+        nombre,
+        (parametros, str(inicio_mes)),
+        fin_mes,
+        vigilados_mes(inicio_mes, fin_mes),
+        lambda: cargar_mes(inicio_mes, fin_mes)
+    )
+    if df is None:
+        return None
+
+    particion = _indexar(df, columna_fecha)
+    with _LOCK:
+        _PARTICIONES[clave] = (time.monotonic(), particion)
+        _PARTICIONES.move_to_end(clave)
+        while len(_PARTICIONES) > MAX_PARTICIONES:
+            _PARTICIONES.popitem(last=False)
+    return particion
+
+
+def _partes(odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes, columna_fecha,
+            refrescar=False, antiguedad_maxima=None):
+    """Particiones del rango, del mes más reciente al más antiguo (None si alguna falla)."""
+    inicio, fin = _como_fecha(fecha_inicio), _como_fecha(fecha_fin)
+    partes = []
+    for inicio_mes, fin_mes in reversed(meses_del_rango(inicio, fin)):
+        particion = _particion(
+            odoo, nombre, parametros, inicio_mes, fin_mes, cargar_mes, vigilados_mes, columna_fecha,
+            refrescar, antiguedad_maxima
+        )
+        if particion is None:
+            return None
+        partes.append((particion, inicio_mes < inicio or fin_mes > fin))
+    return partes
+
+
+def cargar_rango(odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes,
+                 columna_fecha='Fecha', refrescar=False, antiguedad_maxima=None):
+    """DataFrame del rango [fecha_inicio, fecha_fin] armado con las particiones mensuales.
+
+    - `cargar_mes(inicio, fin)`: DataFrame de un mes completo desde Odoo (None si falla).
+    - `vigilados_mes(inicio, fin)`: (modelo, dominio) que invalidan el mes en disco.
+    - `columna_fecha`: columna 'YYYY-MM-DD[ HH:MM]' con la que se indexa cada partición.
+    - `refrescar`: vuelve a cargar los meses aunque estén en memoria (precarga en segundo plano).
+    - `antiguedad_maxima`: segundos que se acepta servir un mes vencido mientras se refresca.
+    El resultado tiene índice 'fecha' (datetime64, descendente), en el mismo orden que
+    sale.order (date_order desc), en `attrs['cargado']` la hora (time.time()) del mes consultado
+    hace más tiempo y en `attrs['particiones']` las claves de sus meses (las que usa `revalidar`,
+    ver staleness.mostrar_antiguedad). Devuelve None si algún mes no se pudo cargar.
+    """
+    partes = _partes(
+        odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes, columna_fecha,
+        refrescar, antiguedad_maxima
+    )
+    if partes is None:
+        return None
+    cargado = min((p['cargado'] for p, _ in partes), default=None)
+
+    # Solo los meses del borde se recortan; los meses completos se usan tal cual
+    filas = [
+        _cortar(p['filas'], p['claves'], fecha_inicio, fecha_fin) if borde else p['filas']
+        for p, borde in partes if not p['filas'].empty
+    ]
+    filas = [f for f in filas if not f.empty]
+    df = pd.concat(filas) if len(filas) > 1 else filas[0].copy() if filas else pd.DataFrame()
+    df.attrs['cargado'] = cargado
+    df.attrs['particiones'] = [
+        _clave_particion(nombre, parametros, inicio_mes) for inicio_mes, _ in meses_del_rango(fecha_inicio, fecha_fin)
+    ]
+    return df
+
+
+def agregados_rango(odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes,
+                    columna_fecha='Fecha', frecuencia='D', antiguedad_maxima=None):
+    """Totales de las columnas numéricas del rango por día ('D'), semana ('W') o mes ('MS').
+
+    Se calculan desde los totales diarios de cada partición, sin recorrer las filas.
+    """
+    partes = _partes(
+        odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes, columna_fecha,
+        antiguedad_maxima=antiguedad_maxima
+    )
+    if partes is None:
+        return None
+
+    inicio, fin = pd.Timestamp(_como_fecha(fecha_inicio)), pd.Timestamp(_como_fecha(fecha_fin))
+    diarios = [p['diario'].loc[inicio:fin] for p, _ in partes if not p['diario'].empty]
+    diarios = [d for d in diarios if not d.empty]
+    if not diarios:
+        return pd.DataFrame()
+
+    diario = pd.concat(diarios).sort_index()
+    return diario if frecuencia == 'D' else diario.resample(frecuencia).sum()
+
+
+def cubo_rango(odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes,
+               dimensiones, medidas, columna_orden=None, columna_fecha='Fecha', antiguedad_maxima=None):
+    """Cubo de ventas del rango (ver sales_cube.py): suma de los cubos de cada mes.
+
+    El cubo de un mes completo se calcula una vez y queda con la partición; solo los meses del
+    borde del rango se agregan desde sus filas recortadas.
+    """
+    partes = _partes(
+        odoo, nombre, parametros, fecha_inicio, fecha_fin, cargar_mes, vigilados_mes, columna_fecha,
+        antiguedad_maxima=antiguedad_maxima
+    )
+    if partes is None:
+        return None
+
+    clave = (tuple(dimensiones), tuple(medidas), columna_orden)
+    cubos = []
+    for particion, borde in partes:
+        if borde:
+            filas = _cortar(particion['filas'], particion['claves'], fecha_inicio, fecha_fin)
+            cubos.append(construir_cubo(filas, dimensiones, medidas, columna_orden))
+            continue
+        with _LOCK:
+            cubo = particion.setdefault('cubos', {}).get(clave)
+        if cubo is None:
+            cubo = construir_cubo(particion['filas'], dimensiones, medidas, columna_orden)
+            with _LOCK:
+                particion['cubos'][clave] = cubo
+        cubos.append(cubo)
+    return sumar_cubos(cubos, dimensiones, medidas)
+
+
+def limpiar_particiones(nombre=None):
+    """Descarta de memoria las particiones (todas, o solo las de la consulta `nombre`)."""
+    with _LOCK:
+        for clave in [c for c in _PARTICIONES if nombre is None or c[0] == nombre]:
+            del _PARTICIONES[clave]
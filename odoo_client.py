@@ -2,13 +2,40 @@
 import json
 import requests
 import os
+import threading
 from dotenv import load_dotenv
 from urllib.parse import urlparse, urlunparse
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import time
 
+from reference_data import nombres
+
+
+class SesionExpirada(Exception):
+    """La sesión de Odoo venció (o el servidor se reinició); se vuelve a autenticar."""
+
+
+def dominio_relacional(domain, campo):
+    """Reescribe un dominio para aplicarlo a través de un campo relacional.
+
+    Ej: dominio_relacional([('state', '=', 'sale')], 'order_id') -> [('order_id.state', '=', 'sale')].
+    Los operadores ('|', '&', '!') se mantienen.
+    """
+    return [
+        (f"{campo}.{hoja[0]}", hoja[1], hoja[2]) if isinstance(hoja, (list, tuple)) else hoja
+        for hoja in domain
+    ]
+
+
 class OdooClient:
+    """Cliente JSON-RPC de Odoo.
+
+    Se comparte entre las sesiones de Streamlit y los hilos de precarga y revalidación: cada hilo
+    usa su propia `requests.Session` con la cookie de la sesión de Odoo autenticada. Si la sesión
+    vence, la llamada que lo detecta vuelve a autenticar (una vez, bajo lock) y se reintenta.
+    """
+
     def __init__(self):
         # Cargar variables de entorno
         load_dotenv()
@@ -19,6 +46,11 @@ class OdooClient:
         self.username = os.getenv('ODOO_USERNAME')
         self.password = os.getenv('ODOO_PASSWORD')
 
+        # many2one por modelo (fields_get) y soporte de search_read con load=None
+        self._many2one = {}
+        self._m2o_ids_soportado = True
+        self._m2o_con_nombres = set()
+
         # Verificar que todas las variables están configuradas
         if not all([self.url, self.db, self.username, self.password]):
             missing = []
@@ -46,9 +78,30 @@ class OdooClient:
                 parsed_url = parsed_url._replace(netloc=netloc)
             
             self.base_url = urlunparse(parsed_url)
-            
+            requests.packages.urllib3.disable_warnings()
+
+            # Sesiones HTTP por hilo y sesión de Odoo compartida (ver _sesion_http)
+            self._local = threading.local()
+            self._lock_autenticacion = threading.Lock()
+            self.session_id = None
+
+            # Verificar la conexión y obtener la versión
+            version = self._jsonrpc('/web/webclient/version_info')
+            print(f"Conectado a Odoo versión: {version.get('server_version')}")
+
+            self._autenticar()
+
+        except Exception as e:
+            print(f"Error durante la inicialización: {str(e)}")
+            raise
+
+    @property
+    def session(self):
+        """`requests.Session` del hilo actual, con la cookie de la sesión de Odoo vigente."""
+        sesion = getattr(self._local, 'session', None)
+        if sesion is None:
             # Configurar la sesión con reintentos
-            self.session = requests.Session()
+            sesion = requests.Session()
             retry_strategy = Retry(
                 total=3,  # número total de reintentos
                 backoff_factor=1,  # tiempo de espera entre reintentos
@@ -56,31 +109,41 @@ class OdooClient:
                 allowed_methods=["POST"]  # permitir reintentos en POST
             )
             adapter = HTTPAdapter(max_retries=retry_strategy)
-            self.session.mount("http://", adapter)
-            self.session.mount("https://", adapter)
-            self.session.verify = False
-            requests.packages.urllib3.disable_warnings()
+            sesion.mount("http://", adapter)
+            sesion.mount("https://", adapter)
+            sesion.verify = False
+            self._local.session = sesion
+            self._local.session_id = None
+        if self.session_id and self._local.session_id != self.session_id:
+            sesion.cookies.clear()
+            sesion.cookies.set('session_id', self.session_id)
+            self._local.session_id = self.session_id
+        return sesion
 
-            # Verificar la conexión y obtener la versión
-            version = self._jsonrpc('/web/webclient/version_info')
-            print(f"Conectado a Odoo versión: {version.get('server_version')}")
+    def _autenticar(self):
+        """Autentica y deja la cookie de sesión para todos los hilos."""
+        # Sin la cookie anterior: la nueva sesión es la única que queda en el hilo
+        self.session.cookies.clear()
+        auth_response = self._jsonrpc('/web/session/authenticate', {
+            'db': self.db,
+            'login': self.username,
+            'password': self.password,
+        }, reautenticar=False)
 
-            # Autenticación
-            auth_response = self._jsonrpc('/web/session/authenticate', {
-                'db': self.db,
-                'login': self.username,
-                'password': self.password,
-            })
+        if not auth_response.get('uid'):
+            raise Exception("Autenticación fallida. Verifica las credenciales.")
 
-            if not auth_response.get('uid'):
-                raise Exception("Autenticación fallida. Verifica las credenciales.")
+        self.uid = auth_response['uid']
+        self._local.session_id = self.session_id = requests.utils.dict_from_cookiejar(
+            self.session.cookies
+        ).get('session_id')
 
-            self.uid = auth_response['uid']
-            self.session_id = requests.utils.dict_from_cookiejar(self.session.cookies).get('session_id')
-
-        except Exception as e:
-            print(f"Error durante la inicialización: {str(e)}")
-            raise
+    def _reautenticar(self, session_id_vencida):
+        """Vuelve a autenticar, salvo que otro hilo ya lo haya hecho desde que venció `session_id_vencida`."""
+        with self._lock_autenticacion:
+            if self.session_id == session_id_vencida:
+                print("Sesión de Odoo vencida, autenticando de nuevo...")
+                self._autenticar()
 
     def fields_get(self, model, attributes=None):
         """Obtiene metadatos de campos del modelo (útil para compatibilidad entre versiones)."""
@@ -101,8 +164,21 @@ class OdooClient:
             print(f"Error en fields_get para modelo {model}: {str(e)}")
             raise
 
-    def _jsonrpc(self, endpoint, params=None):
-        """Ejecuta una llamada JSON-RPC a Odoo con reintentos"""
+    def _jsonrpc(self, endpoint, params=None, reautenticar=True):
+        """Ejecuta una llamada JSON-RPC a Odoo con reintentos.
+
+        Si la sesión de Odoo venció, autentica de nuevo una vez y repite la llamada.
+        """
+        session_id = self.session_id
+        try:
+            return self._llamar(endpoint, params)
+        except SesionExpirada:
+            if not reautenticar:
+                raise
+            self._reautenticar(session_id)
+            return self._llamar(endpoint, params)
+
+    def _llamar(self, endpoint, params=None):
         headers = {
             'Content-Type': 'application/json',
         }
@@ -134,6 +210,9 @@ class OdooClient:
                     error_message = error_data.get('message', 'Unknown error')
                     error_data = error_data.get('data', {})
                     debug = error_data.get('debug', '')
+
+                    if result['error'].get('code') == 100 or 'SessionExpired' in str(error_data.get('name', '')):
+                        raise SesionExpirada(error_message)
                     
                     raise Exception(
                         f"Error en la llamada RPC: {error_message}\n"
@@ -151,25 +230,56 @@ class OdooClient:
                 print(f"Intento {attempt + 1} falló, reintentando en {retry_delay} segundos...")
                 time.sleep(retry_delay)
                 retry_delay *= 2  # Backoff exponencial
+            except SesionExpirada:
+                raise
             except Exception as e:
                 print(f"Error inesperado en la solicitud HTTP: {str(e)}")
                 raise
 
-    def search_read(self, model, domain=None, fields=None, batch_size=1000):
-        """Ejecuta search_read con manejo de errores mejorado"""
+    def search_read(self, model, domain=None, fields=None, batch_size=1000, offset=0, limit=None, order=None,
+                    m2o_ids=False, nombres_m2o=None):
+        """Ejecuta search_read con manejo de errores mejorado.
+
+        Con `m2o_ids=True` Odoo devuelve los many2one solo como id (no calcula display_name ni
+        repite los nombres en cada registro). Los nombres de los campos en `nombres_m2o` (por
+        defecto, todos los many2one leídos) se resuelven después con reference_data.nombres: una
+        lectura por modelo relacionado, solo de los ids distintos que no están en memoria. Los
+        demás many2one quedan como [id, '']; la forma [id, nombre] no cambia. Si los nombres no
+        se pueden leer (sin acceso al modelo relacionado, registros borrados), la consulta se
+        repite con los nombres que arma Odoo; tras un error de acceso, ese modelo se lee siempre así.
+        """
         if domain is None:
             domain = []
         if fields is None:
             fields = []
 
+        if m2o_ids and self._m2o_ids_soportado and model not in self._m2o_con_nombres:
+            try:
+                records = self._search_read_m2o_ids(model, domain, fields, offset, limit, order, nombres_m2o)
+                if records is not None:
+                    return records
+            except Exception as e:
+                # Odoo 13 y anteriores: search_read no acepta `load`; se piden los nombres a Odoo
+                if "'load'" not in str(e):
+                    raise
+                print("search_read sin soporte de load=None; los many2one se leen con nombre")
+                self._m2o_ids_soportado = False
+
+        params = {
+            'model': model,
+            'domain': domain,
+            'fields': fields,
+            'context': {'lang': 'es_ES'}
+        }
+        if offset:
+            params['offset'] = offset
+        if limit:
+            params['limit'] = limit
+        if order:
+            params['sort'] = order
+
         try:
-            # Realizar una sola consulta sin paginación
-            result = self._jsonrpc('/web/dataset/search_read', {
-                'model': model,
-                'domain': domain,
-                'fields': fields,
-                'context': {'lang': 'es_ES'}
-            })
+            result = self._jsonrpc('/web/dataset/search_read', params)
             
             return result.get('records', [])
             
@@ -177,6 +287,126 @@ class OdooClient:
             print(f"Error en search_read para modelo {model}: {str(e)}")
             raise
 
+    def _campos_many2one(self, model):
+        """{campo: modelo relacionado} de los many2one de `model` (fields_get una vez por modelo)."""
+        if model not in self._many2one:
+            meta = self.fields_get(model, ['type', 'relation'])
+            self._many2one[model] = {
+                campo: info['relation'] for campo, info in meta.items() if info.get('type') == 'many2one'
+            }
+        return self._many2one[model]
+
+    def _search_read_m2o_ids(self, model, domain, fields, offset, limit, order, nombres_m2o):
+        """search_read con load=None (many2one como id) y nombres resueltos localmente.
+
+        Devuelve None si los nombres de algún many2one no se pudieron leer.
+        """
+        records = self._jsonrpc('/web/dataset/call_kw', {
+            'model': model,
+            'method': 'search_read',
+            'args': [],
+            'kwargs': {
+                'domain': domain,
+                'fields': fields,
+                'offset': offset,
+                'limit': limit,
+                'order': order,
+                'load': None,
+            },
+            'context': {'lang': 'es_ES'}
+        })
+        if not records:
+            return []
+
+        many2one = self._campos_many2one(model)
+        leidos = [campo for campo in records[0] if campo in many2one]
+        por_resolver = set(leidos if nombres_m2o is None else nombres_m2o)
+        for campo in leidos:
+            mapa = {}
+            if campo in por_resolver:
+                try:
+                    mapa = nombres(self, many2one[campo], {r[campo] for r in records if r[campo]})
+                except Exception as e:
+                    print(f"No se pudieron leer los nombres de {many2one[campo]} ({str(e)}); "
+                          f"se lee {model} con los nombres de Odoo")
+                    if 'AccessError' in str(e):
+                        self._m2o_con_nombres.add(model)
+                    return None
+            for record in records:
+                valor = record[campo]
+                if valor and not isinstance(valor, (list, tuple)):
+                    record[campo] = [valor, mapa.get(valor, '')]
+        return records
+
+    def search(self, model, domain=None, limit=None, order=None):
+        """Ids de los registros de `model` que cumplen `domain` (sin leer campos)."""
+        try:
+            kwargs = {}
+            if limit:
+                kwargs['limit'] = limit
+            if order:
+                kwargs['order'] = order
+            return self._jsonrpc('/web/dataset/call_kw', {
+                'model': model,
+                'method': 'search',
+                'args': [domain or []],
+                'kwargs': kwargs,
+                'context': {'lang': 'es_ES'}
+            })
+        except Exception as e:
+            print(f"Error en search para modelo {model}: {str(e)}")
+            raise
+
+    def search_read_paginado(self, model, domain=None, fields=None, page_size=1000, order='id',
+                             m2o_ids=False, nombres_m2o=None):
+        """search_read en páginas de `page_size` registros (orden estable por `order`).
+
+        Evita respuestas gigantes en modelos grandes; devuelve todos los registros juntos.
+        """
+        records = []
+        offset = 0
+        while True:
+            pagina = self.search_read(
+                model, domain=domain, fields=fields, offset=offset, limit=page_size, order=order,
+                m2o_ids=m2o_ids, nombres_m2o=nombres_m2o
+            )
+            records.extend(pagina)
+            if len(pagina) < page_size:
+                return records
+            offset += page_size
+
+    def read_group(self, model, domain, fields, groupby, lazy=False, orderby=None):
+        """Agrupa y agrega en el servidor (ej. fields=['product_uom_qty:sum'], groupby=['product_id'])."""
+        kwargs = {'lazy': lazy}
+        if orderby:
+            kwargs['orderby'] = orderby
+
+        try:
+            return self._jsonrpc('/web/dataset/call_kw', {
+                'model': model,
+                'method': 'read_group',
+                'args': [domain, fields, groupby],
+                'kwargs': kwargs,
+                'context': {'lang': 'es_ES'}
+            })
+        except Exception as e:
+            print(f"Error en read_group para modelo {model}: {str(e)}")
+            raise
+
+    def read(self, model, ids, fields=None):
+        """Lee registros por id (incluye archivados, a diferencia de search_read)."""
+        try:
+            return self._jsonrpc('/web/dataset/call_kw', {
+                'model': model,
+                'method': 'read',
+                'args': [ids, fields or []],
+                'kwargs': {},
+                'context': {'lang': 'es_ES'}
+            })
+        except Exception as e:
+            print(f"Error en read para modelo {model}: {str(e)}")
+            raise
+
     def create(self, model, values):
         """Crea un nuevo registro con manejo de errores"""
         try:
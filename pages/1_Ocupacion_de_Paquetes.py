@@ -7,7 +7,6 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-import io
 import sys
 import os
 from datetime import datetime, timedelta
@@ -28,313 +27,254 @@ if st.sidebar.button("Logout"):
 # Agregar la ruta del proyecto al path de Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from odoo_client import OdooClient
+from connection import get_odoo_client
+from catalog_store import ESTADOS_ACTIVOS, VENTANA_SALIDA_DIAS, cargar_catalogo, cargar_opciones
+from reference_data import ESTADO_PAQUETE, mapear_estados
+from staleness import antiguedad_maxima, mostrar_antiguedad
+from exports import export_dataframe_to_excel
+from tables import calcular_ocupacion, color_ocupacion, color_tiempo_restante, mostrar_tabla
 from dotenv import load_dotenv
 from babel.dates import format_date
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Mapeo de estados de paquete
-ESTADO_PAQUETE = {
-    0: 'Bloqueado',
-    1: 'Inactivo',
-    2: 'Pendiente',
-    3: 'Activo',
-    4: 'Validación',
-    5: 'Cerrado',
-    6: 'Rendido',
-    7: 'Liquidado',
-    8: 'Pre-confirmado',
-    9: 'Anulado',
-    10: 'Social'
-}
+# Estados seleccionados por defecto (los mismos que se precargan, ver catalog_store.py)
+ESTADOS_POR_DEFECTO = [ESTADO_PAQUETE[codigo] for codigo in ESTADOS_ACTIVOS]
+
+# Segundos que se muestra un catálogo vencido mientras se refresca (ver staleness.py)
+ANTIGUEDAD_MAXIMA = antiguedad_maxima('ocupacion', 3600)
 
 # Funciones de utilidad
-def format_currency(value, decimals=0):
-    """Formatea un número como moneda con separadores de miles"""
-    try:
-        return f"${int(float(value)):,}".replace(',', '.')
-    except (ValueError, TypeError):
-        return value
-
-def export_dataframe_to_excel(df, filename):
-    """Exporta un DataFrame a Excel y devuelve un botón de descarga"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
-    
-    excel_data = output.getvalue()
-    return st.download_button(
-        label=f"📥 Exportar a Excel",
-        data=excel_data,
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+def formatear_tiempo_restante(dias):
+    """Texto de tiempo restante a partir de la columna numérica de días a la salida."""
+    dias = dias.astype(float)
+    texto = dias.abs().map('{:.0f} días'.format)
+    texto = texto.mask(dias < 0, 'Ya salió (' + texto + ')')
+    texto = texto.mask(dias == 0, 'Hoy').mask(dias == 1, '1 día')
+    return texto.mask(dias.isna(), 'Sin fecha')
+
+def agregar_columnas_derivadas(df_templates):
+    """Agrega al catálogo las columnas de estado, ocupación y tiempo a la salida."""
+    # Columnas derivadas, calculadas en bloque sobre el catálogo
+    fecha_actual = pd.Timestamp(datetime.now().date())
+    fechas_salida = df_templates['x_studio_ida_fecha_salida']
+    df_templates['Estado de Paquete Codigo'] = df_templates['x_studio_estado_viaje']
+    df_templates['Estado de Paquete'] = mapear_estados(df_templates['Estado de Paquete Codigo'])
+    df_templates['Plazas Pagadas'] = df_templates['x_product_count_pagados_stat_inf']
+    df_templates['Ocupación'] = calcular_ocupacion(df_templates['Plazas Pagadas'], df_templates['x_studio_boletos_totales'])
+    df_templates['Dias Restantes'] = (fechas_salida - fecha_actual).dt.days.astype('Int64')
+    df_templates['Tiempo Restante'] = formatear_tiempo_restante(df_templates['Dias Restantes'])
+    df_templates['mes_salida'] = fechas_salida.dt.to_period('M')
+    df_templates['mes_anio'] = fechas_salida.dt.strftime('%B %Y').fillna('')
+    return df_templates
+
+@st.fragment
+def seccion_resumen_destino(resumen_destino, version):
+    """Resumen por destino con su exportación; exportar solo rerenderiza esta sección."""
+    # Mostrar resumen por destino
+    st.subheader("Resumen por Destino")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.subheader("Resumen de Paquetes por Destino")
+    with col2:
+        # Botón de exportación justo debajo del título, en la esquina superior derecha
+        if not resumen_destino.empty:
+            export_dataframe_to_excel(
+                resumen_destino, 
+                f"resumen_destino_paquetes.xlsx",
+                version=version
+            )
+
+    # Mostrar tabla de resumen por destino
+    mostrar_tabla(
+        resumen_destino,
+        formatos={
+            'Precio Promedio': 'moneda',
+            'Cantidad Paquetes': 'entero',
+            'Plazas Totales': 'entero',
+            'Plazas Pagadas': 'entero',
+            'Plazas Reservadas': 'entero',
+            'Plazas Disponibles': 'entero',
+            'Ocupación': 'porcentaje'
+        },
+        colores={'Ocupación': color_ocupacion(resumen_destino['Ocupación'], verde_desde=81)}
     )
 
-# Funciones para colorear celdas
-def color_ocupacion(val):
-    """Colorea las celdas de ocupación según el valor"""
-    try:
-        val = float(val.strip('%'))
-        if val > 80:
-            return 'background-color: #8eff8e'  # Verde claro
-        elif val >= 50:
-            return 'background-color: #ffeb82'  # Amarillo claro
-        else:
-            return 'background-color: #ff8e8e'  # Rojo claro
-    except:
-        return ''
-
-def color_tiempo_restante(val):
-    """Colorea las celdas de tiempo restante según el valor"""
-    try:
-        if 'Ya salió' in val:
-            return 'background-color: #f0f0f0'  # Gris claro
-        elif 'días' in val:
-            dias = int(val.split()[0])
-            if dias <= 7:  # Una semana o menos - Rojo
-                return 'background-color: #ff8e8e'  # Rojo claro
-            elif dias <= 30:  # Un mes o menos - Amarillo
-                return 'background-color: #ffeb82'  # Amarillo claro
-            else:  # Más de un mes - Verde
-                return 'background-color: #8eff8e'  # Verde claro
-    except:
-        return ''
-
-# Función para calcular el tiempo restante para la salida
-def calcular_tiempo_restante(fecha_salida_str, fecha_actual):
-    """Calcula el tiempo restante para la salida del paquete"""
-    try:
-        if not fecha_salida_str:
-            return "Sin fecha"
-            
-        # Convertir la fecha de salida a objeto datetime
-        fecha_salida = datetime.strptime(fecha_salida_str, '%Y-%m-%d').date()
-        
-        # Calcular la diferencia en días
-        dias_restantes = (fecha_salida - fecha_actual).days
-        
-        if dias_restantes < 0:
-            return f"Ya salió ({abs(dias_restantes)} días)"
-        elif dias_restantes == 0:
-            return "Hoy"
-        elif dias_restantes == 1:
-            return "1 día"
-        else:
-            return f"{dias_restantes} días"
-    except Exception as e:
-        return "Fecha inválida"
+@st.fragment
+def seccion_detalle_paquetes(df_templates_filtrado, version):
+    """Listado de paquetes con su exportación; exportar solo rerenderiza esta sección."""
+    # Tabla detallada de paquetes
+    st.subheader("Detalle de Paquetes")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.subheader("Listado de Paquetes")
+    with col2:
+        # Botón de exportación justo debajo del título, en la esquina superior derecha
+        if not df_templates_filtrado.empty:
+            export_dataframe_to_excel(
+                df_templates_filtrado.drop(columns=['mes_salida']), 
+                f"detalle_paquetes.xlsx",
+                version=version
+            )
+
+    # Seleccionar y formatear columnas para la tabla
+    df_detalle = df_templates_filtrado[[
+        'default_code', 'name', 'x_studio_destino', 'x_studio_lote', 'Estado de Paquete',
+        'x_studio_ida_fecha_salida', 'Tiempo Restante', 'x_studio_boletos_totales',
+        'Plazas Pagadas', 'x_studio_boletos_reservados', 'x_studio_boletos_disponibles', 
+        'Ocupación', 'list_price', 'x_studio_comision_agencia'
+    ]].copy()
+
+    # Renombrar columnas para mejor visualización
+    df_detalle.columns = [
+        'Código', 'Nombre Paquete', 'Destino', 'Lote', 'Estado',
+        'Fecha Salida', 'Tiempo Restante', 'Plazas Totales',
+        'Plazas Pagadas', 'Plazas Reservadas', 'Plazas Disponibles', 'Ocupación',
+        'Precio', 'Comisión Agencia'
+    ]
+
+    # Fecha de salida como texto para la tabla
+    df_detalle['Fecha Salida'] = df_detalle['Fecha Salida'].dt.strftime('%Y-%m-%d').fillna('')
+
+    # Destacar la columna de estado
+    st.markdown("""
+    <style>
+    [data-testid="stDataFrame"] table tbody tr td:nth-child(5) {
+        font-weight: bold;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+    # Mostrar tabla detallada
+    mostrar_tabla(
+        df_detalle,
+        formatos={
+            'Precio': 'moneda',
+            'Comisión Agencia': 'moneda',
+            'Plazas Totales': 'entero',
+            'Plazas Pagadas': 'entero',
+            'Plazas Reservadas': 'entero',
+            'Plazas Disponibles': 'entero',
+            'Ocupación': 'porcentaje'
+        },
+        colores={
+            'Ocupación': color_ocupacion(df_detalle['Ocupación'], verde_desde=81),
+            'Tiempo Restante': color_tiempo_restante(df_templates_filtrado['Dias Restantes'])
+        }
+    )
 
 # Título de la página
 st.title("Ocupación de Paquetes")
 
 try:
-    # Crear cliente Odoo
-    client = OdooClient()
-    
-    # Obtener todos los paquetes (product.template)
-    templates = client.search_read(
-        'product.template',
-        domain=[],
-        fields=[
-            'id', 'name', 'default_code', 'x_studio_lote', 'x_studio_destino',
-            'x_studio_transporte', 'x_studio_ida_fecha_salida', 'x_studio_boletos_totales',
-            'x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf',
-            'x_studio_boletos_disponibles', 'x_studio_tipo_de_cupo', 'x_studio_estado_viaje',
-            'list_price', 'x_studio_comision_agencia'
-        ]
-    )
-    
-    # Convertir a DataFrame
-    df_templates = pd.DataFrame(templates)
-    
-    # Mapear los estados a nombres descriptivos
-    def mapear_estado(estado):
-        if pd.isna(estado):
-            return 'No definido'
-        try:
-            # Si es un número entero, usamos el diccionario de mapeo
-            if isinstance(estado, (int, float)):
-                return ESTADO_PAQUETE.get(int(estado), f'Estado {int(estado)}')
-            # Si es una cadena que comienza con 'Estado ', extraemos el número
-            elif isinstance(estado, str) and estado.startswith('Estado '):
-                try:
-                    num_estado = int(estado.replace('Estado ', ''))
-                    return ESTADO_PAQUETE.get(num_estado, estado)
-                except ValueError:
-                    return estado
-            else:
-                return estado
-        except:
-            return f'Estado {estado}' if pd.notna(estado) else 'No definido'
-    
-    # Guardar el código original del estado y aplicar el mapeo
-    df_templates['Estado de Paquete Codigo'] = df_templates['x_studio_estado_viaje']
-    df_templates['Estado de Paquete'] = df_templates['Estado de Paquete Codigo'].apply(mapear_estado)
-    
+    client = get_odoo_client()
+
     # Crear contenedor para filtros al inicio de la página
     st.subheader("Filtros")
     filtros_container = st.container()
-    
+
     with filtros_container:
         col1, col2 = st.columns(2)
-        
+
         with col1:
-            # Filtro de estado de paquete
-            # Obtener los valores únicos de Estado de Paquete Codigo
-            codigos_unicos = []
-            for codigo in df_templates['Estado de Paquete Codigo'].dropna().unique():
-                if codigo is not None:
-                    try:
-                        # Intentar convertir a entero
-                        codigo_int = int(codigo)
-                        codigos_unicos.append(codigo_int)
-                    except (ValueError, TypeError):
-                        # Si no se puede convertir, usar el valor original
-                        codigos_unicos.append(codigo)
-            
-            # Crear un diccionario para mapear códigos a nombres
-            nombres_estados = {codigo: ESTADO_PAQUETE.get(codigo, f'Estado {codigo}') for codigo in codigos_unicos}
-            
-            # Mostrar los nombres de los estados en el filtro
-            opciones_estados = sorted(nombres_estados.values())
-            
-            # Estados por defecto (Activo, Validación)
-            default_estados = []
-            if 'Activo' in opciones_estados:
-                default_estados.append('Activo')
-            if 'Validación' in opciones_estados:
-                default_estados.append('Validación')
-            
-            # Multiselect para filtrar por estado
-            estados_seleccionados_nombres = st.multiselect(
+            # Filtro de estado de paquete (se aplica en Odoo)
+            opciones_estados = sorted(ESTADO_PAQUETE.values())
+
+            # Multiselect para filtrar por estado (por defecto Activo y Validación)
+            estados_seleccionados = st.multiselect(
                 "Estado de Paquete",
                 options=opciones_estados,
-                default=default_estados
+                default=ESTADOS_POR_DEFECTO
             )
-            
-            # Guardar los nombres seleccionados directamente
-            # Ya no necesitamos convertir a códigos porque filtraremos por nombre
-            estados_seleccionados = estados_seleccionados_nombres
-            
+            codigos_por_nombre = {nombre: codigo for codigo, nombre in ESTADO_PAQUETE.items()}
+            estados_codigos = [codigos_por_nombre[nombre] for nombre in estados_seleccionados]
+
+            # Ventana de fechas de salida (se aplica en Odoo; los paquetes sin fecha se incluyen)
+            col_desde, col_hasta = st.columns(2)
+            with col_desde:
+                fecha_desde = st.date_input(
+                    "Salidas desde",
+                    value=datetime.now().date() - timedelta(days=VENTANA_SALIDA_DIAS)
+                )
+            with col_hasta:
+                fecha_hasta = st.date_input("Salidas hasta", value=None)
+
+        # Opciones de los filtros restantes, dentro del estado y la ventana seleccionados
+        df_opciones = cargar_opciones(
+            client, estados_codigos, fecha_desde, fecha_hasta, antiguedad_maxima=ANTIGUEDAD_MAXIMA
+        )
+
+        with col1:
             # Filtro de tipo de cupo
-            tipos_cupo_unicos = sorted(df_templates['x_studio_tipo_de_cupo'].dropna().astype(str).unique())
+            tipos_cupo_unicos = sorted(df_opciones.loc[df_opciones['x_studio_tipo_de_cupo'] != '', 'x_studio_tipo_de_cupo'].unique())
             tipos_cupo_seleccionados = st.multiselect(
                 "Tipo de Cupo",
                 options=tipos_cupo_unicos,
                 default=[]
             )
-        
+
         with col2:
-            # Filtro de lote
-            lotes_unicos = sorted(df_templates['x_studio_lote'].dropna().unique())
+            # Filtro de lote (se aplica en Odoo)
+            lotes_unicos = sorted(df_opciones.loc[df_opciones['x_studio_lote'] != '', 'x_studio_lote'].unique())
             lote_seleccionado = st.selectbox(
                 "Lote",
                 options=["Todos"] + list(lotes_unicos),
                 index=0
             )
-            
-            # Filtro de destino
-            destinos_unicos = sorted(df_templates['x_studio_destino'].dropna().unique())
+
+            # Filtro de destino (se aplica en Odoo)
+            destinos_unicos = sorted(df_opciones.loc[df_opciones['x_studio_destino'] != '', 'x_studio_destino'].unique())
             destinos_seleccionados = st.multiselect(
                 "Destinos",
                 options=destinos_unicos,
                 default=[]
             )
-            
-            # Filtro de mes-año de salida
-            # Convertir las fechas de salida a objetos datetime
-            fechas_salida = pd.to_datetime(df_templates['x_studio_ida_fecha_salida'], errors='coerce')
-            
-            # Extraer mes-año de las fechas válidas
-            meses_anio = []
-            for fecha in fechas_salida.dropna():
-                mes_anio = fecha.strftime('%B %Y')  # Formato: 'Mayo 2025'
-                if mes_anio not in meses_anio:
-                    meses_anio.append(mes_anio)
-            
-            # Ordenar los meses-año cronológicamente
-            # Primero convertimos a objetos datetime para ordenar
-            meses_anio_ordenados = sorted(meses_anio, 
-                                         key=lambda x: pd.to_datetime(x, format='%B %Y', errors='coerce'))
-            
+
+            # Filtro de mes-año de salida, ordenado cronológicamente por el período
+            fechas_opciones = df_opciones['x_studio_ida_fecha_salida'].dropna()
+            meses = pd.DataFrame({
+                'mes_salida': fechas_opciones.dt.to_period('M'),
+                'mes_anio': fechas_opciones.dt.strftime('%B %Y')
+            }).drop_duplicates('mes_salida')
+            meses_anio_ordenados = meses.sort_values('mes_salida')['mes_anio'].tolist()
+
             # Crear el filtro multiselect
             meses_anio_seleccionados = st.multiselect(
                 "Mes-Año de Salida",
                 options=meses_anio_ordenados,
                 default=[]
             )
-    
-    # Aplicar filtros
-    df_templates_filtrado = df_templates.copy()
-    
-    # Filtrar por estado usando los nombres de los estados
-    if estados_seleccionados:
-        # Función para mapear códigos numéricos a nombres descriptivos
-        def mapear_codigo_a_nombre(codigo):
-            try:
-                if pd.isna(codigo):
-                    return 'No definido'
-                # Si es un string que representa un número, convertirlo a entero
-                if isinstance(codigo, str) and codigo.isdigit():
-                    codigo_int = int(codigo)
-                    return ESTADO_PAQUETE.get(codigo_int, f'Estado {codigo}')
-                # Si ya es un número, usarlo directamente
-                elif isinstance(codigo, (int, float)):
-                    return ESTADO_PAQUETE.get(int(codigo), f'Estado {codigo}')
-                else:
-                    return f'Estado {codigo}'
-            except:
-                return f'Estado {codigo}'
-                
-        # Aplicar la función de mapeo
-        df_templates_filtrado['Estado de Paquete'] = df_templates_filtrado['Estado de Paquete Codigo'].apply(mapear_codigo_a_nombre)
-        
-        # Filtrar por los nombres seleccionados
-        df_templates_filtrado = df_templates_filtrado[df_templates_filtrado['Estado de Paquete'].isin(estados_seleccionados)]
-    
+
+    # Catálogo filtrado en Odoo por estado, ventana de salida, lote y destino
+    with st.spinner("Cargando paquetes..."):
+        df_templates = cargar_catalogo(
+            client,
+            estados=estados_codigos,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            destinos=destinos_seleccionados,
+            lotes=[lote_seleccionado] if lote_seleccionado != "Todos" else None,
+            antiguedad_maxima=ANTIGUEDAD_MAXIMA
+        )
+    mostrar_antiguedad('catalogo', df_templates.attrs.get('cargado'))
+    df_templates_filtrado = agregar_columnas_derivadas(df_templates)
+
     # Filtrar por tipo de cupo
     if tipos_cupo_seleccionados:
         df_templates_filtrado = df_templates_filtrado[df_templates_filtrado['x_studio_tipo_de_cupo'].isin(tipos_cupo_seleccionados)]
-    
-    # Filtrar por lote
-    if lote_seleccionado != "Todos":
-        df_templates_filtrado = df_templates_filtrado[df_templates_filtrado['x_studio_lote'] == lote_seleccionado]
-    
-    # Filtrar por destino
-    if destinos_seleccionados:
-        df_templates_filtrado = df_templates_filtrado[df_templates_filtrado['x_studio_destino'].isin(destinos_seleccionados)]
-    
+
     # Filtrar por mes-año de salida
     if meses_anio_seleccionados:
-        # Convertir las fechas de salida a objetos datetime
-        df_templates_filtrado = df_templates_filtrado.copy()  # Crear una copia para evitar warnings
-        df_templates_filtrado['fecha_temp'] = pd.to_datetime(df_templates_filtrado['x_studio_ida_fecha_salida'], errors='coerce')
-        
-        # Crear una columna de mes-año para facilitar el filtrado
-        def obtener_mes_anio(fecha):
-            if pd.isna(fecha):
-                return ''
-            return fecha.strftime('%B %Y')
-        
-        # Aplicar la función para crear la columna de mes-año
-        df_templates_filtrado['mes_anio'] = df_templates_filtrado['fecha_temp'].apply(obtener_mes_anio)
-        
-        # Filtrar las filas donde el mes-año está en los seleccionados
         df_templates_filtrado = df_templates_filtrado[df_templates_filtrado['mes_anio'].isin(meses_anio_seleccionados)]
-        
-        # Eliminar las columnas temporales
-        df_templates_filtrado = df_templates_filtrado.drop(['fecha_temp', 'mes_anio'], axis=1)
-    
+
+    # Versión de los datos para las exportaciones: carga del catálogo, día (tiempo restante) y filtros
+    version_datos = (
+        df_templates.attrs.get('cargado'), datetime.now().date(), estados_codigos, fecha_desde, fecha_hasta,
+        destinos_seleccionados, lote_seleccionado, tipos_cupo_seleccionados, meses_anio_seleccionados
+    )
+
     if not df_templates_filtrado.empty:
-        # Asegurarse de que la columna de plazas pagadas esté presente
-        if 'x_product_count_pagados_stat_inf' not in df_templates_filtrado.columns:
-            df_templates_filtrado['x_product_count_pagados_stat_inf'] = 0
-        
-        # Renombrar para claridad
-        df_templates_filtrado['Plazas Pagadas'] = df_templates_filtrado['x_product_count_pagados_stat_inf']
-        
         # Calcular indicadores generales
         total_plazas = df_templates_filtrado['x_studio_boletos_totales'].sum()
         plazas_pagadas = df_templates_filtrado['Plazas Pagadas'].sum()
@@ -369,24 +309,6 @@ try:
         # Agregar espacio
         st.markdown("---")
         
-        # Calcular ocupación basada en plazas pagadas y totales
-        df_templates_filtrado['Ocupación'] = df_templates_filtrado.apply(
-            lambda row: f"{int(row['Plazas Pagadas'] / row['x_studio_boletos_totales'] * 100)}%" 
-            if pd.notna(row['x_studio_boletos_totales']) and row['x_studio_boletos_totales'] > 0 
-            else "0%",
-            axis=1
-        )
-        
-        # Calcular tiempo restante para la salida
-        fecha_actual = datetime.now().date()
-        df_templates_filtrado['Tiempo Restante'] = df_templates_filtrado.apply(
-            lambda row: calcular_tiempo_restante(row['x_studio_ida_fecha_salida'], fecha_actual), 
-            axis=1
-        )
-        
-        # Asegurarse de que la columna Estado de Paquete tenga los nombres descriptivos
-        df_templates_filtrado['Estado de Paquete'] = df_templates_filtrado['Estado de Paquete Codigo'].apply(mapear_estado)
-        
         # Crear resumen por destino
         resumen_destino = df_templates_filtrado.groupby('x_studio_destino').agg({
             'id': 'count',
@@ -403,35 +325,23 @@ try:
         ]
         
         # Calcular ocupación por destino basada en plazas pagadas
-        resumen_destino['Ocupación'] = resumen_destino.apply(
-            lambda row: f"{int(row['Plazas Pagadas'] / row['Plazas Totales'] * 100)}%" 
-            if row['Plazas Totales'] > 0 else "0%",
-            axis=1
-        )
+        resumen_destino['Ocupación'] = calcular_ocupacion(resumen_destino['Plazas Pagadas'], resumen_destino['Plazas Totales'])
         
         # Gráfico de ocupación por destino
         st.subheader("Ocupación por Destino")
         
         # Preparar datos para el gráfico
         grafico_data = resumen_destino.copy()
-        grafico_data['Porcentaje Ocupación'] = grafico_data['Ocupación'].apply(
-            lambda x: float(x.strip('%')) if isinstance(x, str) else 0
-        )
-        
-        # Crear un nuevo DataFrame con colores personalizados para cada barra
+        grafico_data['Porcentaje Ocupación'] = grafico_data['Ocupación'].astype(float)
         grafico_data = grafico_data.sort_values('Porcentaje Ocupación', ascending=True)
         
-        # Definir colores basados en el porcentaje de ocupación
-        def get_color(porcentaje):
-            if porcentaje < 50:
-                return 'rgba(255, 0, 0, 0.7)'  # Rojo para menos del 50%
-            elif porcentaje < 80:
-                return 'rgba(255, 255, 0, 0.7)'  # Amarillo para 50-80%
-            else:
-                return 'rgba(0, 128, 0, 0.7)'  # Verde para más del 80%
-        
-        # Aplicar colores personalizados
-        colores = grafico_data['Porcentaje Ocupación'].apply(get_color)
+        # Colores basados en el porcentaje de ocupación: rojo < 50%, amarillo 50-80%, verde > 80%
+        porcentajes = grafico_data['Porcentaje Ocupación']
+        colores = pd.Series(np.select(
+            [porcentajes < 50, porcentajes < 80],
+            ['rgba(255, 0, 0, 0.7)', 'rgba(255, 255, 0, 0.7)'],
+            default='rgba(0, 128, 0, 0.7)'
+        ))
         
         # Crear gráfico de barras horizontal con colores personalizados
         fig = px.bar(
@@ -440,7 +350,7 @@ try:
             x='Porcentaje Ocupación',
             title='Porcentaje de Ocupación por Destino',
             labels={'Porcentaje Ocupación': 'Ocupación (%)', 'Destino': 'Destino'},
-            text=grafico_data['Porcentaje Ocupación'].apply(lambda x: f'{x:.1f}%')  # Mostrar porcentaje en cada barra
+            text=grafico_data['Porcentaje Ocupación'].map('{:.1f}%'.format)  # Mostrar porcentaje en cada barra
         )
         
         # Actualizar colores de las barras manualmente
@@ -464,125 +374,9 @@ try:
         
         st.plotly_chart(fig, use_container_width=True)
         
-        # Mostrar resumen por destino
-        st.subheader("Resumen por Destino")
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.subheader("Resumen de Paquetes por Destino")
-        with col2:
-            # Botón de exportación justo debajo del título, en la esquina superior derecha
-            if not resumen_destino.empty:
-                export_dataframe_to_excel(
-                    resumen_destino, 
-                    f"resumen_destino_paquetes.xlsx"
-                )
-        
-        # Mostrar tabla de resumen por destino
-        st.dataframe(
-            resumen_destino.style.format({
-                'Precio Promedio': lambda x: format_currency(x),
-                'Cantidad Paquetes': lambda x: f"{int(x):,}".replace(',', '.'),
-                'Plazas Totales': lambda x: f"{int(x):,}".replace(',', '.'),
-                'Plazas Reservadas': lambda x: f"{int(x):,}".replace(',', '.'),
-                'Plazas Disponibles': lambda x: f"{int(x):,}".replace(',', '.')
-            })
-            .applymap(color_ocupacion, subset=['Ocupación']),
-            hide_index=True,
-            use_container_width=True
-        )
-        
-        # Tabla detallada de paquetes
-        st.subheader("Detalle de Paquetes")
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.subheader("Listado de Paquetes")
-        with col2:
-            # Botón de exportación justo debajo del título, en la esquina superior derecha
-            if not df_templates_filtrado.empty:
-                export_dataframe_to_excel(
-                    df_templates_filtrado, 
-                    f"detalle_paquetes.xlsx"
-                )
-        
-        # Asegurarse de que la columna Estado de Paquete tenga los nombres descriptivos
-        # Esto es necesario porque puede que no se haya aplicado correctamente el mapeo
-        df_templates_filtrado['Estado de Paquete'] = df_templates_filtrado['Estado de Paquete Codigo'].apply(mapear_estado)
-        
-        # Seleccionar y formatear columnas para la tabla
-        df_detalle = df_templates_filtrado[[
-            'default_code', 'name', 'x_studio_destino', 'x_studio_lote', 'Estado de Paquete',
-            'x_studio_ida_fecha_salida', 'Tiempo Restante', 'x_studio_boletos_totales',
-            'Plazas Pagadas', 'x_studio_boletos_reservados', 'x_studio_boletos_disponibles', 
-            'Ocupación', 'list_price', 'x_studio_comision_agencia'
-        ]].copy()
-        
-        # Renombrar columnas para mejor visualización
-        df_detalle.columns = [
-            'Código', 'Nombre Paquete', 'Destino', 'Lote', 'Estado',
-            'Fecha Salida', 'Tiempo Restante', 'Plazas Totales',
-            'Plazas Pagadas', 'Plazas Reservadas', 'Plazas Disponibles', 'Ocupación',
-            'Precio', 'Comisión Agencia'
-        ]
-        
-        # Aplicar directamente el mapeo de estados a la columna Estado
-        # Convertir explícitamente los valores a enteros para usar como claves en el diccionario ESTADO_PAQUETE
-        def mapear_estado_directo(valor):
-            try:
-                if pd.isna(valor):
-                    return 'No definido'
-                    
-                # Si es una cadena, intentar convertirla a entero directamente
-                if isinstance(valor, str):
-                    try:
-                        # Intentar convertir la cadena a entero
-                        num_estado = int(valor)
-                        return ESTADO_PAQUETE.get(num_estado, f'Estado {valor}')
-                    except ValueError:
-                        # Si es una cadena que comienza con 'Estado ', extraer el número
-                        if valor.startswith('Estado '):
-                            try:
-                                num_estado = int(valor.replace('Estado ', ''))
-                                return ESTADO_PAQUETE.get(num_estado, valor)
-                            except ValueError:
-                                return valor
-                        return valor
-                # Si es un número, convertirlo a entero
-                elif isinstance(valor, (int, float)):
-                    return ESTADO_PAQUETE.get(int(valor), f'Estado {valor}')
-                else:
-                    return str(valor)
-            except Exception as e:
-                st.error(f"Error al mapear estado: {e}, valor: {valor}, tipo: {type(valor)}")
-                return f'Error: {valor}'
-        
-        # Aplicar la función de mapeo
-        df_detalle['Estado'] = df_detalle['Estado'].apply(mapear_estado_directo)
-        
-        # La columna Estado ya contiene el nombre descriptivo del estado
-        
-        # Destacar la columna de estado
-        st.markdown("""
-        <style>
-        [data-testid="stDataFrame"] table tbody tr td:nth-child(5) {
-            font-weight: bold;
-        }
-        </style>
-        """, unsafe_allow_html=True)
-        
-        # Mostrar tabla detallada
-        st.dataframe(
-            df_detalle.style.format({
-                'Precio': lambda x: format_currency(x),
-                'Comisión Agencia': lambda x: format_currency(x),
-                'Plazas Totales': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                'Plazas Reservadas': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                'Plazas Disponibles': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0"
-            })
-            .applymap(color_ocupacion, subset=['Ocupación'])
-            .applymap(color_tiempo_restante, subset=['Tiempo Restante']),
-            hide_index=True,
-            use_container_width=True
-        )
+        # Resumen y detalle, cada uno con su exportación (fragmentos independientes)
+        seccion_resumen_destino(resumen_destino, version_datos)
+        seccion_detalle_paquetes(df_templates_filtrado, version_datos)
         
         # Agregar leyenda para los semáforos
         col1, col2 = st.columns(2)
@@ -6,7 +6,6 @@ st.set_page_config(page_title="Ventas por Destino", layout="wide")
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import io
 import sys
 import os
 from datetime import datetime, timedelta
@@ -27,7 +26,17 @@ if st.sidebar.button("Logout"):
 # Agregar la ruta del proyecto al path de Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from odoo_client import OdooClient
+from connection import get_odoo_client
+from cache_warmer import meses_recientes, registrar_precarga
+from staleness import antiguedad_maxima, mostrar_antiguedad
+from odoo_client import dominio_relacional
+from period_cache import invalidar_periodos
+from month_store import cargar_rango, cubo_rango, limpiar_particiones
+from sales_cube import agrupar, filtrar, totales
+from reference_data import ESTADO_PAQUETE, INVOICE_STATUS, limpiar_referencias
+from seat_counters import CAMPOS_PLAZAS, completar_plazas_registros, modo_plazas
+from exports import export_dataframe_to_excel
+from tables import calcular_ocupacion, color_ocupacion, color_tiempo_restante, mostrar_tabla
 import os
 from dotenv import load_dotenv
 from babel.dates import format_date
@@ -36,6 +45,13 @@ import plotly.express as px
 # Cargar variables de entorno
 load_dotenv()
 
+# Cubo de ventas (ver sales_cube.py): dimensiones de los filtros y medidas de las tarjetas
+DIMENSIONES_CUBO = ['Destino', 'Agencia', 'Mes', 'Tipo de Cupo', 'Estado de Paquete Codigo', 'Estado', 'Lote']
+MEDIDAS_CUBO = ['Pasajeros', 'Total', 'Comision']
+
+# Segundos que se muestran meses vencidos mientras se refrescan (ver staleness.py)
+ANTIGUEDAD_MAXIMA = antiguedad_maxima('ventas_por_destino', 1800)
+
 # Funciones de utilidad
 def format_currency(value, decimals=0):
     """Formatea un número como moneda con separadores de miles"""
@@ -44,18 +60,115 @@ def format_currency(value, decimals=0):
     except (ValueError, TypeError):
         return value
 
-def export_dataframe_to_excel(df, filename):
-    """Exporta un DataFrame a Excel y devuelve un botón de descarga"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
+# Formato de las columnas numéricas de las tablas de resumen
+FORMATOS_RESUMEN = {
+    'Total': 'moneda',
+    'Comision': 'moneda',
+    'Pasajeros Mes': 'entero',
+    'Órdenes Mes': 'entero',
+    'Plazas Totales': 'entero',
+    'Plazas Reservadas': 'entero',
+    'Plazas Pagadas': 'entero',
+    'Plazas Disponibles': 'entero',
+    'Ocupación': 'porcentaje'
+}
+
+# Colores propios de esta página (semáforos de tables.py)
+ROJO_VENTAS = 'background-color: #ff9e82'
+GRIS_VENTAS = 'background-color: #d3d3d3'
+
+@st.fragment
+def seccion_ventas_por_destino(ventas_por_destino, export_df, selected_month, version):
+    """Tabla de ventas por destino con su exportación (se reejecuta sola al exportar)."""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.subheader("Resumen de Ventas por Destino")
+    with col2:
+        # Botón de exportación justo debajo del título, en la esquina superior derecha
+        if not export_df.empty:
+            export_dataframe_to_excel(
+                export_df, 
+                f"ventas_por_destino_{selected_month}.xlsx",
+                version=version
+            )
+    
+    # Mostrar la tabla con formato y colores
+    mostrar_tabla(
+        ventas_por_destino[[
+            'Destino', 'Total', 'Comision', 'Pasajeros Mes', 'Órdenes Mes',
+            'Plazas Totales', 'Plazas Reservadas', 'Plazas Pagadas', 'Plazas Disponibles', 'Ocupación'
+        ]],
+        formatos=FORMATOS_RESUMEN,
+        colores={'Ocupación': color_ocupacion(ventas_por_destino['Ocupación'], rojo=ROJO_VENTAS)}
+    )
+    
+    # Agregar leyenda para el semáforo de ocupación
+    st.markdown("**Semáforo de Ocupación:** 🔴 < 50% | 🟡 50-80% | 🟢 > 80%")
+
+@st.fragment
+def seccion_ventas_por_paquete(ventas_por_paquete, selected_month, version):
+    """Exportación y tabla de ventas por paquete."""
+    # Agregar el botón de exportación justo debajo del título, en la esquina superior derecha
+    col_exp1, col_exp2 = st.columns([3, 1])
+    with col_exp2:
+        # Botón de exportación
+        export_dataframe_to_excel(
+            ventas_por_paquete, 
+            f"ventas_por_paquete_{selected_month}.xlsx",
+            version=version
+        )
+    
+    # Mostrar la tabla con formato y colores
+    mostrar_tabla(
+        ventas_por_paquete[[
+            'Código Paquete', 'Nombre Paquete', 'Destino', 'Lote', 'Estado de Paquete', 'Fecha Salida', 'Tiempo Restante',
+            'Plazas Totales', 'Plazas Reservadas', 'Plazas Pagadas', 'Plazas Disponibles', 'Ocupación',
+            'Total', 'Comision', 'Pasajeros Mes', 'Órdenes Mes'
+        ]],
+        formatos=FORMATOS_RESUMEN,
+        colores={
+            'Ocupación': color_ocupacion(ventas_por_paquete['Ocupación'], rojo=ROJO_VENTAS),
+            'Tiempo Restante': color_tiempo_restante(
+                ventas_por_paquete['Dias Restantes'], rojo=ROJO_VENTAS, gris=GRIS_VENTAS
+            )
+        }
+    )
+    
+    # Agregar leyenda para los semáforos
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Semáforo de Ocupación:** 🔴 < 50% | 🟡 50-80% | 🟢 > 80%")
+    with col2:
+        st.markdown("**Semáforo de Tiempo:** 🟢 > 30 días | 🟡 8-30 días | 🔴 ≤7 días | ⬜ Ya salió")
+
+@st.fragment
+def seccion_detalle_ordenes(filtered_df, selected_month, version):
+    """Detalle de órdenes filtradas con su exportación."""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.subheader(f"Detalle de Órdenes - {selected_month}")
+    with col2:
+        # Botón de exportación justo debajo del título, en la esquina superior derecha
+        if not filtered_df.empty:
+            export_dataframe_to_excel(
+                filtered_df, 
+                f"detalle_ordenes_{selected_month}.xlsx",
+                version=version
+            )
+    
+    # El detalle línea a línea solo se arma cuando se pide
+    if not st.toggle("Ver detalle de órdenes", key="ver_detalle_ordenes"):
+        return
+    
+    # Crear un DataFrame con solo las columnas que queremos mostrar
+    df_detalle = filtered_df[[
+        'Número', 'Cliente', 'Fecha', 'Estado', 'Código Paquete', 'Nombre Paquete',
+        'Destino', 'Lote', 'Pasajeros', 'Total', 'Comision', 'Agencia', 'Vendedor'
+    ]].copy()
     
-    excel_data = output.getvalue()
-    return st.download_button(
-        label=f"📥 Exportar a Excel",
-        data=excel_data,
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    mostrar_tabla(
+        df_detalle,
+        formatos={'Total': 'moneda', 'Comision': 'moneda', 'Pasajeros': 'entero'}
     )
 
 def parse_spanish_month(date_str):
@@ -70,82 +183,110 @@ def parse_spanish_month(date_str):
         raise ValueError(f"Mes no válido: {month}")
     return datetime(int(year), month_map[month], 1)
 
-def load_orders_data(start_date, end_date):
+def dominio_ordenes(start_date, end_date):
+    """Dominio de sale.order confirmadas en el rango de fechas"""
+    return [
+        ('state', 'in', ['sale', 'done']),
+        ('date_order', '>=', start_date.strftime('%Y-%m-%d 00:00:00')),
+        ('date_order', '<=', end_date.strftime('%Y-%m-%d 23:59:59'))
+    ]
+
+def load_orders_periodo(start_date, end_date, client=None, refrescar=False):
+    """load_orders_data armado con particiones mensuales en caché (ver month_store.py),
+    junto con su cubo de ventas (ver sales_cube.py). Devuelve (filas, cubo).
+
+    Los meses vencidos se muestran hasta ANTIGUEDAD_MAXIMA mientras se refrescan (ver staleness.py).
+    """
+    client = client or get_odoo_client()
+
+    def cargar_mes(inicio, fin):
+        return load_orders_data(inicio, fin, client)
+
+    def vigilados_mes(inicio, fin):
+        domain = dominio_ordenes(inicio, fin)
+        return [('sale.order', domain), ('sale.order.line', dominio_relacional(domain, 'order_id'))]
+
+    consulta = (
+        client,
+        'ventas_por_destino',
+        (),
+        start_date,
+        end_date,
+        cargar_mes,
+        vigilados_mes
+    )
+    df = cargar_rango(*consulta, refrescar=refrescar, antiguedad_maxima=ANTIGUEDAD_MAXIMA)
+    if df is None:
+        return None, None
+    return df, cubo_rango(
+        *consulta, DIMENSIONES_CUBO, MEDIDAS_CUBO, columna_orden='Número', antiguedad_maxima=ANTIGUEDAD_MAXIMA
+    )
+
+def load_orders_data(start_date, end_date, client=None):
     """Carga los datos de órdenes desde Odoo para un rango de fechas"""
     try:
-        client = OdooClient()
+        client = client or get_odoo_client()
         
-        # Obtener órdenes de venta con límite de 100 para pruebas
-        domain = [
-            ('state', 'in', ['sale', 'done']),
-            ('date_order', '>=', start_date.strftime('%Y-%m-%d 00:00:00')),
-            ('date_order', '<=', end_date.strftime('%Y-%m-%d 23:59:59'))
-        ]
+        domain = dominio_ordenes(start_date, end_date)
         
         fields = [
             'name', 'partner_id', 'date_order', 'amount_total',
-            'invoice_status', 'user_id', 'team_id', 'order_line'
+            'invoice_status', 'user_id', 'team_id'
         ]
         
-        # Limitar a 100 registros para pruebas iniciales
-        orders = client.search_read('sale.order', domain=domain, fields=fields)
+        # Líneas con producto de las órdenes del período: el filtro se aplica en Odoo a través
+        # de order_id, sin enviar la lista de ids de order_line
+        order_lines = client.search_read(
+            'sale.order.line',
+            domain=dominio_relacional(domain, 'order_id') + [('product_id', '!=', False)],
+            fields=['order_id', 'product_id', 'product_uom_qty'],
+            m2o_ids=True,
+            nombres_m2o=[]
+        )
         
-        if not orders:
+        if not order_lines:
             return pd.DataFrame()
-            
-        # Recopilar todos los IDs de líneas de orden
-        order_line_ids = []
-        for order in orders:
-            if order.get('order_line'):
-                order_line_ids.extend(order['order_line'])
         
-        # Obtener todas las líneas de orden en una sola consulta
-        order_lines = client.search_read(
-            'sale.order.line',
-            domain=[('id', 'in', order_line_ids)],
-            fields=['order_id', 'product_id', 'product_uom_qty']
+        # Órdenes del período que tienen al menos una línea con producto
+        orders = client.search_read(
+            'sale.order',
+            domain=domain + [('order_line.product_id', '!=', False)],
+            fields=fields,
+            m2o_ids=True,
+            nombres_m2o=['partner_id', 'user_id', 'team_id']
         )
         
         # Organizar líneas por orden
         lines_by_order = {}
-        product_ids = []
-        
         for line in order_lines:
-            if not line.get('product_id'):
-                continue
-                
-            order_id = line['order_id'][0]
-            if order_id not in lines_by_order:
-                lines_by_order[order_id] = []
-                
-            lines_by_order[order_id].append(line)
-            product_ids.append(line['product_id'][0])
-        
-        # Obtener todos los productos en una sola consulta
+            lines_by_order.setdefault(line['order_id'][0], []).append(line)
+        
+        # Productos únicos (cada producto se repite en muchas líneas)
+        product_ids = sorted({line['product_id'][0] for line in order_lines})
+        
+        # Obtener todos los productos en una sola consulta; tipo de cupo y estado de viaje
+        # se leen del producto (campos heredados de la plantilla)
+        campos_producto = [
+            'id', 'default_code', 'x_studio_lote', 'x_studio_destino',
+            'x_studio_transporte', 'x_studio_comision_agencia',
+            'x_studio_ida_fecha_salida', 'x_studio_boletos_totales',
+            'x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf',
+            'x_studio_boletos_disponibles', 'name',
+            'x_studio_tipo_de_cupo', 'x_studio_estado_viaje'
+        ]
+        modo = modo_plazas()
+        if modo == 'local':
+            # Las plazas se calculan localmente (ver seat_counters.py) en vez de pedirlas a Odoo
+            campos_producto = [c for c in campos_producto if c not in CAMPOS_PLAZAS]
+        if modo != 'odoo':
+            campos_producto.append('product_tmpl_id')
         products = client.search_read(
             'product.product',
             domain=[('id', 'in', product_ids)],
-            fields=[
-                'id', 'default_code', 'x_studio_lote', 'x_studio_destino',
-                'x_studio_transporte', 'x_studio_comision_agencia',
-                'x_studio_ida_fecha_salida', 'x_studio_boletos_totales',
-                'x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf',
-                'x_studio_boletos_disponibles', 'name', 'product_tmpl_id'
-            ]
-        )
-        
-        # Obtener los IDs de las plantillas de producto
-        template_ids = [product['product_tmpl_id'][0] for product in products if product.get('product_tmpl_id')]
-        
-        # Obtener los datos de las plantillas de producto, incluyendo el tipo de cupo y estado de viaje
-        templates = client.search_read(
-            'product.template',
-            domain=[('id', 'in', template_ids)],
-            fields=['id', 'x_studio_tipo_de_cupo', 'x_studio_estado_viaje']
+            fields=campos_producto
         )
-        
-        # Crear diccionario de plantillas para acceso rápido
-        templates_dict = {template['id']: template for template in templates}
+        if modo != 'odoo':
+            completar_plazas_registros(client, products)
         
         # Crear diccionario de productos para acceso rápido
         products_dict = {product['id']: product for product in products}
@@ -164,10 +305,6 @@ def load_orders_data(start_date, end_date):
                 if not product:
                     continue
                 
-                # Obtener datos de la plantilla del producto
-                template_id = product.get('product_tmpl_id', [0])[0]
-                template = templates_dict.get(template_id, {})
-                
                 # Datos del producto
                 product_info = {
                     'default_code': product.get('default_code', ''),
@@ -180,8 +317,8 @@ def load_orders_data(start_date, end_date):
                     'plazas_pagadas': product.get('x_product_count_pagados_stat_inf', 0),
                     'plazas_disponibles': product.get('x_studio_boletos_disponibles', 0),
                     'nombre_producto': product.get('name', ''),
-                    'tipo_cupo': template.get('x_studio_tipo_de_cupo', ''),
-                    'estado_viaje': template.get('x_studio_estado_viaje', False)
+                    'tipo_cupo': product.get('x_studio_tipo_de_cupo', ''),
+                    'estado_viaje': product.get('x_studio_estado_viaje', False)
                 }
                 
                 # Calcular la comisión basada en el producto y la cantidad
@@ -226,40 +363,31 @@ def load_orders_data(start_date, end_date):
         st.error(f"Error al cargar datos: {str(e)}")
         return None
 
+def precargar_ventas(odoo):
+    """Refresca en segundo plano las ventas del mes actual y del anterior (ver cache_warmer.py)."""
+    load_orders_periodo(*meses_recientes(), client=odoo, refrescar=True)
+
+registrar_precarga('ventas_por_destino', precargar_ventas)
+
+# Los meses cerrados se guardan en disco; este botón los descarta para releerlos de Odoo
+if st.sidebar.button("Recargar meses cerrados"):
+    invalidar_periodos('ventas_por_destino')
+    limpiar_particiones('ventas_por_destino')
+    limpiar_referencias()
+    st.sidebar.success("Los meses cerrados se volverán a consultar en Odoo.")
+
 # Título de la página
 st.title("Ventas por Destino")
 
 # Inicializar el estado de la sesión si no existe
 if 'orders_df' not in st.session_state:
     st.session_state.orders_df = None
+    st.session_state.orders_cubo = None
     st.session_state.last_loaded_month = None
 
-# Constantes
-INVOICE_STATUS = {
-    'upselling': 'Oportunidad de Venta Adicional',
-    'invoiced': 'Facturado',
-    'to invoice': 'Por Facturar',
-    'no': 'Nada que Facturar'
-}
-
-# Mapeo de cu00f3digos de estado de paquete a nombres descriptivos
-ESTADO_PAQUETE = {
-    0: 'Bloqueado',
-    1: 'Inactivo',
-    2: 'Pendiente',
-    3: 'Activo',
-    4: 'Validación',
-    5: 'Cerrado',
-    6: 'Rendido',
-    7: 'Liquidado',
-    8: 'Pre-confirmado',
-    9: 'Anulado',
-    10: 'Social'
-}
-
 try:
     # Obtener lista de meses disponibles
-    client = OdooClient()
+    client = get_odoo_client()
     all_orders = client.search_read('sale.order', 
                                   domain=[('state', 'in', ['sale', 'done'])],
                                   fields=['date_order'])
@@ -308,24 +436,25 @@ try:
             end_date = (start_date.replace(month=start_date.month % 12 + 1, day=1) if start_date.month < 12 
                        else start_date.replace(year=start_date.year + 1, month=1, day=1)) - timedelta(days=1)
             
-            st.session_state.orders_df = load_orders_data(start_date, end_date)
+            st.session_state.orders_df, st.session_state.orders_cubo = load_orders_periodo(start_date, end_date)
             st.session_state.last_loaded_month = selected_month
             
             if st.session_state.orders_df is not None:
                 st.success(f'Datos cargados exitosamente para {selected_month}')
-    # Cargar datos por defecto si no hay datos cargados
+    # Cargar datos por defecto si no hay datos cargados (o volver a cargar el último mes mostrado)
     elif st.session_state.orders_df is None:
+        mes_inicial = st.session_state.last_loaded_month or default_month
         with st.spinner('Cargando datos iniciales...'):
-            selected_date = parse_spanish_month(default_month)
+            selected_date = parse_spanish_month(mes_inicial)
             start_date = selected_date.replace(day=1)
             end_date = (start_date.replace(month=start_date.month % 12 + 1, day=1) if start_date.month < 12 
                        else start_date.replace(year=start_date.year + 1, month=1, day=1)) - timedelta(days=1)
             
-            st.session_state.orders_df = load_orders_data(start_date, end_date)
-            st.session_state.last_loaded_month = default_month
+            st.session_state.orders_df, st.session_state.orders_cubo = load_orders_periodo(start_date, end_date)
+            st.session_state.last_loaded_month = mes_inicial
             
             if st.session_state.orders_df is not None:
-                st.success(f'Datos cargados exitosamente para {default_month}')
+                st.success(f'Datos cargados exitosamente para {mes_inicial}')
     
     # Mostrar mensaje si se está viendo datos de un mes diferente al seleccionado
     if (st.session_state.last_loaded_month is not None and 
@@ -335,6 +464,14 @@ try:
     # Continuar solo si hay datos cargados
     if st.session_state.orders_df is not None:
         df = st.session_state.orders_df
+
+        # Antigüedad de los datos; si se están refrescando, el mes se vuelve a armar al terminar
+        mostrar_antiguedad(
+            'ventas_por_destino',
+            df.attrs.get('cargado'),
+            al_actualizar=lambda: st.session_state.update(orders_df=None, orders_cubo=None),
+            claves=df.attrs.get('particiones')
+        )
         
         # Sección de filtros en columnas
         st.subheader("Filtros de Búsqueda")
@@ -428,6 +565,13 @@ try:
                 codigos_a_nombres = {v: k for k, v in nombres_estados.items()}
                 selected_estado_paquete = [codigos_a_nombres[nombre] for nombre in selected_estado_paquete_nombres if nombre in codigos_a_nombres]
         
+        # Versión de los datos para las exportaciones: carga del mes, día (tiempo restante) y filtros
+        version_datos = (
+            df.attrs.get('cargado'), st.session_state.last_loaded_month, datetime.now().date(),
+            selected_agencia, selected_destino, selected_estado, selected_lote,
+            selected_tipo_cupo, selected_estado_paquete
+        )
+
         # Aplicar filtros al DataFrame
         filtered_df = df.copy()
         if selected_agencia != 'Todas':
@@ -453,30 +597,45 @@ try:
             )
             filtered_df = temp_df[temp_df['Estado de Paquete Codigo Int'].isin(selected_estado_paquete)]
         
+        # Los mismos filtros sobre el cubo de ventas: las tarjetas y el resumen por destino
+        # se leen de sus celdas, sin recorrer las líneas
+        cubo_filtrado = filtrar(st.session_state.orders_cubo, {
+            'Agencia': [selected_agencia] if selected_agencia != 'Todas' else None,
+            'Destino': [selected_destino] if selected_destino != 'Todos' else None,
+            'Estado': [selected_estado] if selected_estado != 'Todos' else None,
+            'Lote': [selected_lote] if selected_lote != 'Todos' else None,
+            'Tipo de Cupo': selected_tipo_cupo,
+        })
+        if len(selected_estado_paquete) > 0:
+            codigos_cubo = cubo_filtrado['Estado de Paquete Codigo'].apply(
+                lambda x: int(x) if x is not None and isinstance(x, (int, float, str)) and str(x).isdigit() else x
+            )
+            cubo_filtrado = cubo_filtrado[codigos_cubo.isin(selected_estado_paquete)]
+        
         # Mostrar resumen detallado
         st.subheader("Resumen General")
         
-        # Calcular totales por estado de facturación
-        facturado_df = filtered_df[filtered_df['Estado'] == 'Facturado']
-        por_facturar_df = filtered_df[filtered_df['Estado'] == 'Por Facturar']
+        # Totales generales y por estado de facturación
+        totales_generales = totales(cubo_filtrado, MEDIDAS_CUBO)
+        totales_facturados = totales(filtrar(cubo_filtrado, {'Estado': ['Facturado']}), MEDIDAS_CUBO)
+        totales_por_facturar = totales(filtrar(cubo_filtrado, {'Estado': ['Por Facturar']}), MEDIDAS_CUBO)
         
-        # Totales generales
-        total_ventas = filtered_df['Total'].sum()
-        total_comisiones = filtered_df['Comision'].sum()
-        total_pasajeros = filtered_df['Pasajeros'].sum()
-        total_ordenes = len(filtered_df)
+        total_ventas = totales_generales['Total']
+        total_comisiones = totales_generales['Comision']
+        total_pasajeros = totales_generales['Pasajeros']
+        total_ordenes = totales_generales['Líneas']
         
         # Totales facturados
-        ventas_facturadas = facturado_df['Total'].sum()
-        comisiones_facturadas = facturado_df['Comision'].sum()
-        pasajeros_facturados = facturado_df['Pasajeros'].sum()
-        ordenes_facturadas = len(facturado_df)
+        ventas_facturadas = totales_facturados['Total']
+        comisiones_facturadas = totales_facturados['Comision']
+        pasajeros_facturados = totales_facturados['Pasajeros']
+        ordenes_facturadas = totales_facturados['Líneas']
         
         # Totales por facturar
-        ventas_por_facturar = por_facturar_df['Total'].sum()
-        comisiones_por_facturar = por_facturar_df['Comision'].sum()
-        pasajeros_por_facturar = por_facturar_df['Pasajeros'].sum()
-        ordenes_por_facturar = len(por_facturar_df)
+        ventas_por_facturar = totales_por_facturar['Total']
+        comisiones_por_facturar = totales_por_facturar['Comision']
+        pasajeros_por_facturar = totales_por_facturar['Pasajeros']
+        ordenes_por_facturar = totales_por_facturar['Líneas']
         
         # Crear tarjetas de resumen con diseño elegante
         st.markdown('''<style>
@@ -745,120 +904,35 @@ try:
         
         st.plotly_chart(fig, use_container_width=True)
         
-        # Crear el DataFrame de ventas por destino
-        ventas_por_destino = filtered_df.groupby('Destino').agg({
-            'Total': 'sum',
-            'Comision': 'sum',
-            'Pasajeros': 'sum',
-            'Número': 'count'
-        }).reset_index()
+        # Crear el DataFrame de ventas por destino (roll-up del cubo a Destino)
+        ventas_por_destino = agrupar(cubo_filtrado, ['Destino'], MEDIDAS_CUBO)[
+            ['Destino', 'Total', 'Comision', 'Pasajeros', 'Líneas']
+        ]
         
         ventas_por_destino = ventas_por_destino.rename(columns={
-            'Número': 'Órdenes Mes',
+            'Líneas': 'Órdenes Mes',
             'Pasajeros': 'Pasajeros Mes'
         })
         ventas_por_destino = ventas_por_destino.sort_values('Total', ascending=False)
         
-        # Tabla de resumen de ventas por destino
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.subheader("Resumen de Ventas por Destino")
-        with col2:
-            # Botu00f3n de exportaciu00f3n justo debajo del tu00edtulo, en la esquina superior derecha
-            if not ventas_por_destino.empty:
-                # Crear una copia del DataFrame con todas las columnas para exportar
-                export_df = ventas_por_destino.copy()
-                export_dataframe_to_excel(
-                    export_df, 
-                    f"ventas_por_destino_{selected_month}.xlsx"
-                )
+        # Copia para exportar (sin las columnas de plazas)
+        export_df = ventas_por_destino.copy()
         
-        # Primero, calculamos las plazas por destino
-        # Agrupamos los paquetes por destino y sumamos las plazas
-        plazas_por_destino = {}
-        for destino in filtered_df['Destino'].unique():
-            # Filtrar por destino y obtener valores únicos de paquetes
-            paquetes_destino = filtered_df[filtered_df['Destino'] == destino]['Código Paquete'].unique()
-            
-            # Para cada paquete, obtener los datos de plazas (tomamos el primer registro, asumiendo que son iguales)
-            plazas_totales = 0
-            plazas_reservadas = 0
-            plazas_pagadas = 0
-            plazas_disponibles = 0
-            
-            for paquete in paquetes_destino:
-                paquete_data = filtered_df[(filtered_df['Destino'] == destino) & (filtered_df['Código Paquete'] == paquete)].iloc[0]
-                plazas_totales += paquete_data.get('Plazas Totales', 0) or 0
-                plazas_reservadas += paquete_data.get('Plazas Reservadas', 0) or 0
-                plazas_pagadas += paquete_data.get('Plazas Pagadas', 0) or 0
-                plazas_disponibles += paquete_data.get('Plazas Disponibles', 0) or 0
-            
-            plazas_por_destino[destino] = {
-                'Plazas Totales': plazas_totales,
-                'Plazas Reservadas': plazas_reservadas,
-                'Plazas Pagadas': plazas_pagadas,
-                'Plazas Disponibles': plazas_disponibles
-            }
-        
-        # Agregar las plazas al DataFrame de ventas por destino
-        for idx, row in ventas_por_destino.iterrows():
-            destino = row['Destino']
-            if destino in plazas_por_destino:
-                ventas_por_destino.at[idx, 'Plazas Totales'] = plazas_por_destino[destino]['Plazas Totales']
-                ventas_por_destino.at[idx, 'Plazas Reservadas'] = plazas_por_destino[destino]['Plazas Reservadas']
-                ventas_por_destino.at[idx, 'Plazas Pagadas'] = plazas_por_destino[destino]['Plazas Pagadas']
-                ventas_por_destino.at[idx, 'Plazas Disponibles'] = plazas_por_destino[destino]['Plazas Disponibles']
-                
-                # Calcular porcentaje de ocupación
-                plazas_totales = plazas_por_destino[destino]['Plazas Totales']
-                if plazas_totales > 0:
-                    plazas_ocupadas = plazas_por_destino[destino]['Plazas Reservadas'] + plazas_por_destino[destino]['Plazas Pagadas']
-                    porcentaje_ocupacion = min(100, (plazas_ocupadas / plazas_totales) * 100)
-                    ventas_por_destino.at[idx, 'Ocupación'] = f"{int(porcentaje_ocupacion)}%"
-                else:
-                    ventas_por_destino.at[idx, 'Ocupación'] = "0%"
-        
-
-        
-        # Función para colorear las celdas de ocupación
-        def color_ocupacion(val):
-            # Extraer el número del porcentaje (quitar el símbolo %)
-            try:
-                num = int(val.replace('%', ''))
-            except:
-                return ''
-                
-            # Definir colores por rango (invertidos)
-            if num < 50:  # Menos del 50% - Rojo (baja ocupación)
-                return 'background-color: #ff9e82'  # Rojo claro
-            elif num < 80:  # Entre 50% y 80% - Amarillo (ocupación media)
-                return 'background-color: #ffeb82'  # Amarillo claro
-            else:  # Más del 80% - Verde (alta ocupación)
-                return 'background-color: #8eff8e'  # Verde claro
-        
-        # Mostrar la tabla con formato y colores
-        st.dataframe(
-            ventas_por_destino[[
-                'Destino', 'Total', 'Comision', 'Pasajeros Mes', 'Órdenes Mes',
-                'Plazas Totales', 'Plazas Reservadas', 'Plazas Pagadas', 'Plazas Disponibles', 'Ocupación'
-            ]].style.format({
-                'Total': lambda x: format_currency(x),
-                'Comision': lambda x: format_currency(x),
-                'Pasajeros Mes': lambda x: f"{int(x):,}".replace(',', '.'),
-                'Órdenes Mes': lambda x: f"{int(x):,}".replace(',', '.'),
-                'Plazas Totales': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                'Plazas Reservadas': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                'Plazas Pagadas': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                'Plazas Disponibles': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0"
-            }).applymap(color_ocupacion, subset=['Ocupación']),
-            hide_index=True,
-            use_container_width=True
+        # Plazas por destino: cada paquete se cuenta una sola vez (sus plazas se repiten en cada orden)
+        columnas_plazas = ['Plazas Totales', 'Plazas Reservadas', 'Plazas Pagadas', 'Plazas Disponibles']
+        plazas_por_destino = (
+            filtered_df.drop_duplicates(['Destino', 'Código Paquete'])
+            .groupby('Destino')[columnas_plazas].sum()
+            .reset_index()
+        )
+        ventas_por_destino = ventas_por_destino.merge(plazas_por_destino, on='Destino', how='left')
+        ventas_por_destino['Ocupación'] = calcular_ocupacion(
+            ventas_por_destino['Plazas Reservadas'] + ventas_por_destino['Plazas Pagadas'],
+            ventas_por_destino['Plazas Totales'],
+            maximo=100
         )
         
-        # Eliminamos este botón ya que lo reposicionaremos
-        
-        # Agregar leyenda para el semáforo de ocupación
-        st.markdown("**Semáforo de Ocupación:** 🔴 < 50% | 🟡 50-80% | 🟢 > 80%")
+        seccion_ventas_por_destino(ventas_por_destino, export_df, selected_month, version_datos)
         
         # Calcular totales globales a partir de la tabla ventas_por_destino
         # Esta tabla ya tiene los datos correctos y procesados
@@ -925,133 +999,26 @@ try:
             })
             ventas_por_paquete = ventas_por_paquete.sort_values(['Destino', 'Total'], ascending=[True, False])
             
-            # Calcular tiempo restante y ocupación para cada paquete
-            for idx, row in ventas_por_paquete.iterrows():
-                # Calcular días restantes para la salida
-                if pd.notna(row['Fecha Salida']):
-                    dias_restantes = (row['Fecha Salida'] - fecha_actual).days
-                    if dias_restantes < 0:
-                        ventas_por_paquete.at[idx, 'Tiempo Restante'] = "Ya salió"
-                    else:
-                        ventas_por_paquete.at[idx, 'Tiempo Restante'] = f"{dias_restantes} días"
-                else:
-                    ventas_por_paquete.at[idx, 'Tiempo Restante'] = "Sin fecha"
-                
-                # Calcular porcentaje de ocupación
-                plazas_totales = row['Plazas Totales'] or 0
-                if plazas_totales > 0:
-                    plazas_ocupadas = (row['Plazas Reservadas'] or 0) + (row['Plazas Pagadas'] or 0)
-                    porcentaje_ocupacion = min(100, (plazas_ocupadas / plazas_totales) * 100)
-                    ventas_por_paquete.at[idx, 'Ocupación'] = f"{int(porcentaje_ocupacion)}%"
-                else:
-                    ventas_por_paquete.at[idx, 'Ocupación'] = "0%"
-            
-            # Función para colorear las celdas de ocupación
-            def color_ocupacion(val):
-                # Extraer el número del porcentaje (quitar el símbolo %)
-                try:
-                    num = int(val.replace('%', ''))
-                except:
-                    return ''
-                    
-                # Definir colores por rango (invertidos)
-                if num < 50:  # Menos del 50% - Rojo (baja ocupación)
-                    return 'background-color: #ff9e82'  # Rojo claro
-                elif num < 80:  # Entre 50% y 80% - Amarillo (ocupación media)
-                    return 'background-color: #ffeb82'  # Amarillo claro
-                else:  # Más del 80% - Verde (alta ocupación)
-                    return 'background-color: #8eff8e'  # Verde claro
-            
-            # Función para colorear las celdas de tiempo restante
-            def color_tiempo_restante(val):
-                if 'Ya salió' in val:
-                    return 'background-color: #d3d3d3'  # Gris para salidas pasadas
-                elif 'Sin fecha' in val:
-                    return ''  # Sin color para fechas no definidas
-                
-                try:
-                    # Extraer el número de días
-                    dias = int(val.split()[0])
-                    
-                    # Definir colores por rango de días
-                    if dias <= 7:  # Última semana - Rojo (urgente)
-                        return 'background-color: #ff9e82'  # Rojo claro
-                    elif dias <= 30:  # Último mes - Amarillo (pronto)
-                        return 'background-color: #ffeb82'  # Amarillo claro
-                    else:  # Más de un mes - Verde (tiempo suficiente)
-                        return 'background-color: #8eff8e'  # Verde claro
-                except:
-                    return ''
-            
-            # Agregar el botón de exportación justo debajo del título, en la esquina superior derecha
-            col_exp1, col_exp2 = st.columns([3, 1])
-            with col_exp2:
-                # Botón de exportación
-                export_dataframe_to_excel(
-                    ventas_por_paquete, 
-                    f"ventas_por_paquete_{selected_month}.xlsx"
-                )
-            
-            # Mostrar la tabla con formato y colores
-            st.dataframe(
-                ventas_por_paquete[[
-                    'Código Paquete', 'Nombre Paquete', 'Destino', 'Lote', 'Estado de Paquete', 'Fecha Salida', 'Tiempo Restante',
-                    'Plazas Totales', 'Plazas Reservadas', 'Plazas Pagadas', 'Plazas Disponibles', 'Ocupación',
-                    'Total', 'Comision', 'Pasajeros Mes', 'Órdenes Mes'
-                ]].style.format({
-                    'Total': lambda x: format_currency(x),
-                    'Comision': lambda x: format_currency(x),
-                    'Pasajeros Mes': lambda x: f"{int(x):,}".replace(',', '.'),
-                    'Órdenes Mes': lambda x: f"{int(x):,}".replace(',', '.'),
-                    'Plazas Totales': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                    'Plazas Reservadas': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                    'Plazas Pagadas': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0",
-                    'Plazas Disponibles': lambda x: f"{int(x):,}".replace(',', '.') if pd.notna(x) else "0"
-                })
-                .applymap(color_ocupacion, subset=['Ocupación'])
-                .applymap(color_tiempo_restante, subset=['Tiempo Restante']),
-                hide_index=True,
-                use_container_width=True
+            # Calcular tiempo restante y ocupación para todos los paquetes a la vez
+            ventas_por_paquete['Dias Restantes'] = (
+                pd.to_datetime(ventas_por_paquete['Fecha Salida']) - pd.Timestamp(fecha_actual)
+            ).dt.days
+            dias = ventas_por_paquete['Dias Restantes']
+            ventas_por_paquete['Tiempo Restante'] = (
+                dias.map('{:.0f} días'.format).mask(dias < 0, 'Ya salió').mask(dias.isna(), 'Sin fecha')
+            )
+            ventas_por_paquete['Ocupación'] = calcular_ocupacion(
+                ventas_por_paquete['Plazas Reservadas'].fillna(0) + ventas_por_paquete['Plazas Pagadas'].fillna(0),
+                ventas_por_paquete['Plazas Totales'],
+                maximo=100
             )
             
-            # Agregar leyenda para los semáforos
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown("**Semáforo de Ocupación:** 🔴 < 50% | 🟡 50-80% | 🟢 > 80%")
-            with col2:
-                st.markdown("**Semáforo de Tiempo:** 🟢 > 30 días | 🟡 8-30 días | 🔴 ≤7 días | ⬜ Ya salió")
+            seccion_ventas_por_paquete(ventas_por_paquete, selected_month, version_datos)
         else:
             st.warning("No se encontró información de paquetes en los datos.")
         
         # Tabla detallada
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.subheader(f"Detalle de Órdenes - {selected_month}")
-        with col2:
-            # Botón de exportación justo debajo del título, en la esquina superior derecha
-            if not filtered_df.empty:
-                export_dataframe_to_excel(
-                    filtered_df, 
-                    f"detalle_ordenes_{selected_month}.xlsx"
-                )
-        
-        # Crear un DataFrame con solo las columnas que queremos mostrar
-        df_detalle = filtered_df[[
-            'Número', 'Cliente', 'Fecha', 'Estado', 'Código Paquete', 'Nombre Paquete',
-            'Destino', 'Lote', 'Pasajeros', 'Total', 'Comision', 'Agencia', 'Vendedor'
-        ]].copy()
-        
-        st.dataframe(
-            df_detalle.style.format({
-                'Total': lambda x: format_currency(x),
-                'Comision': lambda x: format_currency(x),
-                'Pasajeros': lambda x: f"{int(x):,}".replace(',', '.')
-            }),
-            hide_index=True,
-            use_container_width=True
-        )
-        
-        # Eliminamos este botón ya que lo reposicionaremos
+        seccion_detalle_ordenes(filtered_df, selected_month, version_datos)
             
 except Exception as e:
     st.error(f"Error al conectar con Odoo: {str(e)}")
@@ -24,14 +24,46 @@ if st.sidebar.button("Logout"):
 
 import pandas as pd
 from datetime import datetime, timedelta
-import io
-from odoo_client import OdooClient
+from connection import get_odoo_client
+from cache_warmer import meses_recientes, registrar_precarga
+from staleness import antiguedad_maxima, mostrar_antiguedad
+from odoo_client import dominio_relacional
+from period_cache import invalidar_periodos
+from month_store import agregados_rango, cargar_rango, cubo_rango, limpiar_particiones
+from sales_cube import agrupar
+from reference_data import INVOICE_STATUS, equipos, limpiar_referencias
+from exports import export_dataframe, export_dataframe_to_excel
+from tables import column_config_numerico
 import os
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Cubo de ventas (ver sales_cube.py): dimensiones y medidas de las filas de órdenes
+DIMENSIONES_CUBO = ['Agencia', 'Destino', 'Tipo de Cupo', 'Mes']
+MEDIDAS_CUBO = ['Cantidad', 'Comision', 'Total']
+
+# Filtros por defecto (la precarga en segundo plano usa los mismos, ver cache_warmer.py)
+ESTADOS_FACTURACION_POR_DEFECTO = ['invoiced']
+TIPOS_CUPO_POR_DEFECTO = ['Regular', 'Sin Subsidio']
+DIAS_POR_DEFECTO = 30
+
+# Segundos que se muestran meses vencidos mientras se refrescan (ver staleness.py)
+ANTIGUEDAD_MAXIMA = antiguedad_maxima('venta_agencia', 1800)
+
+# Campos de sale.order a obtener
+CAMPOS_ORDEN = [
+    'name',           # Número de orden
+    'partner_id',     # Cliente
+    'date_order',     # Fecha de orden
+    'invoice_status', # Estado de facturación
+    'amount_total',   # Monto total
+    'currency_id',    # Moneda
+    'user_id',        # Usuario
+    'team_id',        # Equipo de ventas
+]
+
 # 2. FUNCIONES DE UTILIDAD
 def format_currency(value, decimals=0):
     """Formatea un número como moneda con separadores de miles"""
@@ -42,34 +74,21 @@ def format_currency(value, decimals=0):
     except (ValueError, TypeError):
         return "0"
 
-def to_csv(df):
-    """Convierte DataFrame a CSV"""
-    return df.to_csv(index=False).encode('utf-8')
-
-def to_excel(df, sheet_name='Sheet1'):
-    """Convierte DataFrame a Excel XLSX"""
-    from io import BytesIO
-    output = BytesIO()
-    df.to_excel(output, engine='openpyxl', sheet_name=sheet_name, index=False)
-    return output.getvalue()
-
 def load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados):
-    """Carga y procesa los datos de órdenes"""
-    orders = odoo.search_read('sale.order', domain=domain, fields=fields)
-    
-    if not orders:
-        return [], {}
+    """Carga y procesa los datos de órdenes.
+
+    Los filtros de la orden (`domain`) y el de tipo de cupo se aplican en Odoo sobre
+    sale.order.line: solo viajan las líneas que cumplen y sus órdenes, sin listas de ids.
+    """
+    # Filtro de tipo de cupo sobre el producto de la línea (sin selección = todos)
+    filtro_cupo = []
+    if tipos_cupo_seleccionados:
+        filtro_cupo = [('product_id.product_tmpl_id.x_studio_tipo_de_cupo', 'in', list(tipos_cupo_seleccionados))]
     
-    # Obtener todas las líneas de orden (no solo la primera)
-    all_line_ids = []
-    for order in orders:
-        if order['order_line']:
-            all_line_ids.extend(order['order_line'])
-    
-    # Obtener todas las líneas de orden
+    # Obtener las líneas de orden que cumplen los filtros
     all_lines = odoo.search_read(
         'sale.order.line',
-        domain=[('id', 'in', all_line_ids)],
+        domain=dominio_relacional(domain, 'order_id') + filtro_cupo,
         fields=[
             'id', 
             'product_id', 
@@ -78,7 +97,21 @@ def load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados):
             'price_unit',
             'price_subtotal',
             'order_id'
-        ]
+        ],
+        m2o_ids=True,
+        nombres_m2o=[]
+    )
+    
+    if not all_lines:
+        return []
+    
+    # Órdenes con al menos una línea que cumple el filtro de tipo de cupo
+    orders = odoo.search_read(
+        'sale.order',
+        domain=domain + dominio_relacional(filtro_cupo, 'order_line'),
+        fields=fields,
+        m2o_ids=True,
+        nombres_m2o=['partner_id', 'user_id', 'team_id']
     )
     
     # Crear diccionario de líneas por orden
@@ -89,10 +122,11 @@ def load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados):
             lines_by_order[order_id] = []
         lines_by_order[order_id].append(line)
     
-    # Obtener productos únicos
-    product_ids = list(set(line['product_id'][0] for line in all_lines if line['product_id']))
+    # Obtener productos únicos. product_id de la línea es un product.product: se lee la variante
+    # (los campos de la plantilla son heredados), no product.template con ids de variante
+    product_ids = sorted({line['product_id'][0] for line in all_lines if line['product_id']})
     products = odoo.search_read(
-        'product.template',
+        'product.product',
         domain=[('id', 'in', product_ids)],
         fields=['id', 
                 'name',
@@ -107,40 +141,16 @@ def load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados):
     
     # Procesar órdenes
     orders_data = []
-    resumen_agencias = {}
-    ordenes_procesadas_por_agencia = {}  # Para evitar contar la misma orden múltiples veces
     
     for order in orders:
         order_lines = lines_by_order.get(order['id'], [])
-        team_id = order['team_id'][0] if order['team_id'] else 0
         team_name = order['team_id'][1] if order['team_id'] else 'Sin Agencia'
         
-        # Inicializar resumen de agencia si no existe
-        if team_name not in resumen_agencias:
-            resumen_agencias[team_name] = {
-                'Agencia': team_name,
-                'Total Órdenes': 0,
-                'Total Pasajeros': 0,
-                'Total Comisiones': 0,
-                'Total Vendido': 0
-            }
-            ordenes_procesadas_por_agencia[team_name] = set()
-        
-        # Variable para verificar si la orden tiene líneas válidas (que pasen el filtro)
-        orden_tiene_lineas_validas = False
-        
         # Procesar cada línea de la orden
         for line in order_lines:
             if line['product_id']:
                 product = products_dict.get(line['product_id'][0])
                 if product:
-                    # Filtrar por tipo de cupo si hay selecciones
-                    if tipos_cupo_seleccionados and product.get('x_studio_tipo_de_cupo') not in tipos_cupo_seleccionados:
-                        continue
-                    
-                    # Marcar que la orden tiene al menos una línea válida
-                    orden_tiene_lineas_validas = True
-                    
                     comision_rate = product.get('x_studio_comision_agencia', 0)
                     cantidad = line['product_uom_qty']
                     comision = comision_rate * cantidad
@@ -160,43 +170,206 @@ def load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados):
                         'Total': float(line['price_subtotal']),  # Usar subtotal de la línea
                         'ID': int(order['id'])
                     })
-                    
-                    # Actualizar resumen de agencia
-                    resumen_agencias[team_name]['Total Pasajeros'] += cantidad
-                    resumen_agencias[team_name]['Total Comisiones'] += comision
-                    resumen_agencias[team_name]['Total Vendido'] += line['price_subtotal']
-        
-        # Contar la orden solo una vez por agencia y solo si tiene líneas válidas
-        if orden_tiene_lineas_validas and order['id'] not in ordenes_procesadas_por_agencia[team_name]:
-            resumen_agencias[team_name]['Total Órdenes'] += 1
-            ordenes_procesadas_por_agencia[team_name].add(order['id'])
     
-    return orders_data, resumen_agencias
+    return orders_data
+
+
+def resumen_por_agencia(cubo):
+    """Totales por agencia desde el cubo de ventas (roll-up a Agencia, ver sales_cube.py)."""
+    resumen_agencias = {}
+    for fila in agrupar(cubo, ['Agencia'], MEDIDAS_CUBO, sort=False).itertuples(index=False):
+        resumen_agencias[fila.Agencia] = {
+            'Agencia': fila.Agencia,
+            'Total Órdenes': int(fila.Órdenes),
+            'Total Pasajeros': float(fila.Cantidad),
+            'Total Comisiones': float(fila.Comision),
+            'Total Vendido': float(fila.Total)
+        }
+    return resumen_agencias
+
+
+def dominio_ordenes(fecha_inicio, fecha_fin, estado_facturacion, agencia):
+    """Dominio de sale.order para el rango de fechas, estados de facturación y agencia (0 = todas)."""
+    domain = [
+        ("date_order", ">=", f"{fecha_inicio} 00:00:00"),
+        ("date_order", "<=", f"{fecha_fin} 23:59:59"),
+        ("invoice_status", "in", estado_facturacion)
+    ]
+    if agencia != 0:
+        domain.append(("team_id", "=", agencia))
+    return domain
+
+
+def load_orders_rango(odoo, fecha_inicio, fecha_fin, estado_facturacion, agencia, fields, tipos_cupo_seleccionados,
+                      refrescar=False, antiguedad_maxima=None):
+    """Filas, resumen por agencia, totales, hora de carga y claves de las particiones del rango,
+    armados con particiones mensuales (ver month_store.py).
+
+    El resumen por agencia sale del cubo de ventas y los totales (Cantidad, Comision, Total) de los
+    totales diarios, ambos precalculados por mes. `refrescar` vuelve a consultar los meses en Odoo;
+    `antiguedad_maxima` acepta meses vencidos mientras se refrescan en segundo plano.
+    """
+    def cargar_mes(inicio, fin):
+        domain = dominio_ordenes(inicio, fin, estado_facturacion, agencia)
+        return pd.DataFrame(load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados))
+
+    def vigilados_mes(inicio, fin):
+        domain = dominio_ordenes(inicio, fin, estado_facturacion, agencia)
+        return [('sale.order', domain), ('sale.order.line', dominio_relacional(domain, 'order_id'))]
+
+    consulta = (
+        odoo,
+        'venta_agencia',
+        (sorted(estado_facturacion), agencia, fields, sorted(tipos_cupo_seleccionados)),
+        fecha_inicio,
+        fecha_fin,
+        cargar_mes,
+        vigilados_mes
+    )
+    filas = cargar_rango(*consulta, refrescar=refrescar, antiguedad_maxima=antiguedad_maxima)
+    cubo = cubo_rango(
+        *consulta, DIMENSIONES_CUBO, MEDIDAS_CUBO, columna_orden='ID', antiguedad_maxima=antiguedad_maxima
+    )
+    diario = agregados_rango(*consulta, antiguedad_maxima=antiguedad_maxima)
+    totales = {
+        col: float(diario[col].sum()) if col in diario.columns else 0.0
+        for col in ['Cantidad', 'Comision', 'Total']
+    }
+    return (
+        filas.to_dict('records'), resumen_por_agencia(cubo), totales, filas.attrs.get('cargado'),
+        filas.attrs.get('particiones', [])
+    )
+
+
+def precargar_ventas(odoo):
+    """Refresca en segundo plano el mes actual y el anterior con los filtros por defecto."""
+    load_orders_rango(
+        odoo, *meses_recientes(), ESTADOS_FACTURACION_POR_DEFECTO, 0, CAMPOS_ORDEN, TIPOS_CUPO_POR_DEFECTO,
+        refrescar=True
+    )
+
+
+@st.fragment
+def seccion_resumen_agencias(df_resumen, formatos_resumen, filename, version):
+    """Tabla de resumen por agencia con su botón de exportación.
+
+    Es un fragmento: exportar solo rerenderiza esta sección, sin volver a consultar Odoo.
+    `version` identifica el resultado mostrado (firma de los filtros aplicados y hora de carga).
+    """
+    export_dataframe_to_excel(
+        df_resumen,
+        filename,
+        sheet_name='Resumen Agencias',
+        label="📥 Descargar Resumen por Agencia (Excel)",
+        version=version
+    )
+
+    st.data_editor(
+        df_resumen,
+        column_config=column_config_numerico(formatos_resumen),
+        use_container_width=True,
+        disabled=True,
+        key="resumen_table"
+    )
+
+
+@st.fragment
+def seccion_ordenes(df_orders, filename, version, anios=None):
+    """Detalle de órdenes con su filtro local y exportaciones.
+
+    Es un fragmento: cambiar el filtro del detalle o exportar solo rerenderiza esta sección.
+    `version` identifica el resultado mostrado y `anios` = (año actual, año anterior) cuando hay
+    comparación anual.
+    """
+    col_filtro, col_buscar = st.columns(2)
+    with col_filtro:
+        agencias_detalle = st.multiselect(
+            "Filtrar detalle por Agencia",
+            options=sorted(df_orders['Agencia'].dropna().unique()),
+            default=[],
+            key="detalle_agencias"
+        )
+    with col_buscar:
+        texto_busqueda = st.text_input("Buscar por número o cliente", key="detalle_busqueda")
+
+    df_detalle = df_orders
+    if agencias_detalle:
+        df_detalle = df_detalle[df_detalle['Agencia'].isin(agencias_detalle)]
+    if texto_busqueda:
+        coincide = (
+            df_detalle['Número'].str.contains(texto_busqueda, case=False, regex=False)
+            | df_detalle['Cliente'].str.contains(texto_busqueda, case=False, regex=False)
+        )
+        df_detalle = df_detalle[coincide]
+
+    # Descarga con todas las columnas salvo el ID interno
+    df_detalle_download = df_detalle.drop(columns=['ID'], errors='ignore')
+    version_detalle = (version, tuple(agencias_detalle), texto_busqueda)
+
+    col_xlsx, col_parquet, col_csv = st.columns(3)
+    with col_xlsx:
+        export_dataframe_to_excel(
+            df_detalle_download,
+            filename,
+            sheet_name='Órdenes',
+            label="📥 Descargar Órdenes (Excel)",
+            version=version_detalle
+        )
+    # Formatos para volúmenes grandes (varios meses de detalle)
+    nombre_base = filename.rsplit('.', 1)[0]
+    with col_parquet:
+        export_dataframe(df_detalle_download, nombre_base, formato='parquet', label="📥 Descargar Órdenes (Parquet)",
+                         version=version_detalle)
+    with col_csv:
+        export_dataframe(df_detalle_download, nombre_base, formato='csv.gz', label="📥 Descargar Órdenes (CSV .gz)",
+                         version=version_detalle)
+
+    # El detalle línea a línea solo se muestra cuando se pide (las descargas siempre están)
+    if st.toggle("Ver detalle de órdenes", key="ver_detalle_ordenes"):
+        st.data_editor(
+            df_detalle_download,
+            column_config=column_config_numerico({'Comision': 'clp', 'Total': 'clp'}),
+            use_container_width=True,
+            disabled=True,
+            key="orders_table"
+        )
+
+    if anios:
+        ordenes_actuales = int((df_detalle['Año'] == anios[0]).sum())
+        ordenes_anteriores = int((df_detalle['Año'] == anios[1]).sum())
+        st.info(f"Mostrando {ordenes_actuales} órdenes de {anios[0]} y {ordenes_anteriores} órdenes de {anios[1]}")
+    else:
+        st.info(f"Mostrando {len(df_detalle)} órdenes del período seleccionado")
 
 
 # 3. TÍTULO DE LA PÁGINA
 st.title("Venta Agencia")
 
-# 4. CONSTANTES
-INVOICE_STATUS = {
-    'upselling': 'Oportunidad de Venta Adicional',
-    'invoiced': 'Facturado',
-    'to invoice': 'Por Facturar',
-    'no': 'Nada que Facturar'
-}
+# Estado de sesión: último resultado consultado (con los filtros aplicados y su firma) y si hay
+# que volver a armarlo con esos filtros porque sus meses se refrescaron en segundo plano
+if 'venta_agencia_result' not in st.session_state:
+    st.session_state.venta_agencia_result = None
+if 'venta_agencia_recargar' not in st.session_state:
+    st.session_state.venta_agencia_recargar = False
+
+# Los períodos cerrados se guardan en disco; este botón los descarta y vuelve a consultar
+if st.sidebar.button("Recargar períodos cerrados"):
+    invalidar_periodos('venta_agencia')
+    limpiar_particiones('venta_agencia')
+    limpiar_referencias()
+    st.session_state.venta_agencia_recargar = True
+
+# Precarga en segundo plano del mes actual y el anterior (ver cache_warmer.py)
+registrar_precarga('venta_agencia', precargar_ventas)
 
-# 5. CÓDIGO PRINCIPAL
+# 4. CÓDIGO PRINCIPAL
 try:
-    # Crear cliente Odoo
-    odoo = OdooClient()
+    # Cliente Odoo compartido (se crea una vez por proceso)
+    odoo = get_odoo_client()
     st.success("Conexión establecida con Odoo")
 
     # Obtener equipos de venta (agencias)
-    teams = odoo.search_read(
-        'crm.team',
-        domain=[],
-        fields=['id', 'name']
-    )
+    teams = equipos(odoo)
     
     team_names = {team['id']: team['name'] for team in teams}
     # Agregar opción "Todos"
@@ -228,7 +401,7 @@ try:
             estado_facturacion = st.multiselect(
                 "Estado de facturación",
                 options=list(INVOICE_STATUS.keys()),
-                default=['invoiced'],
+                default=ESTADOS_FACTURACION_POR_DEFECTO,
                 format_func=lambda x: INVOICE_STATUS[x]
             )
         
@@ -245,7 +418,7 @@ try:
             tipos_cupo_seleccionados = st.multiselect(
                 "Seleccionar Tipos de Cupo",
                 options=list(TIPO_CUPO.keys()),
-                default=['Regular', 'Sin Subsidio'],
+                default=TIPOS_CUPO_POR_DEFECTO,
                 format_func=lambda x: TIPO_CUPO[x],
                 key="tipos_cupo",
                 help="Seleccione uno o más tipos de cupo"
@@ -264,7 +437,7 @@ try:
         
         # Filtro de fechas
         fecha_fin = datetime.now()
-        fecha_inicio = fecha_fin - timedelta(days=30)
+        fecha_inicio = fecha_fin - timedelta(days=DIAS_POR_DEFECTO)
         
         with col1:
             fecha_inicio_selected = st.date_input(
@@ -283,288 +456,280 @@ try:
         # Agregar una línea divisoria
         st.markdown("---")
 
-    # Construir el dominio de búsqueda
-    domain = [
-        ("date_order", ">=", f"{fecha_inicio_selected} 00:00:00"),
-        ("date_order", "<=", f"{fecha_fin_selected} 23:59:59"),
-        ("invoice_status", "in", estado_facturacion)
-    ]
-
-    # Agregar filtro de agencia solo si no es "Todos"
-    if agencia_seleccionada != 0:
-        domain.append(("team_id", "=", agencia_seleccionada))
+    # El dominio (fechas, estado de facturación, agencia) se arma por mes en load_orders_rango;
+    # el filtro de Tipo de Cupo ya está incluido en la parte superior de la página
 
-    # El filtro de Tipo de Cupo ya está incluido en la parte superior de la página
+    # Calcular fechas del año anterior (siempre definidas)
+    fecha_inicio_prev = fecha_inicio_selected.replace(year=fecha_inicio_selected.year - 1)
+    fecha_fin_prev = fecha_fin_selected.replace(year=fecha_fin_selected.year - 1)
 
     # Campos a obtener
-    fields = [
-        'name',           # Número de orden
-        'partner_id',     # Cliente
-        'date_order',     # Fecha de orden
-        'invoice_status', # Estado de facturación
-        'amount_total',   # Monto total
-        'currency_id',    # Moneda
-        'user_id',        # Usuario
-        'team_id',        # Equipo de ventas
-        'order_line',     # Líneas de orden
-    ]
-
-    progress_text = "Operación en progreso. Por favor, espere..."
-    progress_bar = st.progress(0, text=progress_text)
+    fields = CAMPOS_ORDEN
+
+    # Firma de la consulta efectiva: si no cambia, se reutiliza el último resultado
+    filtro_signature = (
+        str(fecha_inicio_selected),
+        str(fecha_fin_selected),
+        tuple(sorted(estado_facturacion)),
+        agencia_seleccionada,
+        tuple(sorted(tipos_cupo_seleccionados)),
+        comparar_año_anterior,
+    )
 
-    with st.spinner('Cargando órdenes del año actual...'):
-        # Cargar datos del año actual
-        orders_data, resumen_agencias = load_orders_data(odoo, domain, fields, tipos_cupo_seleccionados)
-        progress_bar.progress(50, text="Datos del año actual cargados...")
-        
-        # Cargar datos del año anterior si está habilitada la comparación
-        orders_data_prev = []
-        resumen_agencias_prev = {}
-        
-        # Calcular fechas del año anterior (siempre definidas)
+    # Los cambios de filtros se acumulan: solo se consulta Odoo al aplicar
+    aplicar_button = st.button("Aplicar filtros", type="primary")
+
+    resultado = st.session_state.venta_agencia_result
+    filtros = None
+    if resultado is None or (aplicar_button and resultado['signature'] != filtro_signature):
+        filtros = {
+            'signature': filtro_signature,
+            'fecha_inicio': fecha_inicio_selected,
+            'fecha_fin': fecha_fin_selected,
+            'estado_facturacion': estado_facturacion,
+            'agencia': agencia_seleccionada,
+            'tipos_cupo': tipos_cupo_seleccionados,
+            'comparar': comparar_año_anterior,
+        }
+    elif st.session_state.venta_agencia_recargar:
+        # Los meses mostrados se refrescaron: se vuelven a armar con los filtros aplicados
+        filtros = resultado['filtros']
+    st.session_state.venta_agencia_recargar = False
+
+    if filtros is not None:
+        fecha_inicio_selected = filtros['fecha_inicio']
+        fecha_fin_selected = filtros['fecha_fin']
+        estado_facturacion = filtros['estado_facturacion']
+        agencia_seleccionada = filtros['agencia']
+        tipos_cupo_seleccionados = filtros['tipos_cupo']
+        comparar_año_anterior = filtros['comparar']
         fecha_inicio_prev = fecha_inicio_selected.replace(year=fecha_inicio_selected.year - 1)
         fecha_fin_prev = fecha_fin_selected.replace(year=fecha_fin_selected.year - 1)
-        
+
+        progress_text = "Operación en progreso. Por favor, espere..."
+        progress_bar = st.progress(0, text=progress_text)
+
+        with st.spinner('Cargando órdenes del año actual...'):
+            # Cargar datos del año actual
+            orders_data, resumen_agencias, totales, cargado, particiones = load_orders_rango(
+                odoo, fecha_inicio_selected, fecha_fin_selected, estado_facturacion,
+                agencia_seleccionada, fields, tipos_cupo_seleccionados, antiguedad_maxima=ANTIGUEDAD_MAXIMA
+            )
+            progress_bar.progress(50, text="Datos del año actual cargados...")
+
+            # Cargar datos del año anterior si está habilitada la comparación
+            orders_data_prev = []
+            resumen_agencias_prev = {}
+            totales_prev = {}
+
+            if comparar_año_anterior:
+                with st.spinner('Cargando órdenes del año anterior...'):
+                    orders_data_prev, resumen_agencias_prev, totales_prev, cargado_prev, particiones_prev = load_orders_rango(
+                        odoo, fecha_inicio_prev, fecha_fin_prev, estado_facturacion,
+                        agencia_seleccionada, fields, tipos_cupo_seleccionados, antiguedad_maxima=ANTIGUEDAD_MAXIMA
+                    )
+                    cargado = min(filter(None, [cargado, cargado_prev]), default=None)
+                    particiones = particiones + particiones_prev
+                    progress_bar.progress(75, text="Datos del año anterior cargados...")
+
+            progress_bar.progress(100, text="¡Completado!")
+
+        st.session_state.venta_agencia_result = resultado = {
+            'signature': filtros['signature'],
+            'filtros': filtros,
+            'orders_data': orders_data,
+            'resumen_agencias': resumen_agencias,
+            'totales': totales,
+            'orders_data_prev': orders_data_prev,
+            'resumen_agencias_prev': resumen_agencias_prev,
+            'totales_prev': totales_prev,
+            'fecha_inicio': fecha_inicio_selected,
+            'fecha_fin': fecha_fin_selected,
+            'comparar': comparar_año_anterior,
+            'cargado': cargado,
+            'particiones': particiones,
+        }
+
+    if resultado['signature'] != filtro_signature:
+        st.warning('Los filtros cambiaron. Presiona "Aplicar filtros" para actualizar los resultados.')
+
+    # Antigüedad de los datos; si sus meses se están refrescando, el resultado se vuelve a armar
+    # al terminar con los mismos filtros aplicados
+    mostrar_antiguedad(
+        'venta_agencia',
+        resultado['cargado'],
+        al_actualizar=lambda: st.session_state.update(venta_agencia_recargar=True),
+        claves=resultado['particiones']
+    )
+
+    # Mostrar el resultado con los filtros con que se consultó
+    orders_data = resultado['orders_data']
+    resumen_agencias = resultado['resumen_agencias']
+    totales = resultado['totales']
+    orders_data_prev = resultado['orders_data_prev']
+    resumen_agencias_prev = resultado['resumen_agencias_prev']
+    totales_prev = resultado['totales_prev']
+    fecha_inicio_selected = resultado['fecha_inicio']
+    fecha_fin_selected = resultado['fecha_fin']
+    comparar_año_anterior = resultado['comparar']
+    fecha_inicio_prev = fecha_inicio_selected.replace(year=fecha_inicio_selected.year - 1)
+    fecha_fin_prev = fecha_fin_selected.replace(year=fecha_fin_selected.year - 1)
+
+    if orders_data or orders_data_prev:
+
+        # Calcular métricas globales del año actual (totales diarios precalculados)
+        total_ordenes = len(orders_data)
+        total_pasajeros = totales['Cantidad']
+        total_comisiones = totales['Comision']
+        total_ventas = totales['Total']
+
+        # Calcular métricas del año anterior si está habilitada la comparación
         if comparar_año_anterior:
+            total_ordenes_prev = len(orders_data_prev)
+            total_pasajeros_prev = totales_prev['Cantidad']
+            total_comisiones_prev = totales_prev['Comision']
+            total_ventas_prev = totales_prev['Total']
             
-            # Crear dominio para el año anterior
-            domain_prev = [
-                ("date_order", ">=", f"{fecha_inicio_prev} 00:00:00"),
-                ("date_order", "<=", f"{fecha_fin_prev} 23:59:59"),
-                ("invoice_status", "in", estado_facturacion)
-            ]
-            
-            # Agregar filtro de agencia si no es "Todos"
-            if agencia_seleccionada != 0:
-                domain_prev.append(("team_id", "=", agencia_seleccionada))
-            
-            with st.spinner('Cargando órdenes del año anterior...'):
-                orders_data_prev, resumen_agencias_prev = load_orders_data(odoo, domain_prev, fields, tipos_cupo_seleccionados)
-                progress_bar.progress(75, text="Datos del año anterior cargados...")
+            # Calcular diferencias
+            delta_ordenes = total_ordenes - total_ordenes_prev
+            delta_pasajeros = total_pasajeros - total_pasajeros_prev
+            delta_comisiones = total_comisiones - total_comisiones_prev
+            delta_ventas = total_ventas - total_ventas_prev
+        else:
+            delta_ordenes = delta_pasajeros = delta_comisiones = delta_ventas = None
+
+        # Mostrar métricas en fila
+        periodo_actual = f"{fecha_inicio_selected.strftime('%Y-%m-%d')} a {fecha_fin_selected.strftime('%Y-%m-%d')}"
+        if comparar_año_anterior:
+            st.write(f"### Resumen General - Comparación Anual")
+            st.write(f"**Período Actual:** {periodo_actual}")
+            st.write(f"**Período Anterior:** {fecha_inicio_prev.strftime('%Y-%m-%d')} a {fecha_fin_prev.strftime('%Y-%m-%d')}")
+        else:
+            st.write(f"### Resumen General - {periodo_actual}")
         
-        progress_bar.progress(100, text="¡Completado!")
+        col1, col2, col3, col4 = st.columns(4)
 
-        if orders_data or orders_data_prev:
+        with col1:
+            st.metric(
+                label="Total Órdenes",
+                value=format_currency(total_ordenes, 0),
+                delta=f"{delta_ordenes:+}" if delta_ordenes is not None else None
+            )
 
-            # Calcular métricas globales del año actual
-            total_ordenes = len(orders_data)
-            total_pasajeros = sum(resumen['Total Pasajeros'] for resumen in resumen_agencias.values())
-            total_comisiones = sum(resumen['Total Comisiones'] for resumen in resumen_agencias.values())
-            total_ventas = sum(resumen['Total Vendido'] for resumen in resumen_agencias.values())
+        with col2:
+            st.metric(
+                label="Total Pasajeros",
+                value=format_currency(total_pasajeros, 0),
+                delta=f"{delta_pasajeros:+}" if delta_pasajeros is not None else None
+            )
 
-            # Calcular métricas del año anterior si está habilitada la comparación
-            if comparar_año_anterior:
-                total_ordenes_prev = len(orders_data_prev)
-                total_pasajeros_prev = sum(resumen['Total Pasajeros'] for resumen in resumen_agencias_prev.values())
-                total_comisiones_prev = sum(resumen['Total Comisiones'] for resumen in resumen_agencias_prev.values())
-                total_ventas_prev = sum(resumen['Total Vendido'] for resumen in resumen_agencias_prev.values())
-                
-                # Calcular diferencias
-                delta_ordenes = total_ordenes - total_ordenes_prev
-                delta_pasajeros = total_pasajeros - total_pasajeros_prev
-                delta_comisiones = total_comisiones - total_comisiones_prev
-                delta_ventas = total_ventas - total_ventas_prev
-            else:
-                delta_ordenes = delta_pasajeros = delta_comisiones = delta_ventas = None
-
-            # Mostrar métricas en fila
-            periodo_actual = f"{fecha_inicio_selected.strftime('%Y-%m-%d')} a {fecha_fin_selected.strftime('%Y-%m-%d')}"
-            if comparar_año_anterior:
-                st.write(f"### Resumen General - Comparación Anual")
-                st.write(f"**Período Actual:** {periodo_actual}")
-                st.write(f"**Período Anterior:** {fecha_inicio_prev.strftime('%Y-%m-%d')} a {fecha_fin_prev.strftime('%Y-%m-%d')}")
-            else:
-                st.write(f"### Resumen General - {periodo_actual}")
-            
-            col1, col2, col3, col4 = st.columns(4)
-
-            with col1:
-                st.metric(
-                    label="Total Órdenes",
-                    value=format_currency(total_ordenes, 0),
-                    delta=f"{delta_ordenes:+}" if delta_ordenes is not None else None
-                )
-
-            with col2:
-                st.metric(
-                    label="Total Pasajeros",
-                    value=format_currency(total_pasajeros, 0),
-                    delta=f"{delta_pasajeros:+}" if delta_pasajeros is not None else None
-                )
-
-            with col3:
-                st.metric(
-                    label="Total Comisiones",
-                    value=f"CLP {format_currency(total_comisiones, 0)}",
-                    delta=f"{delta_comisiones:+,.0f}" if delta_comisiones is not None else None
-                )
-
-            with col4:
-                st.metric(
-                    label="Total Ventas",
-                    value=f"CLP {format_currency(total_ventas, 0)}",
-                    delta=f"{delta_ventas:+,.0f}" if delta_ventas is not None else None
-                )
-
-            # Agregar un separador
-            st.markdown("---")
-
-            # Continuar con el resto del código...
-            
-            # Tabla de resumen por agencia
-            st.subheader("Resumen por Agencia")
-            
-            if comparar_año_anterior and resumen_agencias_prev:
-                # Crear DataFrame combinado para comparación
-                df_actual = pd.DataFrame(list(resumen_agencias.values()))
-                df_anterior = pd.DataFrame(list(resumen_agencias_prev.values()))
-                
-                # Renombrar columnas para identificar el año
-                df_actual = df_actual.rename(columns={
-                    'Total Órdenes': f'Órdenes {fecha_inicio_selected.year}',
-                    'Total Pasajeros': f'Pasajeros {fecha_inicio_selected.year}',
-                    'Total Comisiones': f'Comisiones {fecha_inicio_selected.year}',
-                    'Total Vendido': f'Vendido {fecha_inicio_selected.year}'
-                })
-                
-                df_anterior = df_anterior.rename(columns={
-                    'Total Órdenes': f'Órdenes {fecha_inicio_prev.year}',
-                    'Total Pasajeros': f'Pasajeros {fecha_inicio_prev.year}',
-                    'Total Comisiones': f'Comisiones {fecha_inicio_prev.year}',
-                    'Total Vendido': f'Vendido {fecha_inicio_prev.year}'
-                })
-                
-                # Combinar datos para mostrar lado a lado
-                df_combined = pd.merge(df_actual, df_anterior, on='Agencia', how='outer', suffixes=(f' {fecha_inicio_selected.year}', f' {fecha_inicio_prev.year}'))
-                df_combined = df_combined.fillna(0)
-                
-                # Calcular deltas
-                df_combined[f'Δ Órdenes'] = df_combined[f'Órdenes {fecha_inicio_selected.year}'] - df_combined[f'Órdenes {fecha_inicio_prev.year}']
-                df_combined[f'Δ Pasajeros'] = df_combined[f'Pasajeros {fecha_inicio_selected.year}'] - df_combined[f'Pasajeros {fecha_inicio_prev.year}']
-                df_combined[f'Δ Comisiones'] = df_combined[f'Comisiones {fecha_inicio_selected.year}'] - df_combined[f'Comisiones {fecha_inicio_prev.year}']
-                df_combined[f'Δ Vendido'] = df_combined[f'Vendido {fecha_inicio_selected.year}'] - df_combined[f'Vendido {fecha_inicio_prev.year}']
-                
-                # Crear copia para descarga (valores numéricos)
-                df_resumen_download = df_combined.copy()
-                
-                # Crear copia para visualización (con formato CLP)
-                df_resumen = df_combined.copy()
-                for col in df_resumen.columns:
-                    if 'Comisiones' in col or 'Vendido' in col:
-                        df_resumen[col] = df_resumen[col].apply(lambda x: f"CLP {format_currency(x, 0)}")
-                
-            else:
-                # Tabla normal sin comparación
-                df_resumen_base = pd.DataFrame(list(resumen_agencias.values()))
-                
-                # Crear copia para descarga (valores numéricos)
-                df_resumen_download = df_resumen_base.copy()
-                
-                # Crear copia para visualización (con formato CLP)
-                df_resumen = df_resumen_base.copy()
-                df_resumen['Total Comisiones'] = df_resumen['Total Comisiones'].apply(lambda x: f"CLP {format_currency(x, 0)}")
-                df_resumen['Total Vendido'] = df_resumen['Total Vendido'].apply(lambda x: f"CLP {format_currency(x, 0)}")
-
-            # Botón para descargar resumen en Excel
-            filename = "resumen_agencias_comparacion.xlsx" if comparar_año_anterior else "resumen_agencias.xlsx"
-            st.download_button(
-                label="📥 Descargar Resumen por Agencia (Excel)",
-                data=to_excel(df_resumen_download, 'Resumen Agencias'),
-                file_name=filename,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        with col3:
+            st.metric(
+                label="Total Comisiones",
+                value=f"CLP {format_currency(total_comisiones, 0)}",
+                delta=f"{delta_comisiones:+,.0f}" if delta_comisiones is not None else None
             )
 
-            # Mostrar tabla de resumen con selección
-            selected_rows = st.data_editor(
-                df_resumen,
-                use_container_width=True,
-                disabled=True,
-                key="resumen_table"
+        with col4:
+            st.metric(
+                label="Total Ventas",
+                value=f"CLP {format_currency(total_ventas, 0)}",
+                delta=f"{delta_ventas:+,.0f}" if delta_ventas is not None else None
             )
 
-            # Crear DataFrame de órdenes
-            st.subheader("Órdenes")
+        # Agregar un separador
+        st.markdown("---")
+
+        # Continuar con el resto del código...
+        
+        # Tabla de resumen por agencia
+        st.subheader("Resumen por Agencia")
+        
+        if comparar_año_anterior and resumen_agencias_prev:
+            # Crear DataFrame combinado para comparación
+            df_actual = pd.DataFrame(list(resumen_agencias.values()))
+            df_anterior = pd.DataFrame(list(resumen_agencias_prev.values()))
             
-            # Combinar órdenes del año actual y anterior si está habilitada la comparación
-            all_orders_data = orders_data.copy()
+            # Renombrar columnas para identificar el año
+            df_actual = df_actual.rename(columns={
+                'Total Órdenes': f'Órdenes {fecha_inicio_selected.year}',
+                'Total Pasajeros': f'Pasajeros {fecha_inicio_selected.year}',
+                'Total Comisiones': f'Comisiones {fecha_inicio_selected.year}',
+                'Total Vendido': f'Vendido {fecha_inicio_selected.year}'
+            })
             
-            if comparar_año_anterior and orders_data_prev:
-                # Agregar columna de año para identificar las órdenes
-                for order in all_orders_data:
-                    order['Año'] = fecha_inicio_selected.year
-                
-                orders_prev_with_year = orders_data_prev.copy()
-                for order in orders_prev_with_year:
-                    order['Año'] = fecha_inicio_prev.year
-                
-                # Combinar todas las órdenes
-                all_orders_data.extend(orders_prev_with_year)
+            df_anterior = df_anterior.rename(columns={
+                'Total Órdenes': f'Órdenes {fecha_inicio_prev.year}',
+                'Total Pasajeros': f'Pasajeros {fecha_inicio_prev.year}',
+                'Total Comisiones': f'Comisiones {fecha_inicio_prev.year}',
+                'Total Vendido': f'Vendido {fecha_inicio_prev.year}'
+            })
             
-            df_orders = pd.DataFrame(all_orders_data)
-
-            if df_orders.empty:
-                st.warning("No hay órdenes para mostrar con los filtros seleccionados")
-            else:
-                # Crear DataFrame para descarga (valores numéricos)
-                df_orders_download = pd.DataFrame(all_orders_data)
-                if 'ID' in df_orders_download.columns:
-                    df_orders_download = df_orders_download.drop('ID', axis=1)
-                
-                # Crear DataFrame para mostrar (con formato CLP)
-                df_orders_display = pd.DataFrame(all_orders_data)
-                
-                # Formatear columnas monetarias para visualización
-                if 'Comision' in df_orders_display.columns:
-                    df_orders_display['Comision'] = df_orders_display['Comision'].apply(
-                        lambda x: f"CLP {format_currency(float(x), 0)}" if pd.notna(x) else "CLP 0"
-                    )
+            # Combinar datos para mostrar lado a lado
+            df_combined = pd.merge(df_actual, df_anterior, on='Agencia', how='outer', suffixes=(f' {fecha_inicio_selected.year}', f' {fecha_inicio_prev.year}'))
+            df_combined = df_combined.fillna(0)
+            
+            # Calcular deltas
+            df_combined[f'Δ Órdenes'] = df_combined[f'Órdenes {fecha_inicio_selected.year}'] - df_combined[f'Órdenes {fecha_inicio_prev.year}']
+            df_combined[f'Δ Pasajeros'] = df_combined[f'Pasajeros {fecha_inicio_selected.year}'] - df_combined[f'Pasajeros {fecha_inicio_prev.year}']
+            df_combined[f'Δ Comisiones'] = df_combined[f'Comisiones {fecha_inicio_selected.year}'] - df_combined[f'Comisiones {fecha_inicio_prev.year}']
+            df_combined[f'Δ Vendido'] = df_combined[f'Vendido {fecha_inicio_selected.year}'] - df_combined[f'Vendido {fecha_inicio_prev.year}']
+            
+            # Valores numéricos para visualización y descarga (formato CLP vía column_config)
+            df_resumen = df_combined
+            formatos_resumen = {col: 'clp' for col in df_resumen.columns if 'Comisiones' in col or 'Vendido' in col}
+            
+        else:
+            # Tabla normal sin comparación
+            # Valores numéricos para visualización y descarga (formato CLP vía column_config)
+            df_resumen = pd.DataFrame(list(resumen_agencias.values()))
+            formatos_resumen = {'Total Comisiones': 'clp', 'Total Vendido': 'clp'}
+
+        # Tabla de resumen y su exportación (fragmento independiente)
+        filename = "resumen_agencias_comparacion.xlsx" if comparar_año_anterior else "resumen_agencias.xlsx"
+        version_datos = (resultado['signature'], resultado['cargado'])
+        seccion_resumen_agencias(df_resumen, formatos_resumen, filename, version_datos)
+
+        # Crear DataFrame de órdenes
+        st.subheader("Órdenes")
+        
+        # Combinar órdenes del año actual y anterior si está habilitada la comparación
+        all_orders_data = orders_data.copy()
+        
+        if comparar_año_anterior and orders_data_prev:
+            # Agregar columna de año para identificar las órdenes (copias: el resultado se reutiliza)
+            all_orders_data = [dict(order, Año=fecha_inicio_selected.year) for order in orders_data]
+            
+            orders_prev_with_year = [dict(order, Año=fecha_inicio_prev.year) for order in orders_data_prev]
+            
+            # Combinar todas las órdenes
+            all_orders_data.extend(orders_prev_with_year)
+        
+        df_orders = pd.DataFrame(all_orders_data)
 
-                if 'Total' in df_orders_display.columns:
-                    df_orders_display['Total'] = df_orders_display['Total'].apply(
-                        lambda x: f"CLP {format_currency(float(x), 0)}" if pd.notna(x) else "CLP 0"
-                    )
-                
-                # Reordenar columnas para mostrar el año al principio si hay comparación
-                if comparar_año_anterior and 'Año' in df_orders_display.columns:
-                    cols = ['Año'] + [col for col in df_orders_display.columns if col != 'Año' and col != 'ID']
-                    df_orders_display = df_orders_display[cols]
-                    # También reordenar para descarga
-                    if 'Año' in df_orders_download.columns:
-                        cols_download = ['Año'] + [col for col in df_orders_download.columns if col != 'Año']
-                        df_orders_download = df_orders_download[cols_download]
-                else:
-                    # Remover columna ID para la visualización
-                    if 'ID' in df_orders_display.columns:
-                        df_orders_display = df_orders_display.drop('ID', axis=1)
-
-                # Botón para descargar órdenes en Excel
-                filename = "ordenes_comparacion.xlsx" if comparar_año_anterior else "ordenes.xlsx"
-                st.download_button(
-                    label="📥 Descargar Órdenes (Excel)",
-                    data=to_excel(df_orders_download, 'Órdenes'),
-                    file_name=filename,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-
-                # Mostrar tabla de órdenes
-                selected_order = st.data_editor(
-                    df_orders_display,
-                    use_container_width=True,
-                    disabled=True,
-                    key="orders_table"
-                )
-                
-                # Mostrar información adicional
-                if comparar_año_anterior:
-                    ordenes_actuales = len([o for o in all_orders_data if o.get('Año') == fecha_inicio_selected.year])
-                    ordenes_anteriores = len([o for o in all_orders_data if o.get('Año') == fecha_inicio_prev.year])
-                    st.info(f"Mostrando {ordenes_actuales} órdenes de {fecha_inicio_selected.year} y {ordenes_anteriores} órdenes de {fecha_inicio_prev.year}")
-                else:
-                    st.info(f"Mostrando {len(df_orders_display)} órdenes del período seleccionado")
+        if df_orders.empty:
+            st.warning("No hay órdenes para mostrar con los filtros seleccionados")
+        else:
+            # Montos numéricos (formato CLP vía column_config)
+            for col in ['Comision', 'Total']:
+                if col in df_orders.columns:
+                    df_orders[col] = pd.to_numeric(df_orders[col], errors='coerce').fillna(0)
+            
+            # Reordenar columnas para mostrar el año al principio si hay comparación
+            if comparar_año_anterior and 'Año' in df_orders.columns:
+                df_orders = df_orders[['Año'] + [col for col in df_orders.columns if col != 'Año']]
+
+            filename = "ordenes_comparacion.xlsx" if comparar_año_anterior else "ordenes.xlsx"
+            # Sin órdenes del año anterior no hay columna 'Año': se muestra como un solo período
+            anios = (
+                (fecha_inicio_selected.year, fecha_inicio_prev.year)
+                if comparar_año_anterior and 'Año' in df_orders.columns else None
+            )
+            seccion_ordenes(df_orders, filename, version_datos, anios)
 
 
-        else:
-            st.info("No se encontraron órdenes de venta con los filtros seleccionados")
+    else:
+        st.info("No se encontraron órdenes de venta con los filtros seleccionados")
 
 except Exception as e:
     st.error(f"Error: {str(e)}")
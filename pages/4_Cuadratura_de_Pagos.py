@@ -4,8 +4,6 @@ import streamlit as st
 st.set_page_config(page_title="Cuadratura de Pagos Conciliados", layout="wide")
 
 import pandas as pd
-import numpy as np
-import io
 import sys
 import os
 from datetime import datetime
@@ -26,33 +24,23 @@ if st.sidebar.button("Logout"):
 # Agregar la ruta del proyecto al path de Python
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from odoo_client import OdooClient
+from connection import get_odoo_client
+from catalog_store import CAMPOS_CUADRATURA, cargar_catalogo
+from staleness import antiguedad_maxima, mostrar_antiguedad
+from reconciliation import build_orders_and_payments, build_productos_cl_table, contexto_cuadratura
+from reconciliation_snapshot import cargar_snapshot, cuadratura_desde_snapshot, snapshot_cubre
+from results_cache import cargar_resultado, guardar_resultado, invalidar_resultados
+from reference_data import limpiar_referencias, mapear_estados
+from exports import FORMATOS_EXPORTACION, export_bundle, export_dataframe_to_excel
+from tables import mostrar_tabla, semaforo
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Mapeo de estados de paquete
-ESTADO_PAQUETE = {
-    0: 'Bloqueado',
-    1: 'Inactivo',
-    2: 'Pendiente',
-    3: 'Activo',
-    4: 'Validación',
-    5: 'Cerrado',
-    6: 'Rendido',
-    7: 'Liquidado',
-    8: 'Pre-confirmado',
-    9: 'Anulado',
-    10: 'Social'
-}
-
-INVOICE_STATUS = {
-    'upselling': 'Oportunidad de Venta Adicional',
-    'invoiced': 'Facturado',
-    'to invoice': 'Por Facturar',
-    'no': 'Nada que Facturar'
-}
+# Segundos que se muestra el catálogo vencido mientras se refresca (ver staleness.py);
+# más estricto que en Ocupación porque la cuadratura se usa para conciliar
+ANTIGUEDAD_MAXIMA = antiguedad_maxima('cuadratura', 600)
 
 # Funciones de utilidad
 def format_currency(value, decimals=0):
@@ -63,334 +51,6 @@ def format_currency(value, decimals=0):
         return value
 
 
-def export_dataframe_to_excel(df, filename, styler=None):
-    """Exporta un DataFrame a Excel y devuelve un botón de descarga"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        if styler is not None:
-            styler.to_excel(writer, index=False)
-        else:
-            df.to_excel(writer, index=False)
-
-    excel_data = output.getvalue()
-    return st.download_button(
-        label=f"📥 Exportar a Excel",
-        data=excel_data,
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-
-
-def safe_m2o_name(value):
-    if not value:
-        return ''
-    if isinstance(value, (list, tuple)) and len(value) >= 2:
-        return value[1]
-    return str(value)
-
-
-def get_first_existing_field(fields_meta, candidates):
-    for c in candidates:
-        if c in fields_meta:
-            return c
-    return None
-
-
-def safe_float(value, default=0.0):
-    try:
-        if value is None or (isinstance(value, float) and np.isnan(value)):
-            return float(default)
-        return float(value)
-    except Exception:
-        return float(default)
-
-
-def extract_payment_applications_via_reconcile(odoo, invoice_ids, invoices_dict, inv_state_field, payment_state_field):
-    """Construye detalle de pagos por factura usando conciliaciones (account.partial.reconcile).
-
-    Devuelve:
-    - df_payments: 1 fila por aplicación de pago a factura (monto aplicado)
-    - applied_by_invoice: dict invoice_id -> monto aplicado total
-    """
-
-    if not invoice_ids:
-        return pd.DataFrame(), {}
-
-    # Verificar disponibilidad del modelo
-    try:
-        pr_fields_meta = odoo.fields_get('account.partial.reconcile')
-    except Exception:
-        return pd.DataFrame(), {}
-
-    # 1) Obtener líneas de cuenta de las facturas (buscamos líneas receivable/payable)
-    aml_fields_meta = odoo.fields_get('account.move.line')
-    internal_type_field = get_first_existing_field(aml_fields_meta, ['account_internal_type', 'internal_type'])
-
-    aml_fields = ['id', 'move_id', 'date', 'name', 'partner_id', 'account_id', 'debit', 'credit', 'balance']
-    if internal_type_field:
-        aml_fields.append(internal_type_field)
-
-    invoice_lines = odoo.search_read(
-        'account.move.line',
-        domain=[('move_id', 'in', invoice_ids)],
-        fields=aml_fields
-    )
-
-    if not invoice_lines:
-        return pd.DataFrame(), {}
-
-    df_inv_lines = pd.DataFrame(invoice_lines)
-
-    # Filtrar receivable/payable si tenemos el campo
-    if internal_type_field and internal_type_field in df_inv_lines.columns:
-        df_inv_lines = df_inv_lines[df_inv_lines[internal_type_field].isin(['receivable', 'payable'])]
-
-    invoice_line_ids = df_inv_lines['id'].dropna().astype(int).unique().tolist()
-    if not invoice_line_ids:
-        return pd.DataFrame(), {}
-
-    # 2) Obtener conciliaciones parciales para esas líneas
-    pr_amount_field = get_first_existing_field(pr_fields_meta, ['amount', 'amount_currency'])
-    pr_fields = ['id', 'debit_move_id', 'credit_move_id']
-    if pr_amount_field and pr_amount_field not in pr_fields:
-        pr_fields.append(pr_amount_field)
-    if 'max_date' in pr_fields_meta:
-        pr_fields.append('max_date')
-    elif 'create_date' in pr_fields_meta:
-        pr_fields.append('create_date')
-
-    # En algunas instancias Odoo responde 400 si el dominio tiene demasiados IDs en el "in".
-    # Para evitarlo, consultamos en batches y unimos los resultados.
-    partials = []
-    # Batch más pequeño para evitar 400 por payload/domains grandes
-    batch_size = 50
-    any_batch_ok = False
-    for i in range(0, len(invoice_line_ids), batch_size):
-        batch_ids = invoice_line_ids[i:i + batch_size]
-        try:
-            batch_partials = odoo.search_read(
-                'account.partial.reconcile',
-                domain=['|', ('debit_move_id', 'in', batch_ids), ('credit_move_id', 'in', batch_ids)],
-                fields=pr_fields
-            )
-            any_batch_ok = True
-            if batch_partials:
-                partials.extend(batch_partials)
-        except Exception:
-            # Si un batch falla, continuamos con los otros (mejor "algo" que nada).
-            continue
-
-    # Si todos los batches fallaron, devolvemos vacío para que se use el fallback.
-    if not any_batch_ok:
-        return pd.DataFrame(), {}
-
-    # Deduplicar por id
-    if partials:
-        seen = set()
-        uniq = []
-        for r in partials:
-            rid = r.get('id')
-            if rid in seen:
-                continue
-            seen.add(rid)
-            uniq.append(r)
-        partials = uniq
-
-    if not partials:
-        return pd.DataFrame(), {}
-
-    df_pr = pd.DataFrame(partials)
-
-    # 3) Obtener todas las líneas involucradas (para resolver el "otro lado" = pago)
-    move_line_ids = set()
-    for _, r in df_pr.iterrows():
-        d = r.get('debit_move_id')
-        c = r.get('credit_move_id')
-        if isinstance(d, (list, tuple)) and d:
-            move_line_ids.add(int(d[0]))
-        if isinstance(c, (list, tuple)) and c:
-            move_line_ids.add(int(c[0]))
-
-    move_line_ids = sorted(move_line_ids)
-    if not move_line_ids:
-        return pd.DataFrame(), {}
-
-    involved_lines = odoo.search_read(
-        'account.move.line',
-        domain=[('id', 'in', move_line_ids)],
-        fields=aml_fields
-    )
-    df_lines = pd.DataFrame(involved_lines)
-    if df_lines.empty:
-        return pd.DataFrame(), {}
-
-    # Map line_id -> move_id
-    line_to_move = {}
-    line_to_partner = {}
-    line_to_date = {}
-    for _, row in df_lines.iterrows():
-        lid = int(row['id'])
-        mv = row.get('move_id')
-        line_to_move[lid] = mv[0] if isinstance(mv, (list, tuple)) and mv else None
-        line_to_partner[lid] = safe_m2o_name(row.get('partner_id'))
-        line_to_date[lid] = row.get('date')
-
-    # 4) Determinar para cada partial reconcile: invoice_line vs payment_line
-    invoice_line_id_set = set(invoice_line_ids)
-
-    pay_rows = []
-    applied_by_invoice = {}
-    for _, r in df_pr.iterrows():
-        d = r.get('debit_move_id')
-        c = r.get('credit_move_id')
-        d_id = int(d[0]) if isinstance(d, (list, tuple)) and d else None
-        c_id = int(c[0]) if isinstance(c, (list, tuple)) and c else None
-        if not d_id or not c_id:
-            continue
-
-        amount_applied = safe_float(r.get(pr_amount_field)) if pr_amount_field else 0.0
-        if amount_applied == 0.0:
-            continue
-
-        # Caso A: debit es factura, credit es pago
-        if d_id in invoice_line_id_set:
-            invoice_move_id = line_to_move.get(d_id)
-            payment_move_id = line_to_move.get(c_id)
-        # Caso B: credit es factura, debit es pago
-        elif c_id in invoice_line_id_set:
-            invoice_move_id = line_to_move.get(c_id)
-            payment_move_id = line_to_move.get(d_id)
-        else:
-            continue
-
-        if not invoice_move_id or invoice_move_id not in invoices_dict:
-            continue
-
-        inv = invoices_dict[invoice_move_id]
-
-        # Asegurar posted (por si el dict trae otros)
-        if inv_state_field and inv.get(inv_state_field) != 'posted':
-            continue
-
-        applied_by_invoice[invoice_move_id] = applied_by_invoice.get(invoice_move_id, 0.0) + amount_applied
-
-        pr_date = None
-        if 'max_date' in r and r.get('max_date'):
-            pr_date = r.get('max_date')
-        elif 'create_date' in r and r.get('create_date'):
-            pr_date = str(r.get('create_date'))
-
-        pay_rows.append({
-            'Factura ID': int(inv.get('id')),
-            'Factura': inv.get('name', ''),
-            'Factura Origen': inv.get('invoice_origin', ''),
-            'Estado Pago Factura': inv.get(payment_state_field, '') if payment_state_field else '',
-            'Pago Move ID': int(payment_move_id) if payment_move_id else None,
-            'Fecha Conciliación': pr_date,
-            'Monto Aplicado': float(amount_applied),
-            'Cliente': safe_m2o_name(inv.get('partner_id')),
-        })
-
-    df_payments = pd.DataFrame(pay_rows)
-
-    # 5) Enriquecer con account.payment si existe move_id
-    if not df_payments.empty and 'Pago Move ID' in df_payments.columns:
-        pay_fields_meta = odoo.fields_get('account.payment')
-        if 'move_id' in pay_fields_meta:
-            payment_move_ids = df_payments['Pago Move ID'].dropna().astype(int).unique().tolist()
-            if payment_move_ids:
-                payments = odoo.search_read(
-                    'account.payment',
-                    domain=[('move_id', 'in', payment_move_ids), ('state', '=', 'posted')],
-                    fields=['id', 'name', 'date', 'amount', 'ref', 'journal_id', 'move_id']
-                )
-
-                move_to_payment = {}
-                for p in payments:
-                    mv = p.get('move_id')
-                    mv_id = mv[0] if isinstance(mv, (list, tuple)) and mv else None
-                    if mv_id:
-                        move_to_payment[int(mv_id)] = p
-
-                df_payments['Pago ID'] = df_payments['Pago Move ID'].apply(
-                    lambda x: int(move_to_payment.get(int(x), {}).get('id')) if pd.notna(x) and int(x) in move_to_payment else None
-                )
-                df_payments['Pago'] = df_payments['Pago Move ID'].apply(
-                    lambda x: move_to_payment.get(int(x), {}).get('name', '') if pd.notna(x) and int(x) in move_to_payment else ''
-                )
-                df_payments['Fecha Pago'] = df_payments['Pago Move ID'].apply(
-                    lambda x: move_to_payment.get(int(x), {}).get('date', '') if pd.notna(x) and int(x) in move_to_payment else ''
-                )
-                df_payments['Monto Pago'] = df_payments['Pago Move ID'].apply(
-                    lambda x: safe_float(move_to_payment.get(int(x), {}).get('amount')) if pd.notna(x) and int(x) in move_to_payment else 0.0
-                )
-                df_payments['Diario'] = df_payments['Pago Move ID'].apply(
-                    lambda x: safe_m2o_name(move_to_payment.get(int(x), {}).get('journal_id')) if pd.notna(x) and int(x) in move_to_payment else ''
-                )
-                df_payments['Referencia'] = df_payments['Pago Move ID'].apply(
-                    lambda x: move_to_payment.get(int(x), {}).get('ref', '') if pd.notna(x) and int(x) in move_to_payment else ''
-                )
-
-    return df_payments, applied_by_invoice
-
-
-def build_productos_cl_table(odoo, template_ids, producto_prefix, codigo_cl_exacto=None):
-    products = odoo.search_read(
-        'product.product',
-        domain=[('product_tmpl_id', 'in', template_ids)],
-        fields=[
-            'id', 'default_code', 'name', 'product_tmpl_id',
-            'list_price',
-            'x_studio_lote', 'x_studio_destino', 'x_studio_transporte',
-            'x_studio_estado_viaje', 'x_studio_tipo_de_cupo',
-            'x_studio_ida_fecha_salida', 'x_studio_boletos_totales',
-            'x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf',
-            'x_studio_boletos_disponibles'
-        ]
-    )
-
-    if codigo_cl_exacto:
-        products = [p for p in products if str(p.get('default_code') or '') == str(codigo_cl_exacto)]
-
-    if not products:
-        return pd.DataFrame()
-
-    df = pd.DataFrame(products)
-
-    zeros = pd.Series([0] * len(df))
-
-    df['Plazas Totales'] = (df['x_studio_boletos_totales'] if 'x_studio_boletos_totales' in df.columns else zeros).apply(lambda x: safe_float(x, 0.0))
-    df['Plazas Reservadas'] = (df['x_studio_boletos_reservados'] if 'x_studio_boletos_reservados' in df.columns else zeros).apply(lambda x: safe_float(x, 0.0))
-    df['Plazas Pagadas'] = (df['x_product_count_pagados_stat_inf'] if 'x_product_count_pagados_stat_inf' in df.columns else zeros).apply(lambda x: safe_float(x, 0.0))
-    df['Plazas Disponibles'] = (df['x_studio_boletos_disponibles'] if 'x_studio_boletos_disponibles' in df.columns else zeros).apply(lambda x: safe_float(x, 0.0))
-
-    df['Monto'] = (df['list_price'] if 'list_price' in df.columns else zeros).apply(lambda x: safe_float(x, 0.0))
-    df['Total Pagado (CL)'] = df['Monto'] * df['Plazas Pagadas']
-
-    # Estado de paquete (traducido) + tipo de cupo
-    df['Estado de Paquete'] = df.get('x_studio_estado_viaje', '').apply(mapear_estado)
-    df['Tipo de Cupo'] = df.get('x_studio_tipo_de_cupo', '').astype(str)
-
-    # Formato fecha salida DD/MM/AAAA
-    fecha_source = df['x_studio_ida_fecha_salida'] if 'x_studio_ida_fecha_salida' in df.columns else pd.Series([None] * len(df))
-    fecha_dt = pd.to_datetime(fecha_source, errors='coerce')
-    df['Fecha Salida (fmt)'] = fecha_dt.dt.strftime('%d/%m/%Y')
-
-    df_out = df[[
-        'default_code', 'name', 'Estado de Paquete', 'Tipo de Cupo', 'x_studio_destino', 'x_studio_lote', 'x_studio_transporte',
-        'Fecha Salida (fmt)', 'Monto', 'Total Pagado (CL)',
-        'Plazas Totales', 'Plazas Pagadas', 'Plazas Reservadas', 'Plazas Disponibles'
-    ]].copy()
-
-    df_out.columns = [
-        'Código CL', 'Producto', 'Estado de Paquete', 'Tipo de Cupo', 'Destino', 'Lote', 'Transporte',
-        'Fecha Salida', 'Monto', 'Total Pagado (CL)',
-        'Plazas Totales', 'Plazas Pagadas', 'Plazas Reservadas', 'Plazas Disponibles'
-    ]
-
-    return df_out
-
-
 def format_date_ddmmyyyy(series):
     dt = pd.to_datetime(series, errors='coerce')
     return dt.dt.strftime('%d/%m/%Y')
@@ -401,321 +61,263 @@ def format_datetime_ddmmyyyy(series):
     return dt.dt.strftime('%d/%m/%Y')
 
 
-def style_orders(df):
-    def row_style(row):
-        estado_fact = str(row.get('Estado Facturación Orden') or '').strip().lower()
-        saldo = safe_float(row.get('Saldo Adeudado (posted)') or 0.0, 0.0)
-        if saldo > 0:
-            return ['background-color: #fff3cd'] * len(row)
-        if estado_fact == 'nada que facturar':
-            return ['background-color: #f8d7da'] * len(row)
-        if estado_fact == 'por facturar':
-            return ['background-color: #e7f1ff'] * len(row)
-        return [''] * len(row)
-
-    return df.style.apply(row_style, axis=1)
+def colores_orders(df):
+    """CSS por fila de la vista de órdenes: saldo pendiente, nada que facturar, por facturar."""
+    estado_fact = df.get('Estado Facturación Orden', pd.Series('', index=df.index)).astype(str).str.strip().str.lower()
+    saldo = df.get('Saldo Adeudado (posted)', pd.Series(0.0, index=df.index))
+    return semaforo(
+        [saldo > 0, estado_fact == 'nada que facturar', estado_fact == 'por facturar'],
+        ['background-color: #fff3cd', 'background-color: #f8d7da', 'background-color: #e7f1ff'],
+    )
 
 
-def style_productos_cl_descuadre(df):
-    def row_style(row):
-        diff = safe_float(row.get('Diferencia (CL - Facturado)') or 0.0, 0.0)
-        if abs(diff) > 0.0001:
-            return ['background-color: #f8d7da'] * len(row)
-        return [''] * len(row)
+def colores_productos_cl_descuadre(df):
+    """CSS por fila de la vista de productos CL: descuadre entre lo pagado en CL y lo facturado."""
+    diff = df.get('Diferencia (CL - Facturado)', pd.Series(0.0, index=df.index))
+    return semaforo([diff.abs() > 0.0001], ['background-color: #f8d7da'])
+
+
+def colores_payments(df):
+    """CSS por fila de la vista de pagos: facturas con pago parcial."""
+    estado = df.get('Estado Pago Factura', pd.Series('', index=df.index)).astype(str).str.strip().str.lower()
+    return semaforo([estado.str.contains('partial', regex=False)], ['background-color: #fff3cd'])
+
+
+@st.fragment
+def seccion_exportacion_masiva(df_orders, df_payments, df_productos_cl, version):
+    """Exportación de todas las tablas en un .zip (el cambio de formato solo reejecuta esta sección)."""
+    # Exportación masiva: las tablas tipadas (sin formato de vista) en un solo archivo
+    with st.expander('Exportación masiva (Parquet / CSV)'):
+        formatos_masivos = {FORMATOS_EXPORTACION[f][0]: f for f in ['parquet', 'csv.gz']}
+        formato_masivo = formatos_masivos[st.radio(
+            'Formato',
+            options=list(formatos_masivos),
+            horizontal=True,
+            key='cuadratura_formato_masivo'
+        )]
+        tablas_masivas = {
+            nombre: df for nombre, df in [
+                ('ordenes', df_orders),
+                ('pagos', df_payments),
+                ('productos_cl', df_productos_cl),
+            ] if df is not None and not df.empty
+        }
+        if tablas_masivas:
+            export_bundle(tablas_masivas, 'cuadratura', formato=formato_masivo, version=version)
+        else:
+            st.caption('No hay datos para exportar.')
 
-    return df.style.apply(row_style, axis=1)
 
+@st.fragment
+def seccion_productos_cl(df_productos_cl, df_facturado_por_cl, version):
+    """Detalle de Productos CL con su exportación."""
+    st.subheader('Productos CL (detalle)')
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        if df_productos_cl is not None and not df_productos_cl.empty:
+            df_productos_xlsx = df_productos_cl.copy()
+            if df_facturado_por_cl is not None and not df_facturado_por_cl.empty:
+                df_productos_xlsx = df_productos_xlsx.merge(df_facturado_por_cl, how='left', on='Código CL')
+                df_productos_xlsx['Facturado (posted)'] = df_productos_xlsx['Facturado (posted)'].fillna(0.0)
+                df_productos_xlsx['Diferencia (CL - Facturado)'] = df_productos_xlsx['Total Pagado (CL)'] - df_productos_xlsx['Facturado (posted)']
 
-def style_payments(df):
-    def row_style(row):
-        estado = str(row.get('Estado Pago Factura') or '').strip().lower()
-        if 'partial' in estado:
-            return ['background-color: #fff3cd'] * len(row)
-        return [''] * len(row)
+            export_dataframe_to_excel(df_productos_xlsx, 'cuadratura_productos_cl.xlsx', colores_fila=colores_productos_cl_descuadre, version=version)
 
-    return df.style.apply(row_style, axis=1)
+    if df_productos_cl is None or df_productos_cl.empty:
+        st.warning('No se encontraron Productos CL con los filtros seleccionados')
+    else:
+        df_productos_view = df_productos_cl.copy()
+        if df_facturado_por_cl is not None and not df_facturado_por_cl.empty:
+            df_productos_view = df_productos_view.merge(df_facturado_por_cl, how='left', on='Código CL')
+            df_productos_view['Facturado (posted)'] = df_productos_view['Facturado (posted)'].fillna(0.0)
+            df_productos_view['Diferencia (CL - Facturado)'] = df_productos_view['Total Pagado (CL)'] - df_productos_view['Facturado (posted)']
 
+        if 'Diferencia (CL - Facturado)' in df_productos_view.columns:
+            st.markdown(
+                """
+                <div style="display:flex; gap:16px; align-items:center; flex-wrap:wrap;">
+                  <div><span style="display:inline-block;width:14px;height:14px;background:#f8d7da;border:1px solid #ccc;margin-right:6px;"></span>CL con descuadre (Total Pagado CL != Facturado posted asignado)</div>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
 
-def mapear_estado(estado):
-    if pd.isna(estado):
-        return 'No definido'
-    try:
-        if isinstance(estado, (int, float)):
-            return ESTADO_PAQUETE.get(int(estado), f'Estado {int(estado)}')
-        if isinstance(estado, str) and estado.isdigit():
-            return ESTADO_PAQUETE.get(int(estado), f'Estado {estado}')
-        return str(estado)
-    except Exception:
-        return f'Estado {estado}' if pd.notna(estado) else 'No definido'
-
-
-def build_orders_and_payments(odoo, template_ids, producto_prefix, codigo_cl_exacto=None):
-    """Obtiene órdenes que contengan productos CL (por prefix) y construye tabla de órdenes + pagos."""
-
-    # 1) Productos (variantes) para identificar los IDs vendidos
-    products = odoo.search_read(
-        'product.product',
-        domain=[('product_tmpl_id', 'in', template_ids)],
-        fields=['id', 'default_code', 'name', 'product_tmpl_id']
-    )
+        resumen_productos = pd.DataFrame([
+            {
+                'Productos CL': int(len(df_productos_cl)),
+                'Total pagado desde CL': float(df_productos_cl['Total Pagado (CL)'].sum()),
+                'Plazas Totales': float(df_productos_cl['Plazas Totales'].sum()),
+                'Plazas Pagadas': float(df_productos_cl['Plazas Pagadas'].sum()),
+                'Plazas Reservadas': float(df_productos_cl['Plazas Reservadas'].sum()),
+                'Plazas Disponibles': float(df_productos_cl['Plazas Disponibles'].sum()),
+            }
+        ])
+        mostrar_tabla(resumen_productos, formatos={
+            'Total pagado desde CL': 'moneda',
+            'Plazas Totales': 'entero',
+            'Plazas Pagadas': 'entero',
+            'Plazas Reservadas': 'entero',
+            'Plazas Disponibles': 'entero',
+        })
 
-    if codigo_cl_exacto:
-        products = [p for p in products if str(p.get('default_code') or '') == str(codigo_cl_exacto)]
+        mostrar_tabla(df_productos_view, formatos={
+            'Monto': 'moneda',
+            'Total Pagado (CL)': 'moneda',
+            'Facturado (posted)': 'moneda',
+            'Diferencia (CL - Facturado)': 'moneda',
+            'Plazas Totales': 'entero',
+            'Plazas Pagadas': 'entero',
+            'Plazas Reservadas': 'entero',
+            'Plazas Disponibles': 'entero',
+        }, colores_fila=colores_productos_cl_descuadre(df_productos_view))
+
+
+@st.fragment
+def seccion_ordenes(df_orders, version):
+    """Indicadores, detalle y exportación de las órdenes."""
+    st.subheader('Órdenes (Productos CL)')
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        if not df_orders.empty:
+            df_orders_xlsx = df_orders.copy()
+            if 'Fecha Orden' in df_orders_xlsx.columns:
+                df_orders_xlsx['Fecha Orden'] = format_datetime_ddmmyyyy(df_orders_xlsx['Fecha Orden'])
+            export_dataframe_to_excel(df_orders_xlsx, 'cuadratura_ordenes_cl.xlsx', colores_fila=colores_orders, version=version)
 
-    product_ids = [p['id'] for p in products]
-    products_dict = {p['id']: p for p in products}
+    if not df_orders.empty:
+        # Indicadores de estado de órdenes
+        df_tmp = df_orders
 
-    if not product_ids:
-        return pd.DataFrame(), pd.DataFrame(), {
-            'total_pagado': 0,
-            'total_saldo': 0,
-            'total_facturado_posted': 0,
-        }
+        ordenes_canceladas = int((df_tmp['Estado de Orden'].isin(['cancel'])).sum())
+        ordenes_pagadas = int(((df_tmp['Saldo Adeudado (posted)'] <= 0) & (df_tmp['Facturado (posted)'] > 0) & (~df_tmp['Estado de Orden'].isin(['cancel']))).sum())
+        ordenes_por_pagar = int(((df_tmp['Saldo Adeudado (posted)'] > 0) & (~df_tmp['Estado de Orden'].isin(['cancel']))).sum())
 
-    # 2) Líneas de orden (acá se define la población: todas las órdenes que contienen esos productos)
-    order_lines = odoo.search_read(
-        'sale.order.line',
-        domain=[('product_id', 'in', product_ids)],
-        fields=['id', 'order_id', 'product_id', 'product_uom_qty', 'price_subtotal', 'name']
-    )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric('Órdenes pagadas (por saldo factura)', f"{ordenes_pagadas:,}".replace(',', '.'))
+        with col2:
+            st.metric('Órdenes canceladas/anuladas (state=cancel)', f"{ordenes_canceladas:,}".replace(',', '.'))
+        with col3:
+            st.metric('Órdenes por pagar (saldo > 0)', f"{ordenes_por_pagar:,}".replace(',', '.'))
 
-    if not order_lines:
-        return pd.DataFrame(), pd.DataFrame(), {
-            'total_pagado': 0,
-            'total_saldo': 0,
-            'total_facturado_posted': 0,
-        }
+    if df_orders.empty:
+        st.warning('No hay órdenes para mostrar con los filtros seleccionados')
+    else:
+        st.markdown(
+            """
+            <div style="display:flex; gap:16px; align-items:center; flex-wrap:wrap;">
+              <div><span style="display:inline-block;width:14px;height:14px;background:#f8d7da;border:1px solid #ccc;margin-right:6px;"></span>Nada que facturar</div>
+              <div><span style="display:inline-block;width:14px;height:14px;background:#e7f1ff;border:1px solid #ccc;margin-right:6px;"></span>Por facturar</div>
+              <div><span style="display:inline-block;width:14px;height:14px;background:#fff3cd;border:1px solid #ccc;margin-right:6px;"></span>Saldo adeudado (facturas posted)</div>
+            </div>
+            """,
+            unsafe_allow_html=True,
+        )
 
-    order_ids = sorted({l['order_id'][0] for l in order_lines if l.get('order_id')})
+        df_orders_view = df_orders.copy()
+        if 'Fecha Orden' in df_orders_view.columns:
+            df_orders_view['Fecha Orden'] = format_datetime_ddmmyyyy(df_orders_view['Fecha Orden'])
 
-    # 3) Órdenes
-    order_fields = [
-        'id', 'name', 'partner_id', 'date_order', 'amount_total',
-        'invoice_status', 'user_id', 'team_id', 'state'
-    ]
+        # Resumen de montos en tabla
+        resumen_ordenes = pd.DataFrame([
+            {
+                'Facturado (posted)': float(df_orders['Facturado (posted)'].sum()),
+                'Pagado (posted)': float(df_orders['Pagado (posted)'].sum()),
+                'Saldo Adeudado (posted)': float(df_orders['Saldo Adeudado (posted)'].sum()),
+                'Órdenes': int(len(df_orders))
+            }
+        ])
+        mostrar_tabla(resumen_ordenes, formatos={
+            'Facturado (posted)': 'moneda',
+            'Pagado (posted)': 'moneda',
+            'Saldo Adeudado (posted)': 'moneda',
+        })
 
-    # Si existe invoice_ids, lo traemos (para enlazar facturas)
-    so_fields_meta = odoo.fields_get('sale.order')
-    if 'invoice_ids' in so_fields_meta:
-        order_fields.append('invoice_ids')
+        mostrar_tabla(df_orders_view, formatos={
+            'Subtotal Total (CL)': 'moneda',
+            'Facturado (posted)': 'moneda',
+            'Pagado (posted)': 'moneda',
+            'Saldo Adeudado (posted)': 'moneda',
+        }, colores_fila=colores_orders(df_orders_view))
 
-    orders = odoo.search_read(
-        'sale.order',
-        domain=[('id', 'in', order_ids)],
-        fields=order_fields
-    )
-    orders_dict = {o['id']: o for o in orders}
-
-    # 4) Facturas
-    invoice_ids = []
-    for o in orders:
-        invs = o.get('invoice_ids') or []
-        if invs:
-            invoice_ids.extend(invs)
-
-    invoice_ids = sorted(set(invoice_ids))
-
-    inv_fields_meta = odoo.fields_get('account.move')
-    inv_state_field = 'state' if 'state' in inv_fields_meta else None
-    payment_state_field = get_first_existing_field(inv_fields_meta, ['payment_state', 'invoice_payment_state'])
-
-    inv_fields = ['id', 'name', 'move_type', 'partner_id', 'invoice_origin', 'invoice_date', 'amount_total']
-    if inv_state_field:
-        inv_fields.append(inv_state_field)
-    if payment_state_field:
-        inv_fields.append(payment_state_field)
-    if 'amount_residual' in inv_fields_meta:
-        inv_fields.append('amount_residual')
-    if 'amount_total_signed' in inv_fields_meta:
-        inv_fields.append('amount_total_signed')
-    if 'currency_id' in inv_fields_meta:
-        inv_fields.append('currency_id')
-
-    invoices = []
-    if invoice_ids:
-        invoice_domain = [('id', 'in', invoice_ids), ('move_type', 'in', ['out_invoice', 'out_refund', 'out_receipt'])]
-        if inv_state_field:
-            invoice_domain.append((inv_state_field, '=', 'posted'))
-
-        invoices = odoo.search_read(
-            'account.move',
-            domain=invoice_domain,
-            fields=inv_fields
-        )
 
-    invoices_dict = {inv['id']: inv for inv in invoices}
-
-    # 5) Tabla de Órdenes (1 fila por orden) + agregados de facturas (posted)
-    lines_by_order = {}
-    for l in order_lines:
-        if not l.get('order_id'):
-            continue
-        oid = l['order_id'][0]
-        lines_by_order.setdefault(oid, []).append(l)
-
-    order_rows = []
-    cl_line_rows = []
-    for order_id, lines in lines_by_order.items():
-        o = orders_dict.get(order_id)
-        if not o:
-            continue
-
-        # Agregación de líneas CL
-        productos = []
-        codigos = []
-        cantidad_total = 0.0
-        subtotal_total = 0.0
-        for l in lines:
-            pid = l['product_id'][0] if l.get('product_id') else None
-            p = products_dict.get(pid, {}) if pid else {}
-            codigo = ''
-            if p:
-                codigo = p.get('default_code', '')
-            if p:
-                productos.append(p.get('name', ''))
-                codigos.append(codigo)
-            cantidad_total += float(l.get('product_uom_qty') or 0)
-            line_subtotal = float(l.get('price_subtotal') or 0)
-            subtotal_total += line_subtotal
-
-            if codigo:
-                cl_line_rows.append({
-                    'Orden': o.get('name', ''),
-                    'Código CL': codigo,
-                    'Subtotal Línea (CL)': line_subtotal,
-                })
-
-        productos = sorted({x for x in productos if x})
-        codigos = sorted({x for x in codigos if x})
-
-        order_invoice_ids = o.get('invoice_ids') or []
-        order_invoices = [invoices_dict[iid] for iid in order_invoice_ids if iid in invoices_dict]
-
-        total_facturado_posted = float(sum(float(inv.get('amount_total') or 0) for inv in order_invoices))
-        total_residual_posted = float(sum(float(inv.get('amount_residual') or 0) for inv in order_invoices))
-        total_pagado_posted = float(total_facturado_posted - total_residual_posted)
-
-        payment_states = []
-        if payment_state_field:
-            payment_states = sorted({str(inv.get(payment_state_field)) for inv in order_invoices if inv.get(payment_state_field) is not None})
-
-        order_rows.append({
-            'Orden': o.get('name', ''),
-            'Estado de Orden': o.get('state', ''),
-            'Cliente': safe_m2o_name(o.get('partner_id')),
-            'Fecha Orden': o.get('date_order', ''),
-            'Agencia': safe_m2o_name(o.get('team_id')),
-            'Vendedor': safe_m2o_name(o.get('user_id')),
-            'Estado Facturación Orden': INVOICE_STATUS.get(o.get('invoice_status'), o.get('invoice_status')),
-            'Códigos CL': ', '.join(codigos),
-            'Productos CL': ', '.join(productos),
-            'Cantidad Total (CL)': int(round(cantidad_total)),
-            'Subtotal Total (CL)': subtotal_total,
-            'Facturas (IDs)': ','.join(str(x) for x in order_invoice_ids) if order_invoice_ids else '',
-            'Facturado (posted)': total_facturado_posted,
-            'Pagado (posted)': total_pagado_posted,
-            'Saldo Adeudado (posted)': total_residual_posted,
-            'Estado Pago Factura (posted)': ', '.join(payment_states) if payment_states else ''
-        })
+@st.fragment
+def seccion_pagos(df_payments, df_orders, version):
+    """Detalle de pagos conciliados con su exportación."""
+    st.subheader('Pagos (detalle por factura)')
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        if not df_payments.empty:
+            df_payments_xlsx = df_payments.copy()
+            if 'Factura Origen' in df_payments_xlsx.columns and 'Orden' in df_orders.columns:
+                df_map = df_orders[['Orden', 'Códigos CL']].drop_duplicates().copy()
+                df_payments_xlsx = df_payments_xlsx.merge(
+                    df_map,
+                    how='left',
+                    left_on='Factura Origen',
+                    right_on='Orden'
+                )
+                df_payments_xlsx = df_payments_xlsx.drop(columns=['Orden']).rename(columns={'Códigos CL': 'Código CL'})
 
-    df_orders = pd.DataFrame(order_rows)
+            for c in ['Fecha Conciliación', 'Fecha Pago']:
+                if c in df_payments_xlsx.columns:
+                    df_payments_xlsx[c] = format_datetime_ddmmyyyy(df_payments_xlsx[c])
 
-    # 5.b) Facturado (posted) asignado por Código CL (distribución proporcional por subtotal de líneas CL)
-    df_facturado_por_cl = pd.DataFrame(columns=['Código CL', 'Facturado (posted)'])
-    if cl_line_rows and not df_orders.empty:
-        df_cl_lines = pd.DataFrame(cl_line_rows)
-        df_ord_fact = df_orders[['Orden', 'Facturado (posted)']].copy()
-        df_ord_fact['Facturado (posted)'] = df_ord_fact['Facturado (posted)'].apply(lambda x: safe_float(x, 0.0))
+            export_dataframe_to_excel(df_payments_xlsx, 'cuadratura_pagos.xlsx', colores_fila=colores_payments, version=version)
 
-        df_cl_lines['Subtotal Línea (CL)'] = df_cl_lines['Subtotal Línea (CL)'].apply(lambda x: safe_float(x, 0.0))
-        df_cl_tot = (
-            df_cl_lines.groupby('Orden', as_index=False)
-            .agg({'Subtotal Línea (CL)': 'sum'})
-            .rename(columns={'Subtotal Línea (CL)': 'Subtotal Orden (CL)'})
+    if df_payments.empty:
+        st.info(
+            "No se encontraron pagos conciliados para las facturas filtradas. "
+            "Si esperabas pagos, revisa que existan conciliaciones en las líneas de cuentas (receivable/payable)."
+        )
+    else:
+        st.markdown(
+            """
+            <div style="display:flex; gap:16px; align-items:center; flex-wrap:wrap;">
+              <div><span style="display:inline-block;width:14px;height:14px;background:#fff3cd;border:1px solid #ccc;margin-right:6px;"></span>Factura con pago parcial (partial)</div>
+            </div>
+            """,
+            unsafe_allow_html=True,
         )
-        df_cl_tot = df_cl_tot.merge(df_ord_fact, on='Orden', how='left')
-
-        df_cl_lines = df_cl_lines.merge(df_cl_tot[['Orden', 'Subtotal Orden (CL)', 'Facturado (posted)']], on='Orden', how='left')
-        df_cl_lines['Subtotal Orden (CL)'] = df_cl_lines['Subtotal Orden (CL)'].apply(lambda x: safe_float(x, 0.0))
-        df_cl_lines['Facturado (posted)'] = df_cl_lines['Facturado (posted)'].apply(lambda x: safe_float(x, 0.0))
 
-        def asignar_facturado(row):
-            denom = safe_float(row.get('Subtotal Orden (CL)') or 0.0, 0.0)
-            if denom <= 0:
-                return 0.0
-            return safe_float(row.get('Facturado (posted)') or 0.0, 0.0) * (safe_float(row.get('Subtotal Línea (CL)') or 0.0, 0.0) / denom)
+        df_payments_view = df_payments.copy()
+        if 'Factura Origen' in df_payments_view.columns and 'Orden' in df_orders.columns:
+            df_map = df_orders[['Orden', 'Códigos CL']].drop_duplicates().copy()
+            df_payments_view = df_payments_view.merge(
+                df_map,
+                how='left',
+                left_on='Factura Origen',
+                right_on='Orden'
+            )
+            df_payments_view = df_payments_view.drop(columns=['Orden']).rename(columns={'Códigos CL': 'Código CL'})
 
-        df_cl_lines['Facturado (posted) asignado'] = df_cl_lines.apply(asignar_facturado, axis=1)
-        df_facturado_por_cl = df_cl_lines.groupby('Código CL', as_index=False)['Facturado (posted) asignado'].sum().rename(
-            columns={'Facturado (posted) asignado': 'Facturado (posted)'}
-        )
+        for c in ['Fecha Conciliación', 'Fecha Pago']:
+            if c in df_payments_view.columns:
+                df_payments_view[c] = format_datetime_ddmmyyyy(df_payments_view[c])
 
-    # 6) Tabla de pagos (por conciliación): soporta pagos parciales y pagos repartidos
-    df_payments, applied_by_invoice = extract_payment_applications_via_reconcile(
-        odoo,
-        invoice_ids=invoice_ids,
-        invoices_dict=invoices_dict,
-        inv_state_field=inv_state_field,
-        payment_state_field=payment_state_field,
-    )
+        resumen_pagos = pd.DataFrame([
+            {
+                'Monto Total Pagos (únicos)': float(df_payments.drop_duplicates(subset=['Pago ID'])['Monto Pago'].sum()) if 'Pago ID' in df_payments.columns else float(df_payments['Monto Pago'].sum()),
+                'Monto Total Aplicado (detalle)': float(df_payments['Monto Aplicado'].sum()) if 'Monto Aplicado' in df_payments.columns else 0.0,
+                'Monto Aplicado a Facturas Parciales': float(df_payments.loc[df_payments.get('Estado Pago Factura', '').astype(str).str.lower().isin(['partial']), 'Monto Aplicado'].sum()) if 'Monto Aplicado' in df_payments.columns else 0.0,
+                'Cantidad de Pagos (filas)': int(len(df_payments))
+            }
+        ])
 
-    # Fallback (si no hay conciliaciones disponibles) a la vía estándar (menos precisa)
-    if df_payments.empty:
-        pay_fields_meta = odoo.fields_get('account.payment')
-        if invoice_ids and 'reconciled_invoice_ids' in pay_fields_meta:
-            pay_fields = ['id', 'name', 'date', 'amount', 'payment_type', 'partner_id', 'ref', 'journal_id', 'reconciled_invoice_ids', 'state']
-            payments = odoo.search_read(
-                'account.payment',
-                domain=[('reconciled_invoice_ids', 'in', invoice_ids), ('state', '=', 'posted')],
-                fields=pay_fields
-            )
+        st.caption(
+            "Leyenda: 'Monto Total Pagos (únicos)' suma el MONTO TOTAL de cada pago (account.payment) una sola vez (deduplicado por Pago ID). "
+            "'Monto Total Aplicado (detalle)' suma el MONTO EFECTIVAMENTE APLICADO a las facturas del reporte (conciliaciones account.partial.reconcile), por lo que puede ser menor si parte del pago quedó como anticipo/no aplicado o se aplicó a facturas fuera del filtro."
+        )
+        mostrar_tabla(resumen_pagos, formatos={
+            'Monto Total Pagos (únicos)': 'moneda',
+            'Monto Total Aplicado (detalle)': 'moneda',
+            'Monto Aplicado a Facturas Parciales': 'moneda',
+        })
 
-            pay_rows = []
-            for p in payments:
-                for inv_id in p.get('reconciled_invoice_ids') or []:
-                    if inv_id not in invoices_dict:
-                        continue
-                    inv = invoices_dict[inv_id]
-                    if inv_state_field and inv.get(inv_state_field) != 'posted':
-                        continue
-                    pay_rows.append({
-                        'Pago ID': int(p.get('id')),
-                        'Pago': p.get('name', ''),
-                        'Fecha Pago': p.get('date', ''),
-                        'Cliente': safe_m2o_name(p.get('partner_id')),
-                        'Diario': safe_m2o_name(p.get('journal_id')),
-                        'Monto Pago': float(p.get('amount') or 0),
-                        'Referencia': p.get('ref', ''),
-                        'Factura ID': int(inv.get('id')),
-                        'Factura': inv.get('name', ''),
-                        'Factura Origen': inv.get('invoice_origin', ''),
-                        'Estado Pago Factura': inv.get(payment_state_field, '') if payment_state_field else '',
-                        'Monto Aplicado': float(p.get('amount') or 0),
-                    })
-            df_payments = pd.DataFrame(pay_rows)
-
-    total_pagos_unicos = 0.0
-    if not df_payments.empty and 'Pago ID' in df_payments.columns:
-        total_pagos_unicos = float(df_payments.drop_duplicates(subset=['Pago ID'])['Monto Pago'].sum())
-
-    total_aplicado = float(df_payments['Monto Aplicado'].sum()) if (not df_payments.empty and 'Monto Aplicado' in df_payments.columns) else 0.0
-    total_pagado_facturas = float(df_orders['Pagado (posted)'].sum()) if not df_orders.empty else 0.0
-    gap_aplicado_vs_factura = float(total_aplicado - total_pagado_facturas)
-
-    total_plazas = float(df_orders['Cantidad Total (CL)'].sum()) if (not df_orders.empty and 'Cantidad Total (CL)' in df_orders.columns) else 0.0
-
-    totals = {
-        'total_pagado': float(df_orders['Pagado (posted)'].sum()) if not df_orders.empty else 0,
-        'total_saldo': float(df_orders['Saldo Adeudado (posted)'].sum()) if not df_orders.empty else 0,
-        'total_facturado_posted': float(df_orders['Facturado (posted)'].sum()) if not df_orders.empty else 0,
-        'total_pagos_detalle': float(df_payments['Monto Pago'].sum()) if not df_payments.empty else 0,
-        'total_pagos_unicos': total_pagos_unicos,
-        'total_aplicado': total_aplicado,
-        'gap_aplicado_vs_pagado_factura': gap_aplicado_vs_factura,
-        'total_plazas': total_plazas,
-    }
-
-    return df_orders, df_payments, totals, df_facturado_por_cl
+        mostrar_tabla(df_payments_view, formatos={
+            'Monto Pago': 'moneda',
+            'Monto Aplicado': 'moneda',
+        }, colores_fila=colores_payments(df_payments_view))
 
 
 # Título de la página
@@ -728,25 +330,19 @@ if 'cuadratura_result' not in st.session_state:
     st.session_state.cuadratura_result = None
 
 try:
-    client = OdooClient()
-
-    # Obtener todos los paquetes (product.template) para replicar filtros de ocupación
-    templates = client.search_read(
-        'product.template',
-        domain=[],
-        fields=[
-            'id', 'name', 'default_code', 'x_studio_lote', 'x_studio_destino',
-            'x_studio_ida_fecha_salida', 'x_studio_tipo_de_cupo', 'x_studio_estado_viaje'
-        ]
-    )
+    client = get_odoo_client()
+
+    # Todos los paquetes (product.template) para replicar filtros de ocupación; en memoria
+    # compartida y refrescados en segundo plano (ver catalog_store.py)
+    df_templates = cargar_catalogo(client, campos=CAMPOS_CUADRATURA, antiguedad_maxima=ANTIGUEDAD_MAXIMA)
+    mostrar_antiguedad('catalogo', df_templates.attrs.get('cargado'))
 
-    df_templates = pd.DataFrame(templates)
     if df_templates.empty:
         st.warning("No se encontraron paquetes en Odoo")
         st.stop()
 
     df_templates['Estado de Paquete Codigo'] = df_templates['x_studio_estado_viaje']
-    df_templates['Estado de Paquete'] = df_templates['Estado de Paquete Codigo'].apply(mapear_estado)
+    df_templates['Estado de Paquete'] = mapear_estados(df_templates['Estado de Paquete Codigo'])
 
     st.subheader("Filtros")
     filtros_container = st.container()
@@ -764,7 +360,7 @@ try:
                 default=default_estados
             )
 
-            tipos_cupo_unicos = sorted(df_templates['x_studio_tipo_de_cupo'].dropna().astype(str).unique())
+            tipos_cupo_unicos = sorted(t for t in df_templates['x_studio_tipo_de_cupo'].unique() if t)
             tipos_cupo_seleccionados = st.multiselect(
                 "Tipo de Cupo",
                 options=tipos_cupo_unicos,
@@ -778,21 +374,21 @@ try:
             ).strip()
 
         with col2:
-            lotes_unicos = sorted(df_templates['x_studio_lote'].dropna().unique())
+            lotes_unicos = sorted(lote for lote in df_templates['x_studio_lote'].unique() if lote)
             lote_seleccionado = st.selectbox(
                 "Lote",
                 options=["Todos"] + list(lotes_unicos),
                 index=0
             )
 
-            destinos_unicos = sorted(df_templates['x_studio_destino'].dropna().unique())
+            destinos_unicos = sorted(d for d in df_templates['x_studio_destino'].unique() if d)
             destinos_seleccionados = st.multiselect(
                 "Destinos",
                 options=destinos_unicos,
                 default=[]
             )
 
-            fechas_salida = pd.to_datetime(df_templates['x_studio_ida_fecha_salida'], errors='coerce')
+            fechas_salida = df_templates['x_studio_ida_fecha_salida']
             meses_anio = []
             for fecha in fechas_salida.dropna():
                 mes_anio = fecha.strftime('%B %Y')
@@ -814,10 +410,20 @@ try:
     col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
     with col_btn1:
         limpiar_button = st.button("Limpiar")
+    with col_btn2:
+        consultar_en_vivo = st.checkbox(
+            "Consultar Odoo en vivo",
+            value=False,
+            help="Por defecto se usa la cuadratura precalculada de los paquetes activos (se actualiza durante el día). "
+                 "Los paquetes que no están en ella se consultan siempre en vivo."
+        )
     with col_btn3:
         buscar_button = st.button("Buscar", type="primary")
 
     if limpiar_button:
+        # También descarta los resultados compartidos con otras sesiones (ver results_cache.py)
+        invalidar_resultados('cuadratura')
+        limpiar_referencias()
         st.session_state.cuadratura_last_signature = None
         st.session_state.cuadratura_result = None
         st.rerun()
@@ -838,10 +444,8 @@ try:
         df_templates_filtrado = df_templates_filtrado[df_templates_filtrado['x_studio_destino'].isin(destinos_seleccionados)]
 
     if meses_anio_seleccionados:
-        temp = df_templates_filtrado.copy()
-        temp['fecha_temp'] = pd.to_datetime(temp['x_studio_ida_fecha_salida'], errors='coerce')
-        temp['mes_anio'] = temp['fecha_temp'].apply(lambda x: x.strftime('%B %Y') if pd.notna(x) else '')
-        df_templates_filtrado = temp[temp['mes_anio'].isin(meses_anio_seleccionados)].drop(['fecha_temp', 'mes_anio'], axis=1)
+        mes_anio = df_templates_filtrado['x_studio_ida_fecha_salida'].dt.strftime('%B %Y')
+        df_templates_filtrado = df_templates_filtrado[mes_anio.isin(meses_anio_seleccionados)]
 
     template_ids = df_templates_filtrado['id'].dropna().astype(int).unique().tolist()
 
@@ -849,7 +453,6 @@ try:
         st.warning("No se encontraron productos con los filtros seleccionados")
         st.stop()
 
-    producto_prefix = None
     codigo_cl_exacto = codigo_cl_filtro if codigo_cl_filtro else None
 
     # Firma de filtros para cachear resultados
@@ -863,19 +466,54 @@ try:
         tuple(sorted(template_ids)),
     )
 
-    if buscar_button:
-        with st.spinner('Cargando órdenes, facturas y pagos...'):
-            df_productos_cl = build_productos_cl_table(client, template_ids, producto_prefix, codigo_cl_exacto=codigo_cl_exacto)
-            df_orders, df_payments, totals, df_facturado_por_cl = build_orders_and_payments(client, template_ids, producto_prefix, codigo_cl_exacto=codigo_cl_exacto)
-
-        st.session_state.cuadratura_last_signature = filtro_signature
-        st.session_state.cuadratura_result = {
-            'df_productos_cl': df_productos_cl,
-            'df_orders': df_orders,
-            'df_payments': df_payments,
-            'totals': totals,
-            'df_facturado_por_cl': df_facturado_por_cl,
-        }
+    sin_resultado = (
+        st.session_state.cuadratura_result is None
+        or st.session_state.cuadratura_last_signature != filtro_signature
+    )
+    if buscar_button or sin_resultado:
+        # Versión de los datos: la actualización del snapshot si cubre los paquetes elegidos; si no,
+        # el resultado es de una consulta en vivo y se reutiliza por ANTIGUEDAD_MAXIMA segundos
+        snapshot = None if consultar_en_vivo else cargar_snapshot()
+        en_vivo = not snapshot_cubre(snapshot, template_ids)
+        if en_vivo:
+            version, ttl = 'vivo', ANTIGUEDAD_MAXIMA
+        else:
+            version, ttl = ('snapshot', snapshot['actualizado']), None
+
+        # Resultado ya armado por cualquier sesión con los mismos filtros y datos (ver results_cache.py).
+        # Buscar con una consulta en vivo siempre relee Odoo (solo los cambios, ver reconciliation.py)
+        guardado = None
+        if not (buscar_button and en_vivo):
+            guardado = cargar_resultado('cuadratura', filtro_signature, version, ttl=ttl)
+
+        if guardado is None and buscar_button:
+            # Cuadratura precalculada (ver reconciliation_snapshot.py) si cubre todos los paquetes elegidos
+            resultado = cuadratura_desde_snapshot(snapshot, template_ids, codigo_cl_exacto=codigo_cl_exacto)
+            if resultado is not None:
+                df_productos_cl, df_orders, df_payments, totals, df_facturado_por_cl = resultado
+                actualizado = snapshot['actualizado']
+            else:
+                with st.spinner('Cargando órdenes, facturas y pagos...'):
+                    # Las variantes de los paquetes se leen una sola vez para ambas tablas
+                    contexto = contexto_cuadratura(client, template_ids)
+                    df_productos_cl = build_productos_cl_table(client, template_ids, codigo_cl_exacto=codigo_cl_exacto, contexto=contexto)
+                    df_orders, df_payments, totals, df_facturado_por_cl = build_orders_and_payments(client, template_ids, codigo_cl_exacto=codigo_cl_exacto, contexto=contexto)
+                actualizado = None
+
+            resultado = {
+                'df_productos_cl': df_productos_cl,
+                'df_orders': df_orders,
+                'df_payments': df_payments,
+                'totals': totals,
+                'df_facturado_por_cl': df_facturado_por_cl,
+                'snapshot_actualizado': actualizado,
+            }
+            guardado = resultado, guardar_resultado('cuadratura', filtro_signature, version, resultado)
+
+        if guardado is not None:
+            resultado, consultado = guardado
+            st.session_state.cuadratura_last_signature = filtro_signature
+            st.session_state.cuadratura_result = dict(resultado, consultado=consultado)
 
     # Si no se ha presionado buscar (o cambió el filtro), no consultar
     if st.session_state.cuadratura_result is None:
@@ -891,6 +529,17 @@ try:
     df_payments = st.session_state.cuadratura_result['df_payments']
     totals = st.session_state.cuadratura_result['totals']
     df_facturado_por_cl = st.session_state.cuadratura_result.get('df_facturado_por_cl')
+    # Versión de los datos para las exportaciones: filtros aplicados y hora de la consulta
+    version_datos = (filtro_signature, st.session_state.cuadratura_result.get('consultado'))
+
+    snapshot_actualizado = st.session_state.cuadratura_result.get('snapshot_actualizado')
+    if snapshot_actualizado:
+        st.caption(
+            f"📦 Cuadratura precalculada, actualizada el {datetime.fromtimestamp(snapshot_actualizado).strftime('%d/%m/%Y %H:%M')}. "
+            "Marca \"Consultar Odoo en vivo\" para consultar ahora."
+        )
+    else:
+        mostrar_antiguedad('cuadratura', st.session_state.cuadratura_result.get('consultado'))
 
     total_productos_cl = int(len(df_productos_cl)) if df_productos_cl is not None and not df_productos_cl.empty else 0
     total_pagado_desde_cl = float(df_productos_cl['Total Pagado (CL)'].sum()) if df_productos_cl is not None and not df_productos_cl.empty else 0.0
@@ -898,14 +547,9 @@ try:
     plazas_pagadas = float(df_productos_cl['Plazas Pagadas'].sum()) if df_productos_cl is not None and not df_productos_cl.empty else 0.0
 
     # Clasificación de órdenes según facturas posted (por saldo)
-    df_orders_kpi = df_orders.copy() if df_orders is not None and not df_orders.empty else pd.DataFrame()
+    # Las columnas numéricas ya vienen tipadas desde build_orders_and_payments
+    df_orders_kpi = df_orders if df_orders is not None and not df_orders.empty else pd.DataFrame()
     if not df_orders_kpi.empty:
-        df_orders_kpi['Estado de Orden'] = df_orders_kpi.get('Estado de Orden', '').astype(str)
-        df_orders_kpi['Facturado (posted)'] = df_orders_kpi.get('Facturado (posted)', 0).apply(lambda x: safe_float(x, 0.0))
-        df_orders_kpi['Pagado (posted)'] = df_orders_kpi.get('Pagado (posted)', 0).apply(lambda x: safe_float(x, 0.0))
-        df_orders_kpi['Saldo Adeudado (posted)'] = df_orders_kpi.get('Saldo Adeudado (posted)', 0).apply(lambda x: safe_float(x, 0.0))
-        df_orders_kpi['Subtotal Total (CL)'] = df_orders_kpi.get('Subtotal Total (CL)', 0).apply(lambda x: safe_float(x, 0.0))
-
         active_mask = ~df_orders_kpi['Estado de Orden'].isin(['cancel'])
         paid_orders_mask = active_mask & (df_orders_kpi['Facturado (posted)'] > 0) & (df_orders_kpi['Saldo Adeudado (posted)'] <= 0)
         partial_orders_mask = active_mask & (df_orders_kpi['Facturado (posted)'] > 0) & (df_orders_kpi['Saldo Adeudado (posted)'] > 0)
@@ -926,11 +570,10 @@ try:
     monto_adeudado_posted = float(df_orders_kpi['Saldo Adeudado (posted)'].sum()) if not df_orders_kpi.empty else 0.0
 
     # Row 4 (pagos conciliados): separar por estado de pago de factura
-    df_pay_kpi = df_payments.copy() if df_payments is not None and not df_payments.empty else pd.DataFrame()
+    df_pay_kpi = df_payments if df_payments is not None and not df_payments.empty else pd.DataFrame()
     total_pagos_conciliados = 0.0
     total_pagos_conciliados_parciales = 0.0
     if not df_pay_kpi.empty and 'Monto Aplicado' in df_pay_kpi.columns:
-        df_pay_kpi['Monto Aplicado'] = df_pay_kpi['Monto Aplicado'].apply(lambda x: safe_float(x, 0.0))
         estado_pago = df_pay_kpi.get('Estado Pago Factura', '').astype(str).str.lower()
         paid_inv_mask = estado_pago.isin(['paid'])
         partial_inv_mask = estado_pago.isin(['partial'])
@@ -1022,221 +665,19 @@ try:
 
     st.markdown('---')
 
-    st.markdown('---')
-
-    st.subheader('Productos CL (detalle)')
-    col1, col2 = st.columns([3, 1])
-    with col2:
-        if df_productos_cl is not None and not df_productos_cl.empty:
-            df_productos_xlsx = df_productos_cl.copy()
-            if df_facturado_por_cl is not None and not df_facturado_por_cl.empty:
-                df_fact = df_facturado_por_cl.copy()
-                df_fact['Facturado (posted)'] = df_fact['Facturado (posted)'].apply(lambda x: safe_float(x, 0.0))
-                df_productos_xlsx['Total Pagado (CL)'] = df_productos_xlsx['Total Pagado (CL)'].apply(lambda x: safe_float(x, 0.0))
-                df_productos_xlsx = df_productos_xlsx.merge(df_fact, how='left', on='Código CL')
-                df_productos_xlsx['Facturado (posted)'] = df_productos_xlsx['Facturado (posted)'].fillna(0).apply(lambda x: safe_float(x, 0.0))
-                df_productos_xlsx['Diferencia (CL - Facturado)'] = df_productos_xlsx['Total Pagado (CL)'] - df_productos_xlsx['Facturado (posted)']
-
-            export_dataframe_to_excel(df_productos_xlsx, 'cuadratura_productos_cl.xlsx', styler=style_productos_cl_descuadre(df_productos_xlsx))
-
-    if df_productos_cl is None or df_productos_cl.empty:
-        st.warning('No se encontraron Productos CL con los filtros seleccionados')
-    else:
-        df_productos_view = df_productos_cl.copy()
-        if df_facturado_por_cl is not None and not df_facturado_por_cl.empty:
-            df_fact = df_facturado_por_cl.copy()
-            df_fact['Facturado (posted)'] = df_fact['Facturado (posted)'].apply(lambda x: safe_float(x, 0.0))
-            df_productos_view['Total Pagado (CL)'] = df_productos_view['Total Pagado (CL)'].apply(lambda x: safe_float(x, 0.0))
-            df_productos_view = df_productos_view.merge(df_fact, how='left', on='Código CL')
-            df_productos_view['Facturado (posted)'] = df_productos_view['Facturado (posted)'].fillna(0).apply(lambda x: safe_float(x, 0.0))
-            df_productos_view['Diferencia (CL - Facturado)'] = df_productos_view['Total Pagado (CL)'] - df_productos_view['Facturado (posted)']
-
-        if 'Diferencia (CL - Facturado)' in df_productos_view.columns:
-            st.markdown(
-                """
-                <div style="display:flex; gap:16px; align-items:center; flex-wrap:wrap;">
-                  <div><span style="display:inline-block;width:14px;height:14px;background:#f8d7da;border:1px solid #ccc;margin-right:6px;"></span>CL con descuadre (Total Pagado CL != Facturado posted asignado)</div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
-
-        resumen_productos = pd.DataFrame([
-            {
-                'Productos CL': int(len(df_productos_cl)),
-                'Total pagado desde CL': float(df_productos_cl['Total Pagado (CL)'].sum()),
-                'Plazas Totales': float(df_productos_cl['Plazas Totales'].sum()),
-                'Plazas Pagadas': float(df_productos_cl['Plazas Pagadas'].sum()),
-                'Plazas Reservadas': float(df_productos_cl['Plazas Reservadas'].sum()),
-                'Plazas Disponibles': float(df_productos_cl['Plazas Disponibles'].sum()),
-            }
-        ])
-        st.dataframe(resumen_productos.style.format({
-            'Total pagado desde CL': lambda x: format_currency(x),
-            'Plazas Totales': lambda x: f"{int(x):,}".replace(',', '.'),
-            'Plazas Pagadas': lambda x: f"{int(x):,}".replace(',', '.'),
-            'Plazas Reservadas': lambda x: f"{int(x):,}".replace(',', '.'),
-            'Plazas Disponibles': lambda x: f"{int(x):,}".replace(',', '.'),
-        }), hide_index=True, use_container_width=True)
-
-        styler_prod = style_productos_cl_descuadre(df_productos_view) if 'Diferencia (CL - Facturado)' in df_productos_view.columns else df_productos_view.style
-        st.dataframe(styler_prod.format({
-            'Monto': lambda x: format_currency(x),
-            'Total Pagado (CL)': lambda x: format_currency(x),
-            'Facturado (posted)': lambda x: format_currency(x),
-            'Diferencia (CL - Facturado)': lambda x: format_currency(x),
-            'Plazas Totales': lambda x: f"{int(x):,}".replace(',', '.'),
-            'Plazas Pagadas': lambda x: f"{int(x):,}".replace(',', '.'),
-            'Plazas Reservadas': lambda x: f"{int(x):,}".replace(',', '.'),
-            'Plazas Disponibles': lambda x: f"{int(x):,}".replace(',', '.'),
-        }), hide_index=True, use_container_width=True)
+    seccion_exportacion_masiva(df_orders, df_payments, df_productos_cl, version_datos)
 
     st.markdown('---')
 
-    st.subheader('Órdenes (Productos CL)')
-    col1, col2 = st.columns([3, 1])
-    with col2:
-        if not df_orders.empty:
-            df_orders_xlsx = df_orders.copy()
-            if 'Fecha Orden' in df_orders_xlsx.columns:
-                df_orders_xlsx['Fecha Orden'] = format_datetime_ddmmyyyy(df_orders_xlsx['Fecha Orden'])
-            export_dataframe_to_excel(df_orders_xlsx, 'cuadratura_ordenes_cl.xlsx', styler=style_orders(df_orders_xlsx))
-
-    if not df_orders.empty:
-        # Indicadores de estado de órdenes
-        df_tmp = df_orders.copy()
-        df_tmp['Estado de Orden'] = df_tmp.get('Estado de Orden', '').astype(str)
-        df_tmp['Saldo Adeudado (posted)'] = df_tmp.get('Saldo Adeudado (posted)', 0).apply(lambda x: safe_float(x, 0.0))
-        df_tmp['Facturado (posted)'] = df_tmp.get('Facturado (posted)', 0).apply(lambda x: safe_float(x, 0.0))
-
-        ordenes_canceladas = int((df_tmp['Estado de Orden'].isin(['cancel'])).sum())
-        ordenes_pagadas = int(((df_tmp['Saldo Adeudado (posted)'] <= 0) & (df_tmp['Facturado (posted)'] > 0) & (~df_tmp['Estado de Orden'].isin(['cancel']))).sum())
-        ordenes_por_pagar = int(((df_tmp['Saldo Adeudado (posted)'] > 0) & (~df_tmp['Estado de Orden'].isin(['cancel']))).sum())
-
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric('Órdenes pagadas (por saldo factura)', f"{ordenes_pagadas:,}".replace(',', '.'))
-        with col2:
-            st.metric('Órdenes canceladas/anuladas (state=cancel)', f"{ordenes_canceladas:,}".replace(',', '.'))
-        with col3:
-            st.metric('Órdenes por pagar (saldo > 0)', f"{ordenes_por_pagar:,}".replace(',', '.'))
-
-    if df_orders.empty:
-        st.warning('No hay órdenes para mostrar con los filtros seleccionados')
-    else:
-        st.markdown(
-            """
-            <div style="display:flex; gap:16px; align-items:center; flex-wrap:wrap;">
-              <div><span style="display:inline-block;width:14px;height:14px;background:#f8d7da;border:1px solid #ccc;margin-right:6px;"></span>Nada que facturar</div>
-              <div><span style="display:inline-block;width:14px;height:14px;background:#e7f1ff;border:1px solid #ccc;margin-right:6px;"></span>Por facturar</div>
-              <div><span style="display:inline-block;width:14px;height:14px;background:#fff3cd;border:1px solid #ccc;margin-right:6px;"></span>Saldo adeudado (facturas posted)</div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-
-        df_orders_view = df_orders.copy()
-        if 'Fecha Orden' in df_orders_view.columns:
-            df_orders_view['Fecha Orden'] = format_datetime_ddmmyyyy(df_orders_view['Fecha Orden'])
-
-        # Resumen de montos en tabla
-        resumen_ordenes = pd.DataFrame([
-            {
-                'Facturado (posted)': float(df_orders['Facturado (posted)'].sum()),
-                'Pagado (posted)': float(df_orders['Pagado (posted)'].sum()),
-                'Saldo Adeudado (posted)': float(df_orders['Saldo Adeudado (posted)'].sum()),
-                'Órdenes': int(len(df_orders))
-            }
-        ])
-        st.dataframe(resumen_ordenes.style.format({
-            'Facturado (posted)': lambda x: format_currency(x),
-            'Pagado (posted)': lambda x: format_currency(x),
-            'Saldo Adeudado (posted)': lambda x: format_currency(x)
-        }), hide_index=True, use_container_width=True)
-
-        st.dataframe(style_orders(df_orders_view).format({
-            'Subtotal Total (CL)': lambda x: format_currency(x),
-            'Facturado (posted)': lambda x: format_currency(x),
-            'Pagado (posted)': lambda x: format_currency(x),
-            'Saldo Adeudado (posted)': lambda x: format_currency(x)
-        }), hide_index=True, use_container_width=True)
+    seccion_productos_cl(df_productos_cl, df_facturado_por_cl, version_datos)
 
     st.markdown('---')
 
-    st.subheader('Pagos (detalle por factura)')
-    col1, col2 = st.columns([3, 1])
-    with col2:
-        if not df_payments.empty:
-            df_payments_xlsx = df_payments.copy()
-            if 'Factura Origen' in df_payments_xlsx.columns and 'Orden' in df_orders.columns:
-                df_map = df_orders[['Orden', 'Códigos CL']].drop_duplicates().copy()
-                df_payments_xlsx = df_payments_xlsx.merge(
-                    df_map,
-                    how='left',
-                    left_on='Factura Origen',
-                    right_on='Orden'
-                )
-                df_payments_xlsx = df_payments_xlsx.drop(columns=['Orden']).rename(columns={'Códigos CL': 'Código CL'})
-
-            for c in ['Fecha Conciliación', 'Fecha Pago']:
-                if c in df_payments_xlsx.columns:
-                    df_payments_xlsx[c] = format_datetime_ddmmyyyy(df_payments_xlsx[c])
-
-            export_dataframe_to_excel(df_payments_xlsx, 'cuadratura_pagos.xlsx', styler=style_payments(df_payments_xlsx))
+    seccion_ordenes(df_orders, version_datos)
 
-    if df_payments.empty:
-        st.info(
-            "No se encontraron pagos conciliados para las facturas filtradas. "
-            "Si esperabas pagos, revisa que existan conciliaciones en las líneas de cuentas (receivable/payable)."
-        )
-    else:
-        st.markdown(
-            """
-            <div style="display:flex; gap:16px; align-items:center; flex-wrap:wrap;">
-              <div><span style="display:inline-block;width:14px;height:14px;background:#fff3cd;border:1px solid #ccc;margin-right:6px;"></span>Factura con pago parcial (partial)</div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-
-        df_payments_view = df_payments.copy()
-        if 'Factura Origen' in df_payments_view.columns and 'Orden' in df_orders.columns:
-            df_map = df_orders[['Orden', 'Códigos CL']].drop_duplicates().copy()
-            df_payments_view = df_payments_view.merge(
-                df_map,
-                how='left',
-                left_on='Factura Origen',
-                right_on='Orden'
-            )
-            df_payments_view = df_payments_view.drop(columns=['Orden']).rename(columns={'Códigos CL': 'Código CL'})
-
-        for c in ['Fecha Conciliación', 'Fecha Pago']:
-            if c in df_payments_view.columns:
-                df_payments_view[c] = format_datetime_ddmmyyyy(df_payments_view[c])
-
-        resumen_pagos = pd.DataFrame([
-            {
-                'Monto Total Pagos (únicos)': float(df_payments.drop_duplicates(subset=['Pago ID'])['Monto Pago'].sum()) if 'Pago ID' in df_payments.columns else float(df_payments['Monto Pago'].sum()),
-                'Monto Total Aplicado (detalle)': float(df_payments['Monto Aplicado'].sum()) if 'Monto Aplicado' in df_payments.columns else 0.0,
-                'Monto Aplicado a Facturas Parciales': float(df_payments.loc[df_payments.get('Estado Pago Factura', '').astype(str).str.lower().isin(['partial']), 'Monto Aplicado'].sum()) if 'Monto Aplicado' in df_payments.columns else 0.0,
-                'Cantidad de Pagos (filas)': int(len(df_payments))
-            }
-        ])
+    st.markdown('---')
 
-        st.caption(
-            "Leyenda: 'Monto Total Pagos (únicos)' suma el MONTO TOTAL de cada pago (account.payment) una sola vez (deduplicado por Pago ID). "
-            "'Monto Total Aplicado (detalle)' suma el MONTO EFECTIVAMENTE APLICADO a las facturas del reporte (conciliaciones account.partial.reconcile), por lo que puede ser menor si parte del pago quedó como anticipo/no aplicado o se aplicó a facturas fuera del filtro."
-        )
-        st.dataframe(resumen_pagos.style.format({
-            'Monto Total Pagos (únicos)': lambda x: format_currency(x),
-            'Monto Total Aplicado (detalle)': lambda x: format_currency(x),
-            'Monto Aplicado a Facturas Parciales': lambda x: format_currency(x)
-        }), hide_index=True, use_container_width=True)
-
-        st.dataframe(style_payments(df_payments_view).format({
-            'Monto Pago': lambda x: format_currency(x),
-            'Monto Aplicado': lambda x: format_currency(x)
-        }), hide_index=True, use_container_width=True)
+    seccion_pagos(df_payments, df_orders, version_datos)
 
 except Exception as e:
     st.error(f"Error: {str(e)}")
@@ -0,0 +1,104 @@
+# period_cache.py
+"""Caché en disco de consultas sobre períodos cerrados (meses pasados, año anterior).
+
+Un período cuya fecha final es anterior al horizonte de cierre (`HORIZONTE_CIERRE_DIAS`, por
+defecto 45 días) prácticamente no cambia, así que su resultado se guarda en disco y se
+reutiliza entre sesiones y reinicios, sin vencimiento por tiempo. Solo el período abierto
+cuesta una consulta completa a Odoo.
+
+Antes de reutilizar un resultado se compara la firma de los registros vigilados: cantidad y
+write_date máximo, obtenidos con un read_group sin agrupación (una llamada liviana por modelo).
+Si algo se editó, se agregó o salió del dominio, la firma cambia y el período se vuelve a
+cargar. `invalidar_periodos()` descarta los resultados a mano.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from datetime import date, datetime, timedelta
+
+HORIZONTE_CIERRE_DIAS = int(os.getenv('HORIZONTE_CIERRE_DIAS', '45'))
+DIRECTORIO_PERIODOS = os.getenv(
+    'CACHE_PERIODOS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'periodos')
+)
+
+_LOCK = threading.Lock()
+
+
+def periodo_cerrado(fecha_fin, hoy=None):
+    """True si el período termina antes del horizonte de cierre."""
+    if isinstance(fecha_fin, datetime):
+        fecha_fin = fecha_fin.date()
+    hoy = hoy or date.today()
+    return fecha_fin < hoy - timedelta(days=HORIZONTE_CIERRE_DIAS)
+
+
+def _ruta(nombre, parametros):
+    huella = hashlib.sha1(repr((nombre, parametros)).encode('utf-8')).hexdigest()
+    return os.path.join(DIRECTORIO_PERIODOS, f"{nombre}-{huella}.pkl")
+
+
+def _firma(odoo, vigilados):
+    """(cantidad, write_date máximo) de cada (modelo, dominio) vigilado."""
+    firma = []
+    for model, domain in vigilados:
+        grupos = odoo.read_group(model, domain, ['write_date:max'], [], lazy=False)
+        grupo = grupos[0] if grupos else {}
+        firma.append((model, grupo.get('__count', 0), grupo.get('write_date') or False))
+    return tuple(firma)
+
+
+def leer_archivo(ruta):
+    """Contenido de un archivo pickle, o None si no existe o está dañado."""
+    try:
+        with open(ruta, 'rb') as archivo:
+            return pickle.load(archivo)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def escribir_archivo(ruta, entrada):
+    """Guarda `entrada` en un archivo pickle (escritura atómica: archivo temporal + reemplazo)."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        pickle.dump(entrada, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporal, ruta)
+
+
+def cargar_periodo(odoo, nombre, parametros, fecha_fin, vigilados, cargar):
+    """Resultado de `cargar()` para un período, desde disco si el período está cerrado.
+
+    - `parametros`: valores que identifican la consulta (fechas, filtros), con repr estable.
+    - `vigilados`: lista de (modelo, dominio) cuyos cambios invalidan el resultado.
+    - Si el período está abierto, o `cargar()` devuelve None (error), no se guarda nada.
+    """
+    if not periodo_cerrado(fecha_fin):
+        return cargar()
+
+    ruta = _ruta(nombre, parametros)
+    firma = _firma(odoo, vigilados)
+    entrada = leer_archivo(ruta)
+    if entrada is not None and entrada['firma'] == firma:
+        return entrada['datos']
+
+    # La firma se toma antes de cargar: un cambio durante la carga fuerza otra carga después
+    datos = cargar()
+    if datos is not None:
+        with _LOCK:
+            escribir_archivo(ruta, {'nombre': nombre, 'parametros': parametros, 'firma': firma, 'datos': datos})
+    return datos
+
+
+def invalidar_periodos(nombre=None):
+    """Borra del disco los períodos guardados (todos, o solo los de la consulta `nombre`)."""
+    if not os.path.isdir(DIRECTORIO_PERIODOS):
+        return 0
+    borrados = 0
+    with _LOCK:
+        for archivo in os.listdir(DIRECTORIO_PERIODOS):
+            if archivo.endswith('.pkl') and (nombre is None or archivo.startswith(f"{nombre}-")):
+                os.remove(os.path.join(DIRECTORIO_PERIODOS, archivo))
+                borrados += 1
+    return borrados
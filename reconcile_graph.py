@@ -0,0 +1,219 @@
+# reconcile_graph.py
+"""Índice en memoria de conciliaciones: líneas de asiento, asientos y conciliaciones parciales.
+
+Cada conciliación parcial (account.partial.reconcile) es una arista entre dos líneas de asiento
+(debit_move_id, credit_move_id). Las aristas se guardan en arreglos paralelos por posición y cada
+línea tiene su lista de adyacencia (posiciones de sus aristas); cada asiento, la lista de sus
+líneas. Así los vecinos de una línea salen en O(grado), sin recorrer todas las conciliaciones.
+
+El índice se actualiza incrementalmente: `agregar_lineas` suma líneas nuevas y
+`reemplazar_parciales` deja las conciliaciones vigentes de un grupo de líneas (agrega las nuevas y
+quita las que se deshicieron). Las posiciones de las conciliaciones quitadas quedan libres hasta
+que son más de la mitad; entonces los arreglos se compactan.
+
+`aplicaciones(linea)` sigue las conciliaciones de una línea de factura hasta los asientos que la
+saldaron. Los asientos marcados como terminales (pagos, facturas y notas de crédito, diferencias
+de cambio) cortan el recorrido; los intermedios expandidos (asientos varios que reclasifican o
+compensan saldos) se atraviesan por sus líneas de signo contrario, repartiendo el monto entre sus
+salidas en proporción a cada conciliación. Un pago repartido en varias facturas es una línea con
+varias aristas: cada factura recibe solo su parte.
+"""
+import threading
+
+MAX_SALTOS = 4
+
+
+class IndiceConciliacion:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.limpiar()
+
+    def __len__(self):
+        """Cantidad de líneas de asiento en el índice."""
+        return len(self._asiento)
+
+    def limpiar(self):
+        """Vacía el índice."""
+        with self._lock:
+            self._vaciar()
+
+    def _vaciar(self):
+        # Aristas: una posición por conciliación
+        self._parcial = []
+        self._debe = []
+        self._haber = []
+        self._monto = []
+        self._fecha = []
+        self._posiciones = {}   # id de conciliación -> posición
+        self._adyacencia = {}   # línea -> [posiciones vigentes]
+        self._huecos = 0        # posiciones de conciliaciones quitadas
+
+        # Nodos
+        self._asiento = {}      # línea -> asiento
+        self._saldo = {}        # línea -> balance (signo: debe > 0, haber < 0)
+        self._lineas = {}       # asiento -> [líneas]
+        self._terminales = set()
+        self._expandidos = set()
+
+    # --- Actualización -------------------------------------------------------------------
+
+    def agregar_lineas(self, df):
+        """Agrega líneas de asiento (columnas id, move_id, balance); las ya conocidas se ignoran."""
+        with self._lock:
+            for linea, asiento, saldo in zip(df['id'], df['move_id'], df['balance'], strict=True):
+                if linea is None or asiento is None or linea != linea or asiento != asiento:
+                    continue
+                linea, asiento = int(linea), int(asiento)
+                if linea in self._asiento:
+                    continue
+                self._asiento[linea] = asiento
+                self._saldo[linea] = float(saldo or 0.0)
+                self._lineas.setdefault(asiento, []).append(linea)
+
+    def reemplazar_parciales(self, lineas, df, columna_monto, columna_fecha):
+        """Conciliaciones vigentes de `lineas`: agrega o actualiza las de `df` y quita las demás.
+
+        `df` trae id, debit_move_id, credit_move_id y las columnas de monto y fecha.
+        """
+        with self._lock:
+            vigentes = set()
+            for parcial, debe, haber, monto, fecha in zip(
+                df['id'], df['debit_move_id'], df['credit_move_id'], df[columna_monto], df[columna_fecha],
+                strict=True
+            ):
+                parcial, debe, haber = int(parcial), int(debe), int(haber)
+                vigentes.add(parcial)
+                posicion = self._posiciones.get(parcial)
+                if posicion is None:
+                    posicion = len(self._parcial)
+                    self._posiciones[parcial] = posicion
+                    self._parcial.append(parcial)
+                    self._debe.append(debe)
+                    self._haber.append(haber)
+                    self._monto.append(float(monto or 0.0))
+                    self._fecha.append(fecha)
+                    self._adyacencia.setdefault(debe, []).append(posicion)
+                    self._adyacencia.setdefault(haber, []).append(posicion)
+                else:
+                    self._monto[posicion] = float(monto or 0.0)
+                    self._fecha[posicion] = fecha
+
+            for linea in lineas:
+                for posicion in list(self._adyacencia.get(linea, [])):
+                    if self._parcial[posicion] not in vigentes:
+                        self._quitar(posicion)
+            if self._huecos > len(self._parcial) // 2:
+                self._compactar()
+
+    def _quitar(self, posicion):
+        for linea in (self._debe[posicion], self._haber[posicion]):
+            adyacentes = self._adyacencia.get(linea, [])
+            if posicion in adyacentes:
+                adyacentes.remove(posicion)
+        del self._posiciones[self._parcial[posicion]]
+        self._huecos += 1
+
+    def _compactar(self):
+        """Reescribe las aristas sin las posiciones libres y renumera posiciones y adyacencias."""
+        vigentes = sorted(self._posiciones.values())
+        nueva = {anterior: posicion for posicion, anterior in enumerate(vigentes)}
+        self._parcial = [self._parcial[p] for p in vigentes]
+        self._debe = [self._debe[p] for p in vigentes]
+        self._haber = [self._haber[p] for p in vigentes]
+        self._monto = [self._monto[p] for p in vigentes]
+        self._fecha = [self._fecha[p] for p in vigentes]
+        self._posiciones = {parcial: posicion for posicion, parcial in enumerate(self._parcial)}
+        self._adyacencia = {
+            linea: [nueva[p] for p in posiciones]
+            for linea, posiciones in self._adyacencia.items() if posiciones
+        }
+        self._huecos = 0
+
+    def marcar_terminales(self, asientos):
+        """Asientos que cortan el recorrido (pagos, facturas, diferencias de cambio)."""
+        with self._lock:
+            self._terminales.update(int(a) for a in asientos)
+
+    def marcar_expandidos(self, asientos):
+        """Asientos intermedios cuyas líneas de saldo ya están en el índice."""
+        with self._lock:
+            self._expandidos.update(int(a) for a in asientos)
+
+    # --- Consultas -----------------------------------------------------------------------
+
+    def conoce_linea(self, linea):
+        return linea in self._asiento
+
+    def asiento_de(self, linea):
+        return self._asiento.get(linea)
+
+    def clasificado(self, asiento):
+        """True si el asiento ya se sabe terminal o intermedio."""
+        return asiento in self._terminales or asiento in self._expandidos
+
+    def intermedio(self, asiento):
+        return asiento in self._expandidos and asiento not in self._terminales
+
+    def vecinos(self, linea):
+        """[(posición de la conciliación, línea del otro lado)] de `linea`, en O(grado)."""
+        with self._lock:
+            return [
+                (p, self._haber[p] if self._debe[p] == linea else self._debe[p])
+                for p in self._adyacencia.get(linea, [])
+            ]
+
+    def salidas(self, asiento, entrada=None):
+        """Líneas del asiento de signo contrario a `entrada` (todas las de saldo si no se indica)."""
+        with self._lock:
+            signo = self._saldo.get(entrada, 0.0)
+            return [
+                linea for linea in self._lineas.get(asiento, [])
+                if linea != entrada and self._saldo[linea] and self._saldo[linea] * signo <= 0
+            ]
+
+    def aplicaciones(self, linea, parciales=None, max_saltos=MAX_SALTOS):
+        """Asientos que saldaron `linea`: [(conciliación, asiento final, monto, fecha, saltos)].
+
+        `conciliación` es el id de la conciliación de `linea` por la que se llegó (con `parciales`,
+        solo se recorren esas) y `saltos` la cantidad de conciliaciones recorridas (1 = directa).
+        """
+        resultado = []
+        with self._lock:
+            origen = self._asiento.get(linea)
+            for posicion, otra in self.vecinos(linea):
+                if parciales is not None and self._parcial[posicion] not in parciales:
+                    continue
+                self._recorrer(
+                    self._parcial[posicion], otra, self._monto[posicion], self._fecha[posicion], 1, {origen},
+                    max_saltos, resultado
+                )
+        return resultado
+
+    def _recorrer(self, primera, linea, monto, fecha, saltos, visitados, max_saltos, resultado):
+        asiento = self._asiento.get(linea)
+        if not self.intermedio(asiento) or asiento in visitados or saltos >= max_saltos:
+            resultado.append((primera, asiento, monto, fecha, saltos))
+            return
+
+        salidas = [
+            (posicion, destino)
+            for salida in self.salidas(asiento, entrada=linea)
+            for posicion, destino in self.vecinos(salida)
+            if self._asiento.get(destino) != asiento
+        ]
+        total = sum(self._monto[p] for p, _ in salidas)
+        if total <= 0:
+            resultado.append((primera, asiento, monto, fecha, saltos))
+            return
+
+        # Si las salidas suman menos que lo que entra, el resto queda en el intermedio
+        base = max(total, monto)
+        for posicion, destino in salidas:
+            fecha_salida = self._fecha[posicion]
+            self._recorrer(
+                primera, destino, monto * self._monto[posicion] / base,
+                max(fecha, fecha_salida) if fecha == fecha and fecha_salida == fecha_salida else fecha,
+                saltos + 1, visitados | {asiento}, max_saltos, resultado
+            )
+        if total < monto:
+            resultado.append((primera, asiento, monto - total, fecha, saltos))
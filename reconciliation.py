@@ -0,0 +1,1019 @@
+# reconciliation.py
+"""Cuadratura de pagos de paquetes: órdenes, facturas y pagos conciliados de productos CL.
+
+Las órdenes, facturas y pagos aplicados por factura quedan en memoria del proceso (compartidos
+entre sesiones y con reconciliation_snapshot.py). Cada consulta solo vuelve a leer de Odoo los
+registros nuevos y los modificados desde la anterior (write_date), descarta los que ya no existen
+en Odoo y recalcula los pagos solo de las facturas afectadas; todo se vuelve a leer después de
+`TTL_CONCILIACION` segundos. Cada caché guarda a lo más `MAX_REGISTROS_POR_CLAVE` registros (se
+descartan los leídos hace más tiempo) y el índice de conciliaciones, `MAX_LINEAS_INDICE` líneas.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from fetch_context import ContextoConsultas
+from reconcile_graph import MAX_SALTOS, IndiceConciliacion
+from reference_data import INVOICE_STATUS, mapear_estados
+from schemas import load_frame, to_frame
+from seat_counters import load_frame_con_plazas
+
+TIPOS_FACTURA = ['out_invoice', 'out_refund', 'out_receipt']
+
+TTL_CONCILIACION = 3600
+# Los cambios se buscan desde un poco antes de la última consulta (relojes desfasados con Odoo)
+MARGEN_CAMBIOS = 300
+MAX_REGISTROS_POR_CLAVE = 50000
+MAX_LINEAS_INDICE = 500000
+
+_REGISTROS = {}    # (modelo, campos) -> frame por id; ('pagos', ...) -> (pagos, pagos sin conciliación)
+_VERIFICADOS = {}  # misma clave -> {id: (corte write_date, momento de la última lectura)}
+_METADATOS = {}    # modelo -> (momento, fields_get)
+_LOCK = threading.Lock()
+# Líneas, asientos y conciliaciones ya consultados (ver reconcile_graph.py)
+_INDICE = IndiceConciliacion()
+
+
+def get_first_existing_field(fields_meta, candidates):
+    for c in candidates:
+        if c in fields_meta:
+            return c
+    return None
+
+
+def extract_payment_applications_via_reconcile(odoo, invoice_ids, df_invoices, inv_state_field, payment_state_field):
+    """Construye detalle de pagos por factura usando conciliaciones (account.partial.reconcile).
+
+    Las conciliaciones con asientos intermedios (asientos varios) se siguen hasta el pago que las
+    saldó, repartiendo el monto (ver reconcile_graph.py); 'Saltos' cuenta las conciliaciones
+    recorridas (1 = directa).
+
+    Devuelve:
+    - df_payments: 1 fila por aplicación de pago a factura (monto aplicado)
+    - applied_by_invoice: dict invoice_id -> monto aplicado total
+
+    Si falla la consulta de conciliaciones de algunas líneas de factura, se usan las que el índice
+    ya conocía de ellas y sus facturas quedan en `df_payments.attrs['facturas_sin_consultar']`.
+    """
+
+    if not invoice_ids or df_invoices.empty:
+        return pd.DataFrame(), {}
+
+    # El índice se vuelve a armar desde cero si creció demasiado
+    if len(_INDICE) > MAX_LINEAS_INDICE:
+        _INDICE.limpiar()
+
+    # Verificar disponibilidad del modelo
+    try:
+        pr_fields_meta = _metadatos(odoo, 'account.partial.reconcile')
+    except Exception:
+        return pd.DataFrame(), {}
+
+    # 1) Obtener líneas de cuenta de las facturas (buscamos líneas receivable/payable)
+    aml_fields_meta = _metadatos(odoo, 'account.move.line')
+    internal_type_field = get_first_existing_field(aml_fields_meta, ['account_internal_type', 'internal_type'])
+
+    aml_fields = ['id', 'move_id', 'date', 'name', 'partner_id', 'account_id', 'debit', 'credit', 'balance']
+    if internal_type_field:
+        aml_fields.append(internal_type_field)
+
+    df_inv_lines = load_frame(
+        odoo,
+        'account.move.line',
+        domain=[('move_id', 'in', invoice_ids)],
+        fields=aml_fields,
+        m2o_ids=True,
+        nombres_m2o=[]
+    )
+
+    if df_inv_lines.empty:
+        return pd.DataFrame(), {}
+
+    # Filtrar receivable/payable si tenemos el campo
+    if internal_type_field:
+        df_inv_lines = df_inv_lines[df_inv_lines[internal_type_field].isin(['receivable', 'payable'])]
+
+    invoice_line_ids = df_inv_lines['id'].dropna().astype(int).unique().tolist()
+    if not invoice_line_ids:
+        return pd.DataFrame(), {}
+
+    # 2) Obtener conciliaciones parciales para esas líneas
+    pr_amount_field = get_first_existing_field(pr_fields_meta, ['amount', 'amount_currency'])
+    pr_fields = ['id', 'debit_move_id', 'credit_move_id']
+    if pr_amount_field and pr_amount_field not in pr_fields:
+        pr_fields.append(pr_amount_field)
+    pr_date_field = None
+    if 'max_date' in pr_fields_meta:
+        pr_date_field = 'max_date'
+    elif 'create_date' in pr_fields_meta:
+        pr_date_field = 'create_date'
+    if pr_date_field:
+        pr_fields.append(pr_date_field)
+    if 'exchange_move_id' in pr_fields_meta:
+        pr_fields.append('exchange_move_id')
+
+    # Si todos los batches fallaron, devolvemos vacío para que se use el fallback.
+    df_pr, lineas_factura_leidas = _parciales(odoo, invoice_line_ids, pr_fields, pr_amount_field, pr_date_field)
+    if df_pr is None or df_pr.empty:
+        return pd.DataFrame(), {}
+
+    # 3) Índice de conciliaciones: las facturas cortan el recorrido; se reemplazan las conciliaciones
+    # solo de las líneas que se pudieron consultar (las de un batch fallido quedan como estaban)
+    _INDICE.marcar_terminales(invoice_ids)
+    _INDICE.agregar_lineas(df_inv_lines)
+    _INDICE.reemplazar_parciales(lineas_factura_leidas, df_pr, 'Monto Aplicado', 'Fecha Conciliación')
+
+    # Resolver el "otro lado" de cada conciliación; si es un asiento intermedio (asiento varios que
+    # reclasifica o compensa saldos), seguir sus conciliaciones hasta el pago (hasta MAX_SALTOS)
+    consultadas = set(invoice_line_ids)
+    parciales = df_pr
+    for salto in range(MAX_SALTOS):
+        if 'exchange_move_id' in parciales:
+            _INDICE.marcar_terminales(parciales['exchange_move_id'].dropna().astype(int))
+        extremos = set(parciales['debit_move_id'].astype(int)) | set(parciales['credit_move_id'].astype(int))
+        desconocidas = sorted(linea for linea in extremos if not _INDICE.conoce_linea(linea))
+        if desconocidas:
+            _INDICE.agregar_lineas(load_frame(
+                odoo,
+                'account.move.line',
+                domain=[('id', 'in', desconocidas)],
+                fields=aml_fields,
+                m2o_ids=True,
+                nombres_m2o=[]
+            ))
+        asientos = {_INDICE.asiento_de(linea) for linea in extremos} - {None}
+        _clasificar_asientos(
+            odoo, sorted(a for a in asientos if not _INDICE.clasificado(a)), aml_fields, internal_type_field
+        )
+
+        siguientes = sorted(
+            {linea for a in asientos if _INDICE.intermedio(a) for linea in _INDICE.salidas(a)} - consultadas
+        )
+        if not siguientes or salto == MAX_SALTOS - 1:
+            break
+        consultadas.update(siguientes)
+        parciales, lineas_leidas = _parciales(odoo, siguientes, pr_fields, pr_amount_field, pr_date_field)
+        if parciales is None:
+            break
+        _INDICE.reemplazar_parciales(lineas_leidas, parciales, 'Monto Aplicado', 'Fecha Conciliación')
+
+    # 4) Aplicaciones por línea de factura (si ambos lados son líneas de factura, cuenta el debe)
+    debit_es_factura = df_pr['debit_move_id'].isin(invoice_line_ids)
+    credit_es_factura = ~debit_es_factura & df_pr['credit_move_id'].isin(invoice_line_ids)
+    df_pr = df_pr[debit_es_factura | credit_es_factura]
+    linea_factura = df_pr['debit_move_id'].where(debit_es_factura[df_pr.index], df_pr['credit_move_id'])
+
+    filas = []
+    for linea, ids in df_pr['id'].groupby(linea_factura.astype(int)):
+        factura = _INDICE.asiento_de(linea)
+        for parcial, asiento, monto, fecha, saltos in _INDICE.aplicaciones(linea, set(ids.astype(int))):
+            filas.append((parcial, factura, asiento, fecha, monto, saltos))
+
+    # Líneas cuyo batch falló: las conciliaciones que el índice ya conocía (sin repetir las consultadas)
+    sin_consultar = sorted(set(invoice_line_ids) - set(lineas_factura_leidas))
+    consultados = set(df_pr['id'].astype(int))
+    for linea in sin_consultar:
+        factura = _INDICE.asiento_de(linea)
+        for parcial, asiento, monto, fecha, saltos in _INDICE.aplicaciones(linea):
+            if parcial not in consultados:
+                filas.append((parcial, factura, asiento, fecha, monto, saltos))
+
+    df_aplicaciones = pd.DataFrame(
+        filas, columns=['id', 'Factura ID', 'Pago Move ID', 'Fecha Conciliación', 'Monto Aplicado', 'Saltos']
+    )
+    # En el orden de las conciliaciones consultadas (las conocidas del índice al final)
+    df_pr = pd.concat([
+        df_pr[['id']].merge(df_aplicaciones, on='id', how='inner'),
+        df_aplicaciones[~df_aplicaciones['id'].isin(consultados)],
+    ], ignore_index=True)
+    df_pr['Factura ID'] = df_pr['Factura ID'].astype('Int64')
+    df_pr['Pago Move ID'] = df_pr['Pago Move ID'].astype('Int64')
+
+    # Asegurar posted (por si el frame trae otros)
+    inv = df_invoices
+    if inv_state_field:
+        inv = inv[inv[inv_state_field] == 'posted']
+    inv = inv.rename(columns={
+        'id': 'Factura ID',
+        'name': 'Factura',
+        'invoice_origin': 'Factura Origen',
+        'partner_id_name': 'Cliente',
+    })
+    inv['Estado Pago Factura'] = inv[payment_state_field] if payment_state_field else ''
+
+    df_payments = df_pr.merge(
+        inv[['Factura ID', 'Factura', 'Factura Origen', 'Estado Pago Factura', 'Cliente']],
+        on='Factura ID',
+        how='inner'
+    )
+    if df_payments.empty:
+        return pd.DataFrame(), {}
+
+    df_payments = df_payments[[
+        'Factura ID', 'Factura', 'Factura Origen', 'Estado Pago Factura', 'Pago Move ID',
+        'Fecha Conciliación', 'Monto Aplicado', 'Saltos', 'Cliente'
+    ]].reset_index(drop=True)
+
+    applied_by_invoice = df_payments.groupby('Factura ID')['Monto Aplicado'].sum().to_dict()
+
+    # 5) Enriquecer con account.payment si existe move_id
+    pay_fields_meta = _metadatos(odoo, 'account.payment')
+    if 'move_id' in pay_fields_meta:
+        payment_move_ids = df_payments['Pago Move ID'].dropna().astype(int).unique().tolist()
+        if payment_move_ids:
+            df_pagos = load_frame(
+                odoo,
+                'account.payment',
+                domain=[('move_id', 'in', payment_move_ids), ('state', '=', 'posted')],
+                fields=['id', 'name', 'date', 'amount', 'ref', 'journal_id', 'move_id']
+            )
+            df_pagos = df_pagos.dropna(subset=['move_id']).drop_duplicates(subset=['move_id'], keep='last')
+            df_pagos = df_pagos.rename(columns={
+                'move_id': 'Pago Move ID',
+                'id': 'Pago ID',
+                'name': 'Pago',
+                'date': 'Fecha Pago',
+                'amount': 'Monto Pago',
+                'journal_id_name': 'Diario',
+                'ref': 'Referencia',
+            })
+            df_payments = df_payments.merge(
+                df_pagos[['Pago Move ID', 'Pago ID', 'Pago', 'Fecha Pago', 'Monto Pago', 'Diario', 'Referencia']],
+                on='Pago Move ID',
+                how='left'
+            )
+            df_payments['Monto Pago'] = df_payments['Monto Pago'].fillna(0.0)
+            for c in ['Pago', 'Diario', 'Referencia']:
+                df_payments[c] = df_payments[c].fillna('')
+
+    df_payments.attrs['facturas_sin_consultar'] = {_INDICE.asiento_de(linea) for linea in sin_consultar}
+    return df_payments, applied_by_invoice
+
+
+def _parciales(odoo, line_ids, pr_fields, pr_amount_field, pr_date_field):
+    """(conciliaciones parciales con monto, líneas consultadas) de las líneas `line_ids`.
+
+    Agrega las columnas 'Monto Aplicado' y 'Fecha Conciliación'. Las líneas de un batch que falló
+    no están entre las consultadas; si fallaron todos, devuelve (None, []).
+    """
+    # En algunas instancias Odoo responde 400 si el dominio tiene demasiados IDs en el "in".
+    # Para evitarlo, consultamos en batches y unimos los resultados.
+    partials = []
+    lineas_leidas = []
+    # Batch más pequeño para evitar 400 por payload/domains grandes
+    batch_size = 50
+    for i in range(0, len(line_ids), batch_size):
+        batch_ids = line_ids[i:i + batch_size]
+        try:
+            batch_partials = odoo.search_read(
+                'account.partial.reconcile',
+                domain=['|', ('debit_move_id', 'in', batch_ids), ('credit_move_id', 'in', batch_ids)],
+                fields=pr_fields,
+                m2o_ids=True,
+                nombres_m2o=[]
+            )
+            lineas_leidas.extend(batch_ids)
+            if batch_partials:
+                partials.extend(batch_partials)
+        except Exception:
+            # Si un batch falla, continuamos con los otros (mejor "algo" que nada).
+            continue
+    if not lineas_leidas:
+        return None, []
+
+    # Deduplicar por id
+    df_pr = to_frame('account.partial.reconcile', partials, pr_fields).drop_duplicates(subset=['id'])
+    df_pr = df_pr.dropna(subset=['debit_move_id', 'credit_move_id'])
+    df_pr['Monto Aplicado'] = df_pr[pr_amount_field] if pr_amount_field else 0.0
+    df_pr['Fecha Conciliación'] = df_pr[pr_date_field] if pr_date_field else pd.NaT
+    return df_pr[df_pr['Monto Aplicado'] != 0.0], lineas_leidas
+
+
+def _clasificar_asientos(odoo, asientos, aml_fields, internal_type_field):
+    """Marca en el índice los asientos de pagos, facturas y notas de crédito como terminales, y los
+    asientos varios (move_type 'entry' sin pago ni línea de extracto) como intermedios, con sus
+    líneas receivable/payable."""
+    if not asientos:
+        return
+
+    pagos = set()
+    if 'move_id' in _metadatos(odoo, 'account.payment'):
+        registros = odoo.search_read(
+            'account.payment', domain=[('move_id', 'in', asientos)], fields=['move_id'], m2o_ids=True, nombres_m2o=[]
+        )
+        pagos = {r['move_id'][0] for r in registros if r['move_id']}
+
+    intermedios = []
+    resto = [a for a in asientos if a not in pagos]
+    move_fields_meta = _metadatos(odoo, 'account.move') if resto else {}
+    move_type_field = get_first_existing_field(move_fields_meta, ['move_type', 'type'])
+    if move_type_field:
+        move_fields = [move_type_field] + [c for c in ['statement_line_id'] if c in move_fields_meta]
+        intermedios = [
+            m['id'] for m in odoo.read('account.move', resto, move_fields)
+            if m[move_type_field] == 'entry' and not m.get('statement_line_id')
+        ]
+
+    _INDICE.marcar_terminales(set(asientos) - set(intermedios))
+    if intermedios:
+        df_lineas = load_frame(
+            odoo,
+            'account.move.line',
+            domain=[('move_id', 'in', intermedios)],
+            fields=aml_fields,
+            m2o_ids=True,
+            nombres_m2o=[]
+        )
+        if internal_type_field:
+            df_lineas = df_lineas[df_lineas[internal_type_field].isin(['receivable', 'payable'])]
+        _INDICE.agregar_lineas(df_lineas)
+        _INDICE.marcar_expandidos(intermedios)
+
+
+# Campos de las variantes (product.product) para la tabla de productos CL
+CAMPOS_PRODUCTOS_CL = [
+    'id', 'default_code', 'name', 'product_tmpl_id',
+    'list_price',
+    'x_studio_lote', 'x_studio_destino', 'x_studio_transporte',
+    'x_studio_estado_viaje', 'x_studio_tipo_de_cupo',
+    'x_studio_ida_fecha_salida', 'x_studio_boletos_totales',
+    'x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf',
+    'x_studio_boletos_disponibles'
+]
+
+
+# Campos de las variantes con que se buscan las órdenes (build_orders_and_payments)
+CAMPOS_VARIANTES_ORDENES = ['id', 'default_code', 'name', 'product_tmpl_id']
+
+
+def contexto_cuadratura(odoo, template_ids):
+    """Contexto de consultas de una búsqueda de Cuadratura (ver fetch_context.py): las variantes de
+    los paquetes se leen una vez, con los campos de ambos builders."""
+    contexto = ContextoConsultas(odoo, cargador=load_frame_con_plazas)
+    contexto.pedir('product.product', _dominio_variantes(template_ids), CAMPOS_PRODUCTOS_CL)
+    contexto.pedir('product.product', _dominio_variantes(template_ids), CAMPOS_VARIANTES_ORDENES)
+    return contexto
+
+
+def _dominio_variantes(template_ids):
+    return [('product_tmpl_id', 'in', template_ids)]
+
+
+def _variantes(odoo, template_ids, fields, codigo_cl_exacto, cargador, contexto=None):
+    """Variantes de los paquetes (solo la del código CL exacto, si se indica), desde `contexto` si hay."""
+    if contexto is not None:
+        df = contexto.load_frame('product.product', domain=_dominio_variantes(template_ids), fields=fields)
+    else:
+        df = cargador(odoo, 'product.product', domain=_dominio_variantes(template_ids), fields=fields)
+
+    if codigo_cl_exacto:
+        df = df[df['default_code'] == str(codigo_cl_exacto)]
+    return df
+
+
+def build_productos_cl_table(odoo, template_ids, codigo_cl_exacto=None, contexto=None):
+    # Las plazas pueden venir calculadas localmente (ver seat_counters.py)
+    df = _variantes(odoo, template_ids, CAMPOS_PRODUCTOS_CL, codigo_cl_exacto, load_frame_con_plazas, contexto)
+    return tabla_productos_cl(df)
+
+
+def tabla_productos_cl(df):
+    """Tabla de productos CL (1 fila por variante) desde un frame de product.product (CAMPOS_PRODUCTOS_CL)."""
+    if df.empty:
+        return pd.DataFrame()
+    df = df.copy()
+
+    # Las columnas ya vienen tipadas (schemas.py): no hay conversión celda a celda
+    df['Plazas Totales'] = df['x_studio_boletos_totales']
+    df['Plazas Reservadas'] = df['x_studio_boletos_reservados']
+    df['Plazas Pagadas'] = df['x_product_count_pagados_stat_inf']
+    df['Plazas Disponibles'] = df['x_studio_boletos_disponibles']
+
+    df['Monto'] = df['list_price']
+    df['Total Pagado (CL)'] = df['Monto'] * df['Plazas Pagadas']
+
+    # Estado de paquete (traducido) + tipo de cupo
+    df['Estado de Paquete'] = mapear_estados(df['x_studio_estado_viaje'])
+    df['Tipo de Cupo'] = df['x_studio_tipo_de_cupo']
+
+    # Formato fecha salida DD/MM/AAAA
+    df['Fecha Salida (fmt)'] = df['x_studio_ida_fecha_salida'].dt.strftime('%d/%m/%Y')
+
+    df_out = df[[
+        'default_code', 'name', 'Estado de Paquete', 'Tipo de Cupo', 'x_studio_destino', 'x_studio_lote', 'x_studio_transporte',
+        'Fecha Salida (fmt)', 'Monto', 'Total Pagado (CL)',
+        'Plazas Totales', 'Plazas Pagadas', 'Plazas Reservadas', 'Plazas Disponibles'
+    ]].copy()
+
+    df_out.columns = [
+        'Código CL', 'Producto', 'Estado de Paquete', 'Tipo de Cupo', 'Destino', 'Lote', 'Transporte',
+        'Fecha Salida', 'Monto', 'Total Pagado (CL)',
+        'Plazas Totales', 'Plazas Pagadas', 'Plazas Reservadas', 'Plazas Disponibles'
+    ]
+
+    return df_out
+
+
+def asignar_facturado_por_cl(df_cl_lines, df_ord_fact, decimales=0):
+    """Distribuye el Facturado (posted) de cada orden entre sus líneas CL, proporcional al subtotal.
+
+    Se calcula con aritmética de arrays (sin apply por fila). Las órdenes cuyo subtotal CL es <= 0
+    no asignan monto. El residuo de redondeo de cada orden se carga a su línea de mayor subtotal,
+    de modo que lo asignado suma exactamente lo facturado de la orden.
+
+    Devuelve un array alineado con las filas de df_cl_lines.
+    """
+    n = len(df_cl_lines)
+    if n == 0:
+        return np.zeros(0)
+
+    codigos, ordenes = pd.factorize(df_cl_lines['Orden'])
+    subtotal = pd.to_numeric(df_cl_lines['Subtotal Línea (CL)'], errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+    facturado = pd.to_numeric(df_ord_fact['Facturado (posted)'], errors='coerce').fillna(0.0)
+    facturado = facturado.groupby(df_ord_fact['Orden']).first()
+
+    # Subtotal CL y facturado por orden (un valor por código de orden)
+    denom = np.bincount(codigos, weights=subtotal, minlength=len(ordenes))
+    total = facturado.reindex(ordenes).fillna(0.0).to_numpy(dtype=float)
+    total = np.where(denom > 0, total, 0.0)
+
+    denom_linea = denom[codigos]
+    participacion = np.divide(subtotal, denom_linea, out=np.zeros(n), where=denom_linea > 0)
+    asignado = np.round(total[codigos] * participacion, decimales)
+
+    # Reconciliar redondeo: el residuo de cada orden va a su línea de mayor subtotal
+    residuo = total - np.bincount(codigos, weights=asignado, minlength=len(ordenes))
+    ancla = pd.Series(subtotal).groupby(codigos).idxmax()
+    asignado[ancla.to_numpy()] += residuo[ancla.index.to_numpy()]
+
+    return asignado
+
+
+def unir_unicos(valores):
+    """Une los valores no vacíos de un grupo, ordenados y sin repetir."""
+    return ', '.join(sorted({v for v in valores if isinstance(v, str) and v}))
+
+
+def build_orders_and_payments(odoo, template_ids, codigo_cl_exacto=None, contexto=None):
+    """Obtiene órdenes que contengan productos CL de los paquetes y construye tabla de órdenes + pagos."""
+
+    # 1) Productos (variantes) para identificar los IDs vendidos
+    df_products = _variantes(odoo, template_ids, CAMPOS_VARIANTES_ORDENES, codigo_cl_exacto, load_frame, contexto)
+
+    return armar_ordenes_y_pagos(cargar_datos_conciliacion(odoo, df_products))
+
+
+def _resultado_vacio():
+    return (
+        pd.DataFrame(),
+        pd.DataFrame(),
+        {
+            'total_pagado': 0,
+            'total_saldo': 0,
+            'total_facturado_posted': 0,
+        },
+        pd.DataFrame(columns=['Código CL', 'Facturado (posted)']),
+    )
+
+
+def cargar_datos_conciliacion(odoo, df_products, refrescar=False):
+    """Consulta en Odoo las órdenes, facturas y pagos de las variantes de `df_products`.
+
+    Devuelve los frames sin armar (ver `armar_ordenes_y_pagos`), o None si no hay ventas:
+    - 'productos' y 'lineas': variantes y sus líneas de orden,
+    - 'ordenes' (índice id, con invoice_ids) y 'facturas' (posted),
+    - 'pagos': aplicaciones de pagos por conciliación (1 fila por pago aplicado a una factura),
+    - 'pagos_sin_conciliacion': pagos vía account.payment de las facturas sin conciliaciones
+      (respaldo cuando ninguna factura del alcance tiene conciliaciones).
+
+    Órdenes, facturas y pagos por factura quedan en memoria entre ejecuciones: solo se vuelven a
+    consultar los nuevos y los modificados desde la última vez (write_date de sale.order y de sus
+    facturas y líneas, account.move, account.partial.reconcile y account.payment). Con `refrescar`
+    se consulta todo.
+    """
+    product_ids = df_products['id'].dropna().astype(int).tolist()
+
+    if not product_ids:
+        return None
+
+    # 2) Líneas de orden (acá se define la población: todas las órdenes que contienen esos productos)
+    df_lines = load_frame(
+        odoo,
+        'sale.order.line',
+        domain=[('product_id', 'in', product_ids)],
+        fields=['id', 'order_id', 'product_id', 'product_uom_qty', 'price_subtotal', 'name'],
+        m2o_ids=True,
+        nombres_m2o=[]
+    )
+    df_lines = df_lines.dropna(subset=['order_id'])
+
+    if df_lines.empty:
+        return None
+
+    order_ids = sorted(df_lines['order_id'].astype(int).unique().tolist())
+
+    # 3) Órdenes
+    order_fields = [
+        'id', 'name', 'partner_id', 'date_order', 'amount_total',
+        'invoice_status', 'user_id', 'team_id', 'state'
+    ]
+
+    # invoice_ids no se guarda en la orden (es calculado): una factura nueva (p. ej. un anticipo) no
+    # cambia el write_date de la orden, así que también se miran el de sus facturas y sus líneas
+    cambios_orden = ['write_date', 'order_line.write_date']
+
+    # Si existe invoice_ids, lo traemos (para enlazar facturas)
+    so_fields_meta = _metadatos(odoo, 'sale.order')
+    if 'invoice_ids' in so_fields_meta:
+        order_fields.append('invoice_ids')
+        cambios_orden.append('invoice_ids.write_date')
+
+    # invoice_ids se incluye siempre en el frame: si el campo no existe queda como lista vacía
+    def leer_ordenes(forzar=()):
+        df, _, _ = _registros(
+            odoo, 'sale.order', order_ids, order_fields, order_fields + ['invoice_ids'],
+            ['partner_id', 'user_id', 'team_id'], refrescar, campos_cambio=cambios_orden, forzar=forzar
+        )
+        return df, sorted({int(iid) for ids in df['invoice_ids'] for iid in ids})
+
+    df_ord, invoice_ids = leer_ordenes()
+
+    # 4) Facturas
+
+    inv_fields_meta = _metadatos(odoo, 'account.move')
+    inv_state_field = 'state' if 'state' in inv_fields_meta else None
+    payment_state_field = get_first_existing_field(inv_fields_meta, ['payment_state', 'invoice_payment_state'])
+
+    inv_fields = ['id', 'name', 'move_type', 'partner_id', 'invoice_origin', 'invoice_date', 'amount_total']
+    if inv_state_field:
+        inv_fields.append(inv_state_field)
+    if payment_state_field:
+        inv_fields.append(payment_state_field)
+    if 'amount_residual' in inv_fields_meta:
+        inv_fields.append('amount_residual')
+    if 'amount_total_signed' in inv_fields_meta:
+        inv_fields.append('amount_total_signed')
+    if 'currency_id' in inv_fields_meta:
+        inv_fields.append('currency_id')
+
+    # amount_residual se pide siempre en el frame: si el campo no existe queda en 0. Se guardan
+    # todas las facturas de las órdenes; solo las de cliente posted entran en la cuadratura
+    df_invoices, consultadas, borradas = _registros(
+        odoo, 'account.move', invoice_ids, inv_fields, inv_fields + ['amount_residual'], ['partner_id'], refrescar
+    )
+    if borradas:
+        # Facturas eliminadas (p. ej. borradores): sus órdenes guardan invoice_ids viejos
+        con_borradas = [
+            orden for orden, ids in df_ord['invoice_ids'].items() if borradas.intersection(map(int, ids))
+        ]
+        df_ord, invoice_ids = leer_ordenes(forzar=con_borradas)
+        df_invoices, consultadas_de_nuevo, _ = _registros(
+            odoo, 'account.move', invoice_ids, inv_fields, inv_fields + ['amount_residual'], ['partner_id'],
+            refrescar
+        )
+        consultadas |= consultadas_de_nuevo
+    df_invoices = df_invoices[df_invoices['move_type'].isin(TIPOS_FACTURA)]
+    if inv_state_field:
+        df_invoices = df_invoices[df_invoices[inv_state_field] == 'posted']
+    df_invoices = df_invoices.reset_index()
+
+    # 6) Pagos por factura: solo se recalculan las facturas nuevas o con cambios
+    df_payments, df_sin_conciliacion = _pagos_por_factura(
+        odoo, df_invoices, consultadas, inv_state_field, payment_state_field, refrescar, borradas
+    )
+
+    return {
+        'productos': df_products[['id', 'default_code', 'name']],
+        'lineas': df_lines,
+        'ordenes': df_ord,
+        'facturas': df_invoices,
+        'pagos': df_payments,
+        'pagos_sin_conciliacion': df_sin_conciliacion,
+        'inv_state_field': inv_state_field,
+        'payment_state_field': payment_state_field,
+    }
+
+
+def corte_cambios():
+    """write_date (UTC, formato de Odoo) desde el que buscar cambios la próxima vez (con margen)."""
+    return (datetime.now(timezone.utc) - timedelta(seconds=MARGEN_CAMBIOS)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _metadatos(odoo, model):
+    """fields_get de `model`, en memoria por TTL_CONCILIACION (los campos casi nunca cambian)."""
+    ahora = time.monotonic()
+    with _LOCK:
+        entrada = _METADATOS.get(model)
+        if entrada is not None and ahora - entrada[0] <= TTL_CONCILIACION:
+            return entrada[1]
+    meta = odoo.fields_get(model)
+    with _LOCK:
+        _METADATOS[model] = (ahora, meta)
+    return meta
+
+
+def _verificados(clave, ids, refrescar):
+    """(conocidos, nuevos, corte): ids en memoria leídos hace menos de TTL_CONCILIACION, el resto,
+    y el corte más antiguo desde el que hay que buscar cambios de los conocidos."""
+    ahora = time.monotonic()
+    with _LOCK:
+        verificados = _VERIFICADOS.setdefault(clave, {})
+        conocidos = [] if refrescar else [
+            i for i in ids if i in verificados and ahora - verificados[i][1] <= TTL_CONCILIACION
+        ]
+        corte = min((verificados[i][0] for i in conocidos), default=None)
+    conocidos_set = set(conocidos)
+    return conocidos, [i for i in ids if i not in conocidos_set], corte
+
+
+def _marcar(clave, ids, corte, leidos):
+    """Registra que `ids` están al día hasta `corte`; los `leidos` de nuevo, también desde ahora."""
+    ahora = time.monotonic()
+    with _LOCK:
+        verificados = _VERIFICADOS.setdefault(clave, {})
+        for i in ids:
+            anterior = verificados.get(i)
+            verificados[i] = (corte, ahora if i in leidos or anterior is None else anterior[1])
+
+
+def _dominio_cambios(nuevos, conocidos, corte, campo='id', campos_cambio=('write_date',)):
+    """Registros `nuevos` más los `conocidos` con alguno de `campos_cambio` posterior a `corte`."""
+    cambios = (
+        ['&', (campo, 'in', conocidos)]
+        + ['|'] * (len(campos_cambio) - 1)
+        + [(c, '>', corte) for c in campos_cambio]
+    )
+    if not conocidos:
+        return [(campo, 'in', nuevos)]
+    if not nuevos:
+        return cambios
+    return ['|', (campo, 'in', nuevos)] + cambios
+
+
+def _registros(odoo, model, ids, fields, columnas, nombres_m2o, refrescar, campos_cambio=('write_date',),
+               forzar=()):
+    """(frame de los registros `ids` de `model` con índice id y columnas `columnas`, ids leídos de Odoo,
+    ids que estaban en memoria y ya no existen).
+
+    Solo se consultan los que no están en memoria, los de `forzar` y los modificados desde la
+    última lectura (según `campos_cambio`, que puede incluir el write_date de registros
+    relacionados). Los eliminados en Odoo se descartan de la memoria.
+    """
+    clave = (model, tuple(fields))
+    conocidos, nuevos, corte_anterior = _verificados(clave, ids, refrescar)
+    if forzar:
+        forzar = set(forzar)
+        nuevos += [i for i in conocidos if i in forzar]
+        conocidos = [i for i in conocidos if i not in forzar]
+    corte = corte_cambios()
+    borrados = set(conocidos) - _existentes(odoo, model, conocidos)
+    leidos = to_frame(model, [], columnas).set_index('id')
+    if ids:
+        registros = odoo.search_read(
+            model,
+            domain=_dominio_cambios(nuevos, conocidos, corte_anterior, campos_cambio=campos_cambio),
+            fields=fields,
+            m2o_ids=True,
+            nombres_m2o=nombres_m2o
+        )
+        leidos = to_frame(model, registros, columnas).drop_duplicates(subset=['id']).set_index('id')
+
+    with _LOCK:
+        guardados = _REGISTROS.get(clave)
+        if guardados is not None:
+            guardados = pd.concat([guardados[~guardados.index.isin(leidos.index)], leidos])
+        else:
+            guardados = leidos
+        _REGISTROS[clave] = guardados[~guardados.index.isin(borrados)]
+    vigentes = [i for i in ids if i not in borrados]
+    _marcar(clave, vigentes, corte, set(leidos.index))
+    _olvidar(clave, borrados)
+    _recortar(clave)
+    return guardados[guardados.index.isin(vigentes)], set(leidos.index), borrados
+
+
+def _existentes(odoo, model, ids, batch_size=1000):
+    """Ids de `ids` que todavía existen en `model` (solo search, sin leer campos)."""
+    existentes = set()
+    for i in range(0, len(ids), batch_size):
+        existentes.update(odoo.search(model, [('id', 'in', ids[i:i + batch_size])]))
+    return existentes
+
+
+def _olvidar(clave, ids):
+    """Descarta `ids` de la caché `clave` (registros eliminados en Odoo)."""
+    if not ids:
+        return
+    with _LOCK:
+        verificados = _VERIFICADOS.get(clave, {})
+        for i in ids:
+            verificados.pop(i, None)
+        guardados = _REGISTROS.get(clave)
+        if isinstance(guardados, tuple):
+            _REGISTROS[clave] = tuple(_sin_facturas(df, ids) for df in guardados)
+        elif guardados is not None:
+            _REGISTROS[clave] = guardados[~guardados.index.isin(ids)]
+
+
+def _recortar(clave):
+    """Deja la caché `clave` en MAX_REGISTROS_POR_CLAVE registros, sin los leídos hace más tiempo."""
+    with _LOCK:
+        verificados = _VERIFICADOS.get(clave, {})
+        sobran = len(verificados) - MAX_REGISTROS_POR_CLAVE
+        if sobran <= 0:
+            return
+        antiguos = sorted(verificados, key=lambda i: verificados[i][1])[:sobran]
+    _olvidar(clave, antiguos)
+
+
+def _facturas_afectadas(odoo, conocidas, corte, pagos, sin_conciliacion):
+    """Facturas `conocidas` con conciliaciones o pagos creados o modificados después de `corte`."""
+    afectadas = set()
+    if not conocidas:
+        return afectadas
+
+    parciales = odoo.search_read(
+        'account.partial.reconcile',
+        domain=[
+            '&', ('write_date', '>', corte),
+            '|', ('debit_move_id.move_id', 'in', conocidas), ('credit_move_id.move_id', 'in', conocidas),
+        ],
+        fields=['debit_move_id', 'credit_move_id'],
+        m2o_ids=True,
+        nombres_m2o=[]
+    )
+    lineas = sorted({p[c][0] for p in parciales for c in ('debit_move_id', 'credit_move_id') if p[c]})
+    if lineas:
+        movimientos = odoo.read('account.move.line', lineas, ['move_id'])
+        afectadas.update(
+            (m['move_id'][0] if isinstance(m['move_id'], (list, tuple)) else m['move_id'])
+            for m in movimientos if m['move_id']
+        )
+
+    # Pagos ya aplicados a las facturas (por su asiento o por id) que se editaron
+    filas = pd.concat([_de_facturas(pagos, conocidas), _de_facturas(sin_conciliacion, conocidas)])
+    pago_moves = sorted({int(m) for m in filas.get('Pago Move ID', pd.Series(dtype='Int64')).dropna()})
+    pago_ids = sorted({int(p) for p in filas.get('Pago ID', pd.Series(dtype='Int64')).dropna()})
+    if pago_moves or pago_ids:
+        editados = odoo.search_read(
+            'account.payment',
+            domain=['&', ('write_date', '>', corte), '|', ('move_id', 'in', pago_moves), ('id', 'in', pago_ids)],
+            fields=['id', 'move_id'],
+            m2o_ids=True,
+            nombres_m2o=[]
+        )
+        moves = {r['move_id'][0] for r in editados if r['move_id']}
+        ids = {r['id'] for r in editados}
+        if 'Pago Move ID' in filas:
+            afectadas.update(filas.loc[filas['Pago Move ID'].isin(moves), 'Factura ID'].astype(int))
+        if 'Pago ID' in filas:
+            afectadas.update(filas.loc[filas['Pago ID'].isin(ids), 'Factura ID'].astype(int))
+    return afectadas & set(conocidas)
+
+
+def _pagos_por_factura(odoo, df_invoices, consultadas, inv_state_field, payment_state_field, refrescar,
+                       borradas=()):
+    """(pagos conciliados, pagos sin conciliación) de las facturas de `df_invoices`, recalculando solo
+    las nuevas, las `consultadas` de nuevo (modificadas) y las con conciliaciones o pagos nuevos.
+    Los pagos guardados de las facturas `borradas` (eliminadas en Odoo) se descartan."""
+    clave = ('pagos', inv_state_field, payment_state_field)
+    _olvidar(clave, borradas)
+    invoice_ids = df_invoices['id'].dropna().astype(int).tolist()
+    conocidas, nuevas, corte_anterior = _verificados(clave, invoice_ids, refrescar)
+    corte = corte_cambios()
+    with _LOCK:
+        pagos, sin_conciliacion = _REGISTROS.get(clave, (pd.DataFrame(), pd.DataFrame()))
+
+    conocidas = [i for i in conocidas if i not in consultadas]
+    afectadas = _facturas_afectadas(odoo, conocidas, corte_anterior, pagos, sin_conciliacion)
+    recalcular = sorted(set(invoice_ids) - set(conocidas) | afectadas)
+
+    if recalcular:
+        df_recalcular = df_invoices[df_invoices['id'].isin(recalcular)]
+        nuevos_pagos, _ = extract_payment_applications_via_reconcile(
+            odoo,
+            invoice_ids=recalcular,
+            df_invoices=df_recalcular,
+            inv_state_field=inv_state_field,
+            payment_state_field=payment_state_field,
+        )
+        # Fallback (facturas sin conciliaciones disponibles) a la vía estándar (menos precisa)
+        conciliadas = set(nuevos_pagos['Factura ID'].dropna().astype(int)) if not nuevos_pagos.empty else set()
+        nuevos_sin_conciliacion = pagos_sin_conciliacion(
+            odoo, [i for i in recalcular if i not in conciliadas], df_recalcular, inv_state_field, payment_state_field
+        )
+        with _LOCK:
+            pagos, sin_conciliacion = _REGISTROS.get(clave, (pd.DataFrame(), pd.DataFrame()))
+            pagos = pd.concat([_sin_facturas(pagos, recalcular), nuevos_pagos], ignore_index=True)
+            sin_conciliacion = pd.concat(
+                [_sin_facturas(sin_conciliacion, recalcular), nuevos_sin_conciliacion], ignore_index=True
+            )
+            _REGISTROS[clave] = (pagos, sin_conciliacion)
+    _marcar(clave, invoice_ids, corte, set(recalcular))
+    if recalcular and nuevos_pagos.attrs.get('facturas_sin_consultar'):
+        # Facturas con conciliaciones que no se pudieron consultar: se recalculan la próxima vez
+        with _LOCK:
+            for factura in nuevos_pagos.attrs['facturas_sin_consultar']:
+                _VERIFICADOS[clave].pop(factura, None)
+    _recortar(clave)
+    return _de_facturas(pagos, invoice_ids), _de_facturas(sin_conciliacion, invoice_ids)
+
+
+def limpiar_conciliacion():
+    """Descarta las órdenes, facturas, pagos y conciliaciones en memoria (la próxima consulta lee todo de Odoo)."""
+    with _LOCK:
+        _REGISTROS.clear()
+        _VERIFICADOS.clear()
+        _METADATOS.clear()
+    _INDICE.limpiar()
+
+
+def pagos_sin_conciliacion(odoo, invoice_ids, df_invoices, inv_state_field, payment_state_field):
+    """Pagos de las facturas vía account.payment.reconciled_invoice_ids (sin montos aplicados por factura)."""
+    if not invoice_ids:
+        return pd.DataFrame()
+
+    pay_fields_meta = _metadatos(odoo, 'account.payment')
+    if 'reconciled_invoice_ids' not in pay_fields_meta:
+        return pd.DataFrame()
+
+    pay_fields = ['id', 'name', 'date', 'amount', 'payment_type', 'partner_id', 'ref', 'journal_id', 'reconciled_invoice_ids', 'state']
+    df_pagos = load_frame(
+        odoo,
+        'account.payment',
+        domain=[('reconciled_invoice_ids', 'in', invoice_ids), ('state', '=', 'posted')],
+        fields=pay_fields
+    )
+
+    inv = df_invoices
+    if inv_state_field:
+        inv = inv[inv[inv_state_field] == 'posted']
+    inv = inv.rename(columns={'id': 'Factura ID', 'name': 'Factura', 'invoice_origin': 'Factura Origen'})
+    inv['Estado Pago Factura'] = inv[payment_state_field] if payment_state_field else ''
+
+    df_pagos = df_pagos.explode('reconciled_invoice_ids').dropna(subset=['reconciled_invoice_ids'])
+    df_pagos['Factura ID'] = df_pagos['reconciled_invoice_ids'].astype('Int64')
+    df_pagos = df_pagos[df_pagos['Factura ID'].isin(invoice_ids)]
+    df_pagos = df_pagos.merge(
+        inv[['Factura ID', 'Factura', 'Factura Origen', 'Estado Pago Factura']],
+        on='Factura ID',
+        how='inner'
+    )
+    return pd.DataFrame({
+        'Pago ID': df_pagos['id'],
+        'Pago': df_pagos['name'],
+        'Fecha Pago': df_pagos['date'],
+        'Cliente': df_pagos['partner_id_name'],
+        'Diario': df_pagos['journal_id_name'],
+        'Monto Pago': df_pagos['amount'],
+        'Referencia': df_pagos['ref'],
+        'Factura ID': df_pagos['Factura ID'],
+        'Factura': df_pagos['Factura'],
+        'Factura Origen': df_pagos['Factura Origen'],
+        'Estado Pago Factura': df_pagos['Estado Pago Factura'],
+        'Monto Aplicado': df_pagos['amount'],
+    })
+
+
+def _de_facturas(df, invoice_ids):
+    """Filas de pagos de las facturas `invoice_ids`."""
+    if df.empty:
+        return df
+    return df[df['Factura ID'].isin(invoice_ids)].reset_index(drop=True)
+
+
+def _sin_facturas(df, invoice_ids):
+    """Filas de pagos de las demás facturas."""
+    if df.empty:
+        return df
+    return df[~df['Factura ID'].isin(invoice_ids)]
+
+
+def armar_ordenes_y_pagos(datos, product_ids=None):
+    """Tablas de órdenes y pagos, totales y facturado por código CL desde `cargar_datos_conciliacion`.
+
+    Con `product_ids` se arma solo la población de esas variantes (órdenes que las contienen, sus
+    facturas y pagos), igual que si se hubieran consultado solas.
+    """
+    if datos is None:
+        return _resultado_vacio()
+
+    df_products = datos['productos']
+    df_lines = datos['lineas']
+    df_ord = datos['ordenes']
+    df_invoices = datos['facturas']
+    payment_state_field = datos['payment_state_field']
+
+    if product_ids is not None:
+        df_products = df_products[df_products['id'].isin(product_ids)]
+        df_lines = df_lines[df_lines['product_id'].isin(df_products['id'])]
+        if df_lines.empty:
+            return _resultado_vacio()
+        df_ord = df_ord[df_ord.index.isin(df_lines['order_id'])]
+        df_invoices = df_invoices[df_invoices['id'].isin({int(i) for ids in df_ord['invoice_ids'] for i in ids})]
+
+    # 5) Tabla de Órdenes (1 fila por orden) + agregados de facturas (posted)
+    df_lines = df_lines[df_lines['order_id'].isin(df_ord.index)]
+    df_lines = df_lines.merge(
+        df_products[['id', 'default_code', 'name']].rename(columns={
+            'id': 'product_id',
+            'default_code': 'Código CL',
+            'name': 'Producto CL',
+        }),
+        on='product_id',
+        how='left'
+    )
+
+    lineas_por_orden = df_lines.groupby('order_id', sort=False)
+    agregado = lineas_por_orden.agg(
+        cantidad=('product_uom_qty', 'sum'),
+        subtotal=('price_subtotal', 'sum'),
+        codigos=('Código CL', unir_unicos),
+        productos=('Producto CL', unir_unicos),
+    )
+
+    facturas_por_orden = df_ord['invoice_ids'].explode().dropna().astype(int)
+    facturas_por_orden = pd.DataFrame({
+        'order_id': facturas_por_orden.index,
+        'invoice_id': facturas_por_orden.to_numpy(),
+    }).merge(
+        df_invoices.rename(columns={'id': 'invoice_id'}),
+        on='invoice_id',
+        how='inner'
+    )
+    por_orden = facturas_por_orden.groupby('order_id')
+    facturado = por_orden['amount_total'].sum().reindex(agregado.index, fill_value=0.0)
+    residual = por_orden['amount_residual'].sum().reindex(agregado.index, fill_value=0.0)
+    if payment_state_field:
+        estados_pago = por_orden[payment_state_field].agg(unir_unicos).reindex(agregado.index, fill_value='')
+    else:
+        estados_pago = pd.Series('', index=agregado.index)
+
+    o = df_ord.loc[agregado.index]
+    df_orders = pd.DataFrame({
+        'Orden': o['name'],
+        'Estado de Orden': o['state'],
+        'Cliente': o['partner_id_name'],
+        'Fecha Orden': o['date_order'],
+        'Agencia': o['team_id_name'],
+        'Vendedor': o['user_id_name'],
+        'Estado Facturación Orden': o['invoice_status'].map(INVOICE_STATUS).fillna(o['invoice_status']),
+        'Códigos CL': agregado['codigos'],
+        'Productos CL': agregado['productos'],
+        'Cantidad Total (CL)': agregado['cantidad'].round().astype(int),
+        'Subtotal Total (CL)': agregado['subtotal'],
+        'Facturas (IDs)': o['invoice_ids'].map(lambda ids: ','.join(str(x) for x in ids)),
+        'Facturado (posted)': facturado,
+        'Pagado (posted)': facturado - residual,
+        'Saldo Adeudado (posted)': residual,
+        'Estado Pago Factura (posted)': estados_pago,
+    }).reset_index(drop=True)
+
+    # 5.b) Facturado (posted) asignado por Código CL (distribución proporcional por subtotal de líneas CL)
+    df_facturado_por_cl = pd.DataFrame(columns=['Código CL', 'Facturado (posted)'])
+    df_cl_lines = df_lines[df_lines['Código CL'].fillna('') != '']
+    if not df_cl_lines.empty and not df_orders.empty:
+        df_cl_lines = pd.DataFrame({
+            'Orden': df_cl_lines['order_id'].map(df_ord['name']).to_numpy(),
+            'Código CL': df_cl_lines['Código CL'].to_numpy(),
+            'Subtotal Línea (CL)': df_cl_lines['price_subtotal'].to_numpy(),
+        })
+        df_cl_lines['Facturado (posted) asignado'] = asignar_facturado_por_cl(
+            df_cl_lines, df_orders[['Orden', 'Facturado (posted)']]
+        )
+        df_facturado_por_cl = df_cl_lines.groupby('Código CL', as_index=False)['Facturado (posted) asignado'].sum().rename(
+            columns={'Facturado (posted) asignado': 'Facturado (posted)'}
+        )
+
+    # 6) Tabla de pagos: conciliaciones de las facturas o, si no hay, la vía estándar
+    facturas = df_invoices['id'].dropna().astype(int)
+    df_payments = _de_facturas(datos['pagos'], facturas)
+    if df_payments.empty:
+        df_payments = _de_facturas(datos['pagos_sin_conciliacion'], facturas)
+
+    total_pagos_unicos = 0.0
+    if not df_payments.empty and 'Pago ID' in df_payments.columns:
+        total_pagos_unicos = float(df_payments.drop_duplicates(subset=['Pago ID'])['Monto Pago'].sum())
+
+    total_aplicado = float(df_payments['Monto Aplicado'].sum()) if (not df_payments.empty and 'Monto Aplicado' in df_payments.columns) else 0.0
+    total_pagado_facturas = float(df_orders['Pagado (posted)'].sum()) if not df_orders.empty else 0.0
+    gap_aplicado_vs_factura = float(total_aplicado - total_pagado_facturas)
+
+    total_plazas = float(df_orders['Cantidad Total (CL)'].sum()) if (not df_orders.empty and 'Cantidad Total (CL)' in df_orders.columns) else 0.0
+
+    totals = {
+        'total_pagado': float(df_orders['Pagado (posted)'].sum()) if not df_orders.empty else 0,
+        'total_saldo': float(df_orders['Saldo Adeudado (posted)'].sum()) if not df_orders.empty else 0,
+        'total_facturado_posted': float(df_orders['Facturado (posted)'].sum()) if not df_orders.empty else 0,
+        'total_pagos_detalle': float(df_payments['Monto Pago'].sum()) if not df_payments.empty else 0,
+        'total_pagos_unicos': total_pagos_unicos,
+        'total_aplicado': total_aplicado,
+        'gap_aplicado_vs_pagado_factura': gap_aplicado_vs_factura,
+        'total_plazas': total_plazas,
+    }
+
+    return df_orders, df_payments, totals, df_facturado_por_cl
@@ -0,0 +1,239 @@
+# reconciliation_snapshot.py
+"""Cuadratura precalculada (snapshot) de todos los paquetes activos.
+
+Cada noche (primera ejecución desde la `HORA_SNAPSHOT`, hora local) se consultan en Odoo las
+variantes, órdenes, facturas y pagos conciliados de todos los paquetes activos (ESTADOS_ACTIVOS)
+y se guardan en disco sin armar (ver reconciliation.cargar_datos_conciliacion). Durante el día el
+snapshot se actualiza por paquete: solo se vuelven a consultar los paquetes con variantes, líneas
+de venta, órdenes o facturas modificadas (write_date) desde la última actualización.
+
+La página de Cuadratura arma el resultado de los paquetes elegidos filtrando el snapshot
+(`cuadratura_desde_snapshot`), sin consultar Odoo. Si algún paquete no está en el snapshot, o se
+pide la consulta en vivo, se consulta Odoo como antes.
+
+Lo ejecuta el hilo de precarga (cache_warmer.py) cada `INTERVALO_SNAPSHOT` segundos; también se
+puede generar completo a mano o desde un cron: `python reconciliation_snapshot.py`.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from catalog_store import ESTADOS_ACTIVOS
+from period_cache import escribir_archivo, leer_archivo
+from reconciliation import (
+    CAMPOS_PRODUCTOS_CL,
+    armar_ordenes_y_pagos,
+    cargar_datos_conciliacion,
+    corte_cambios,
+    tabla_productos_cl,
+)
+from seat_counters import load_frame_con_plazas
+
+HORA_SNAPSHOT = int(os.getenv('HORA_SNAPSHOT_CONCILIACION', '3'))
+INTERVALO_SNAPSHOT = int(os.getenv('INTERVALO_SNAPSHOT_CONCILIACION', '900'))
+RUTA_SNAPSHOT = os.getenv(
+    'CACHE_CONCILIACION',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'conciliacion', 'snapshot.pkl')
+)
+VERSION_SNAPSHOT = 2
+
+_SNAPSHOT = {'snapshot': None, 'mtime': None}
+_LOCK = threading.Lock()
+
+
+def _ultima_generacion(ahora=None):
+    """time.time() de la última HORA_SNAPSHOT: un snapshot completo anterior se vuelve a generar."""
+    ahora = ahora or datetime.now()
+    hora = ahora.replace(hour=HORA_SNAPSHOT, minute=0, second=0, microsecond=0)
+    return (hora if hora <= ahora else hora - timedelta(days=1)).timestamp()
+
+
+def _paquetes_activos(odoo):
+    registros = odoo.search_read_paginado(
+        'product.template', domain=[('x_studio_estado_viaje', 'in', ESTADOS_ACTIVOS)], fields=['id']
+    )
+    return {int(r['id']) for r in registros}
+
+
+def _cargar_paquetes(odoo, template_ids, refrescar=False):
+    """Variantes (con plazas) y datos de conciliación de los paquetes; las variantes se leen una vez.
+
+    Las órdenes y facturas sin cambios salen de memoria (ver reconciliation.py), salvo con `refrescar`.
+    """
+    df_productos = load_frame_con_plazas(
+        odoo, 'product.product', domain=[('product_tmpl_id', 'in', sorted(template_ids))], fields=CAMPOS_PRODUCTOS_CL
+    )
+    return df_productos, cargar_datos_conciliacion(odoo, df_productos, refrescar=refrescar)
+
+
+def cargar_snapshot():
+    """Snapshot guardado en disco (se relee solo si el archivo cambió), o None si no hay."""
+    try:
+        mtime = os.path.getmtime(RUTA_SNAPSHOT)
+    except OSError:
+        return None
+    with _LOCK:
+        if _SNAPSHOT['mtime'] == mtime:
+            return _SNAPSHOT['snapshot']
+
+    snapshot = leer_archivo(RUTA_SNAPSHOT)
+    if snapshot is not None and snapshot.get('version') != VERSION_SNAPSHOT:
+        snapshot = None
+    with _LOCK:
+        _SNAPSHOT.update(snapshot=snapshot, mtime=mtime)
+    return snapshot
+
+
+def _guardar(snapshot):
+    with _LOCK:
+        escribir_archivo(RUTA_SNAPSHOT, snapshot)
+        _SNAPSHOT.update(snapshot=snapshot, mtime=os.path.getmtime(RUTA_SNAPSHOT))
+    return snapshot
+
+
+def generar_snapshot(odoo):
+    """Consulta la cuadratura completa de todos los paquetes activos y la guarda en disco."""
+    corte = corte_cambios()
+    paquetes = _paquetes_activos(odoo)
+    df_productos, datos = _cargar_paquetes(odoo, paquetes, refrescar=True)
+    ahora = time.time()
+    return _guardar({
+        'version': VERSION_SNAPSHOT,
+        'paquetes': frozenset(paquetes),
+        'productos': df_productos,
+        'datos': datos,
+        'generado': ahora,
+        'actualizado': ahora,
+        'corte': corte,
+    })
+
+
+def _paquetes_modificados(odoo, snapshot, paquetes):
+    """Paquetes activos con cambios desde el último corte: nuevos en el alcance, paquetes o variantes
+    editados, y ventas con líneas, órdenes o facturas modificadas."""
+    corte = snapshot['corte']
+    ids = sorted(paquetes)
+    modificados = set(paquetes - snapshot['paquetes'])
+    if not ids:
+        return modificados
+
+    editados = odoo.search_read(
+        'product.template', domain=[('id', 'in', ids), ('write_date', '>', corte)], fields=['id']
+    )
+    modificados.update(int(r['id']) for r in editados)
+
+    variantes = odoo.search_read(
+        'product.product', domain=[('product_tmpl_id', 'in', ids), ('write_date', '>', corte)],
+        fields=['product_tmpl_id'], m2o_ids=True, nombres_m2o=[]
+    )
+    modificados.update(int(r['product_tmpl_id'][0]) for r in variantes if r['product_tmpl_id'])
+
+    lineas = odoo.search_read(
+        'sale.order.line',
+        domain=[
+            ('product_id.product_tmpl_id', 'in', ids),
+            '|', '|',
+            ('write_date', '>', corte),
+            ('order_id.write_date', '>', corte),
+            ('order_id.invoice_ids.write_date', '>', corte),
+        ],
+        fields=['product_id'],
+        m2o_ids=True,
+        nombres_m2o=[]
+    )
+    por_producto = snapshot['productos'].set_index('id')['product_tmpl_id']
+    for linea in lineas:
+        paquete = por_producto.get(int(linea['product_id'][0])) if linea['product_id'] else None
+        if paquete is not None and not pd.isna(paquete):
+            modificados.add(int(paquete))
+    return modificados & paquetes
+
+
+def _sin_facturas(df, invoice_ids):
+    if df.empty:
+        return df
+    return df[~df['Factura ID'].isin(invoice_ids)]
+
+
+def _combinar(snapshot, reemplazados, df_productos, datos):
+    """Snapshot con los datos de los paquetes `reemplazados` cambiados por los recién consultados.
+
+    Las órdenes y facturas se reemplazan por id; los pagos, por factura de las órdenes consultadas.
+    Productos y líneas quedan ordenados por código y por orden (como los devuelve Odoo).
+    """
+    viejos = snapshot['productos']
+    quitados = viejos['id'][viejos['product_tmpl_id'].isin(reemplazados)]
+    productos = pd.concat([viejos[~viejos['product_tmpl_id'].isin(reemplazados)], df_productos], ignore_index=True)
+    productos = productos.sort_values(['default_code', 'id'], kind='mergesort', ignore_index=True)
+
+    base = snapshot['datos']
+    if base is None:
+        combinados = datos
+    else:
+        combinados = dict(base, lineas=base['lineas'][~base['lineas']['product_id'].isin(quitados)])
+        if datos is not None:
+            facturas = {int(i) for ids in datos['ordenes']['invoice_ids'] for i in ids}
+            combinados.update(
+                lineas=pd.concat([combinados['lineas'], datos['lineas']]).sort_values(
+                    ['order_id', 'id'], kind='mergesort', ignore_index=True
+                ),
+                ordenes=pd.concat([base['ordenes'][~base['ordenes'].index.isin(datos['ordenes'].index)], datos['ordenes']]),
+                facturas=pd.concat(
+                    [base['facturas'][~base['facturas']['id'].isin(facturas)], datos['facturas']], ignore_index=True
+                ),
+                pagos=pd.concat([_sin_facturas(base['pagos'], facturas), datos['pagos']], ignore_index=True),
+                pagos_sin_conciliacion=pd.concat(
+                    [_sin_facturas(base['pagos_sin_conciliacion'], facturas), datos['pagos_sin_conciliacion']],
+                    ignore_index=True
+                ),
+            )
+    if combinados is not None:
+        combinados['productos'] = productos[['id', 'default_code', 'name']]
+    return dict(snapshot, productos=productos, datos=combinados)
+
+
+def actualizar_snapshot(odoo):
+    """Actualiza el snapshot con los paquetes que cambiaron; sin snapshot, o si el completo es
+    anterior a la última HORA_SNAPSHOT, genera uno completo."""
+    snapshot = cargar_snapshot()
+    if snapshot is None or snapshot['generado'] < _ultima_generacion():
+        return generar_snapshot(odoo)
+
+    corte = corte_cambios()
+    paquetes = _paquetes_activos(odoo)
+    modificados = _paquetes_modificados(odoo, snapshot, paquetes)
+    reemplazados = modificados | (snapshot['paquetes'] - paquetes)
+    if reemplazados:
+        df_productos, datos = _cargar_paquetes(odoo, modificados) if modificados else (pd.DataFrame(), None)
+        snapshot = _combinar(snapshot, reemplazados, df_productos, datos)
+    return _guardar(dict(snapshot, paquetes=frozenset(paquetes), actualizado=time.time(), corte=corte))
+
+
+def snapshot_cubre(snapshot, template_ids):
+    """True si todos los paquetes están en el snapshot."""
+    return snapshot is not None and set(template_ids) <= snapshot['paquetes']
+
+
+def cuadratura_desde_snapshot(snapshot, template_ids, codigo_cl_exacto=None):
+    """(df_productos_cl, df_orders, df_payments, totals, df_facturado_por_cl) de los paquetes, armado
+    desde el snapshot igual que la consulta en vivo; None si algún paquete no está en el snapshot."""
+    if not snapshot_cubre(snapshot, template_ids):
+        return None
+
+    df = snapshot['productos']
+    df = df[df['product_tmpl_id'].isin(template_ids)]
+    if codigo_cl_exacto:
+        df = df[df['default_code'] == str(codigo_cl_exacto)]
+
+    df_orders, df_payments, totals, df_facturado_por_cl = armar_ordenes_y_pagos(snapshot['datos'], product_ids=df['id'])
+    return tabla_productos_cl(df), df_orders, df_payments, totals, df_facturado_por_cl
+
+
+if __name__ == '__main__':
+    from odoo_client import OdooClient
+
+    snapshot = generar_snapshot(OdooClient())
+    print(f"Snapshot de cuadratura: {len(snapshot['paquetes'])} paquetes, {len(snapshot['productos'])} productos")
@@ -0,0 +1,113 @@
+# reference_data.py
+"""Datos de referencia compartidos entre páginas: mapas de estados y nombres de registros.
+
+- ESTADO_PAQUETE e INVOICE_STATUS: mapas fijos de códigos a nombres.
+- Equipos de venta (crm.team), vendedores (res.users) y clientes (res.partner): nombres por id,
+  guardados en memoria del proceso (compartidos entre sesiones) durante `TTL_REFERENCIAS`
+  segundos. Solo los ids que faltan o vencieron se piden a Odoo, en lotes de `TAMANO_LOTE_NOMBRES`;
+  al guardar nombres nuevos se descartan los vencidos del modelo.
+
+Así un loader puede leer solo los ids de los many2one y resolver los nombres aquí.
+"""
+import threading
+import time
+
+import pandas as pd
+
+# Mapeo de códigos de estado de paquete (x_studio_estado_viaje) a nombres descriptivos
+ESTADO_PAQUETE = {
+    0: 'Bloqueado',
+    1: 'Inactivo',
+    2: 'Pendiente',
+    3: 'Activo',
+    4: 'Validación',
+    5: 'Cerrado',
+    6: 'Rendido',
+    7: 'Liquidado',
+    8: 'Pre-confirmado',
+    9: 'Anulado',
+    10: 'Social'
+}
+
+# Estados de facturación de sale.order
+INVOICE_STATUS = {
+    'upselling': 'Oportunidad de Venta Adicional',
+    'invoiced': 'Facturado',
+    'to invoice': 'Por Facturar',
+    'no': 'Nada que Facturar'
+}
+
+TTL_REFERENCIAS = 600
+TAMANO_LOTE_NOMBRES = 1000
+
+_NOMBRES = {}   # modelo -> {id: (momento, nombre)}
+_EQUIPOS = {}   # 'lista' -> (momento, [{'id', 'name'}])
+_LOCK = threading.Lock()
+
+
+def mapear_estados(codigos):
+    """Traduce una columna de códigos de estado de paquete a su nombre (ESTADO_PAQUETE)."""
+    codigos = pd.to_numeric(codigos, errors='coerce').astype('Int64')
+    nombres = codigos.map(ESTADO_PAQUETE).astype(object)
+    sin_nombre = nombres.isna() & codigos.notna()
+    nombres[sin_nombre] = 'Estado ' + codigos[sin_nombre].astype(str)
+    return nombres.fillna('No definido')
+
+
+def _vigente(momento, ahora):
+    return ahora - momento <= TTL_REFERENCIAS
+
+
+def equipos(odoo, refrescar=False):
+    """Equipos de venta (agencias) como [{'id', 'name'}], en memoria por TTL_REFERENCIAS.
+
+    Con `refrescar` se consultan en Odoo aunque estén en memoria.
+    """
+    ahora = time.monotonic()
+    with _LOCK:
+        entrada = _EQUIPOS.get('lista')
+        if not refrescar and entrada is not None and _vigente(entrada[0], ahora):
+            return entrada[1]
+
+    lista = odoo.search_read('crm.team', domain=[], fields=['id', 'name'])
+    with _LOCK:
+        _EQUIPOS['lista'] = (ahora, lista)
+        # Los nombres de equipos también quedan disponibles para `nombres('crm.team', ...)`
+        guardados = _NOMBRES.setdefault('crm.team', {})
+        for equipo in lista:
+            guardados[equipo['id']] = (ahora, equipo['name'])
+    return lista
+
+
+def nombres(odoo, model, ids):
+    """{id: nombre} de los registros `ids` de `model`; solo los que faltan se piden a Odoo.
+
+    Usa `read` (no search_read) para incluir registros archivados, igual que el nombre que
+    Odoo pone en un many2one. Los errores de Odoo (p. ej. sin acceso al modelo o registros
+    borrados) se propagan: el llamador decide cómo obtener los nombres (ver OdooClient.search_read).
+    """
+    ids = {int(i) for i in ids if i}
+    ahora = time.monotonic()
+    with _LOCK:
+        guardados = _NOMBRES.setdefault(model, {})
+        resultado = {i: guardados[i][1] for i in ids if i in guardados and _vigente(guardados[i][0], ahora)}
+
+    faltantes = sorted(ids - resultado.keys())
+    if faltantes:
+        with _LOCK:
+            for i in [i for i, (momento, _) in guardados.items() if not _vigente(momento, ahora)]:
+                del guardados[i]
+        for inicio in range(0, len(faltantes), TAMANO_LOTE_NOMBRES):
+            leidos = odoo.read(model, faltantes[inicio:inicio + TAMANO_LOTE_NOMBRES], ['display_name'])
+            with _LOCK:
+                for registro in leidos:
+                    guardados[registro['id']] = (ahora, registro['display_name'])
+                    resultado[registro['id']] = registro['display_name']
+    return resultado
+
+
+def limpiar_referencias():
+    """Descarta los nombres y equipos guardados en memoria (botones de recarga de las páginas)."""
+    with _LOCK:
+        _NOMBRES.clear()
+        _EQUIPOS.clear()
@@ -0,0 +1,107 @@
+# results_cache.py
+"""Resultados de páginas guardados en disco y compartidos entre sesiones.
+
+Cada resultado se guarda por consulta (`nombre`) y firma de filtros (`firma`, con repr estable),
+junto con la versión de los datos con que se armó (p. ej. la hora de actualización del snapshot
+de cuadratura). Se sirve a cualquier sesión, también después de recargar el navegador o de
+reiniciar la app, mientras la versión coincida y, si se indica `ttl`, no sea más antiguo que
+eso. Una versión nueva reemplaza a la anterior de la misma firma.
+
+El directorio se mantiene bajo `MAX_RESULTADOS_MB`: al guardar se borran los resultados usados
+hace más tiempo. `invalidar_resultados()` los descarta a mano (botón "Limpiar").
+"""
+import contextlib
+import hashlib
+import os
+import threading
+import time
+
+from period_cache import escribir_archivo, leer_archivo
+
+DIRECTORIO_RESULTADOS = os.getenv(
+    'CACHE_RESULTADOS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'resultados')
+)
+MAX_RESULTADOS_MB = int(os.getenv('MAX_RESULTADOS_MB', '200'))
+
+_LOCK = threading.Lock()
+
+
+def _ruta(nombre, firma):
+    huella = hashlib.sha1(repr((nombre, firma)).encode('utf-8')).hexdigest()
+    return os.path.join(DIRECTORIO_RESULTADOS, f"{nombre}-{huella}.pkl")
+
+
+def cargar_resultado(nombre, firma, version, ttl=None):
+    """Resultado guardado de (`nombre`, `firma`) para la `version` de los datos, o None.
+
+    Devuelve (datos, time.time() del guardado). Con `ttl`, los resultados más antiguos no se sirven.
+    """
+    ruta = _ruta(nombre, firma)
+    entrada = leer_archivo(ruta)
+    if entrada is None or entrada['firma'] != firma or entrada['version'] != version:
+        return None
+    if ttl is not None and time.time() - entrada['guardado'] > ttl:
+        return None
+    # Marca el uso para que la limpieza por tamaño borre primero los que nadie consulta
+    with contextlib.suppress(OSError):
+        os.utime(ruta)
+    return entrada['datos'], entrada['guardado']
+
+
+def guardar_resultado(nombre, firma, version, datos):
+    """Guarda el resultado (reemplaza el de otra versión) y recorta el directorio a MAX_RESULTADOS_MB."""
+    guardado = time.time()
+    with _LOCK:
+        escribir_archivo(_ruta(nombre, firma), {
+            'nombre': nombre, 'firma': firma, 'version': version, 'guardado': guardado, 'datos': datos,
+        })
+        _recortar(MAX_RESULTADOS_MB * 1024 * 1024)
+    return guardado
+
+
+def _recortar(maximo):
+    """Borra los resultados usados hace más tiempo hasta que el directorio ocupe a lo más `maximo` bytes."""
+    archivos = []
+    for archivo in os.listdir(DIRECTORIO_RESULTADOS):
+        if not archivo.endswith('.pkl'):
+            continue
+        ruta = os.path.join(DIRECTORIO_RESULTADOS, archivo)
+        try:
+            estado = os.stat(ruta)
+        except OSError:
+            continue
+        archivos.append((estado.st_mtime, estado.st_size, ruta))
+
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, ruta in sorted(archivos):
+        if total <= maximo:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            continue
+        total -= tamano
+
+
+def invalidar_resultados(nombre=None, firma=None):
+    """Borra del disco los resultados guardados (todos, los de la consulta `nombre` o solo los de `firma`)."""
+    if not os.path.isdir(DIRECTORIO_RESULTADOS):
+        return 0
+    if nombre is not None and firma is not None:
+        rutas = [_ruta(nombre, firma)]
+    else:
+        rutas = [
+            os.path.join(DIRECTORIO_RESULTADOS, archivo)
+            for archivo in os.listdir(DIRECTORIO_RESULTADOS)
+            if archivo.endswith('.pkl') and (nombre is None or archivo.startswith(f"{nombre}-"))
+        ]
+    borrados = 0
+    with _LOCK:
+        for ruta in rutas:
+            try:
+                os.remove(ruta)
+                borrados += 1
+            except OSError:
+                continue
+    return borrados
@@ -0,0 +1,89 @@
+# sales_cube.py
+"""Cubo de ventas pre-agregado: medidas sumadas por combinación de dimensiones.
+
+Un cubo es un DataFrame con una fila por celda (combinación de valores de las dimensiones, p. ej.
+Destino × Agencia × Mes × Tipo de Cupo × Estado de Paquete) y columnas con las medidas sumadas
+(pasajeros, ventas, comisión), más:
+- 'Líneas': cantidad de filas de la tabla de hechos en la celda,
+- 'Órdenes': órdenes distintas, cada una contada una vez en la celda de su primera línea. Al
+  agrupar por dimensiones de la orden (Agencia, Mes, estado de facturación) el conteo es exacto.
+
+Los cubos de cada mes se calculan una vez (ver month_store.cubo_rango) y se suman entre sí;
+los KPI y resúmenes salen de `filtrar` + `agrupar`/`totales` sobre el cubo, sin recorrer las
+líneas. El detalle fila a fila se consulta solo cuando se pide.
+
+'Mes' es una dimensión derivada del índice de fecha de la tabla de hechos (período mensual).
+"""
+import pandas as pd
+
+DIMENSION_MES = 'Mes'
+
+
+def _claves(df, dimensiones):
+    return [
+        pd.Series(df.index.to_period('M'), index=df.index, name=DIMENSION_MES)
+        if d == DIMENSION_MES and d not in df.columns else df[d]
+        for d in dimensiones
+    ]
+
+
+def _medidas(medidas):
+    return list(medidas) + ['Líneas', 'Órdenes']
+
+
+def _vacio(dimensiones, medidas):
+    return pd.DataFrame(columns=list(dimensiones) + _medidas(medidas))
+
+
+def construir_cubo(df, dimensiones, medidas, columna_orden=None):
+    """Cubo de `df` (tabla de hechos) por `dimensiones`, sumando `medidas`.
+
+    Las celdas quedan en el orden de primera aparición en `df`.
+    """
+    if df.empty:
+        return _vacio(dimensiones, medidas)
+
+    claves = _claves(df, dimensiones)
+    grupos = df.groupby(claves, sort=False, dropna=False)
+    cubo = grupos[list(medidas)].sum()
+    cubo['Líneas'] = grupos.size()
+    if columna_orden:
+        primera_linea = ~df[columna_orden].duplicated()
+        cubo['Órdenes'] = primera_linea.groupby(claves, sort=False, dropna=False).sum()
+    else:
+        cubo['Órdenes'] = cubo['Líneas']
+    return cubo.reset_index()
+
+
+def agrupar(cubo, dimensiones, medidas, sort=True):
+    """Roll-up: suma las celdas del cubo a un subconjunto de sus dimensiones."""
+    if cubo.empty:
+        return _vacio(dimensiones, medidas)
+    return cubo.groupby(list(dimensiones), sort=sort, dropna=False)[_medidas(medidas)].sum().reset_index()
+
+
+def sumar_cubos(cubos, dimensiones, medidas):
+    """Cubo con las celdas de varios cubos (p. ej. un cubo por mes) sumadas."""
+    cubos = [c for c in cubos if not c.empty]
+    if not cubos:
+        return _vacio(dimensiones, medidas)
+    if len(cubos) == 1:
+        return cubos[0].copy()
+    return agrupar(pd.concat(cubos, ignore_index=True), dimensiones, medidas, sort=False)
+
+
+def filtrar(cubo, filtros):
+    """Slice: celdas cuyas dimensiones están en los valores dados ({dimensión: valores}).
+
+    Un filtro vacío o None no filtra.
+    """
+    mascara = pd.Series(True, index=cubo.index)
+    for dimension, valores in filtros.items():
+        if valores:
+            mascara &= cubo[dimension].isin(list(valores))
+    return cubo[mascara]
+
+
+def totales(cubo, medidas):
+    """Suma de cada medida en todo el cubo (roll-up a ninguna dimensión)."""
+    return {m: cubo[m].sum() if not cubo.empty else 0 for m in _medidas(medidas)}
@@ -0,0 +1,203 @@
+# schemas.py
+"""Declaración de tipos por modelo de Odoo y conversión en bloque al cargar datos.
+
+Odoo devuelve `False` para campos vacíos, many2one como `[id, nombre]` y fechas como strings.
+Cada modelo declara aquí el tipo de sus campos y `to_frame`/`load_frame` convierten los
+registros a un DataFrame tipado una sola vez, al entrar a la aplicación. El código de las
+páginas trabaja directamente con columnas numéricas, de fecha y de ids enteros.
+"""
+import pandas as pd
+
+# Tipos soportados:
+#   'float'    -> float64 (vacío = 0.0)
+#   'int'      -> Int64 nullable (vacío = NA), p. ej. códigos de estado
+#   'id'       -> Int64 nullable
+#   'm2o'      -> Int64 con el id + columna '<campo>_name' con el nombre
+#   'ids'      -> lista de ids (x2many, vacío = [])
+#   'str'      -> string (vacío = '')
+#   'date'     -> datetime64 (vacío = NaT)
+#   'datetime' -> datetime64 (vacío = NaT)
+_CAMPOS_PAQUETE = {
+    'id': 'id',
+    'name': 'str',
+    'default_code': 'str',
+    'list_price': 'float',
+    'x_studio_lote': 'str',
+    'x_studio_destino': 'str',
+    'x_studio_transporte': 'str',
+    'x_studio_estado_viaje': 'int',
+    'x_studio_tipo_de_cupo': 'str',
+    'x_studio_ida_fecha_salida': 'date',
+    'x_studio_boletos_totales': 'float',
+    'x_studio_boletos_reservados': 'float',
+    'x_product_count_pagados_stat_inf': 'float',
+    'x_studio_boletos_disponibles': 'float',
+    'x_studio_comision_agencia': 'float',
+}
+
+SCHEMAS = {
+    'product.template': dict(_CAMPOS_PAQUETE),
+    'product.product': dict(_CAMPOS_PAQUETE, product_tmpl_id='m2o'),
+    'sale.order': {
+        'id': 'id',
+        'name': 'str',
+        'partner_id': 'm2o',
+        'date_order': 'datetime',
+        'amount_total': 'float',
+        'invoice_status': 'str',
+        'user_id': 'm2o',
+        'team_id': 'm2o',
+        'state': 'str',
+        'order_line': 'ids',
+        'invoice_ids': 'ids',
+    },
+    'sale.order.line': {
+        'id': 'id',
+        'order_id': 'm2o',
+        'product_id': 'm2o',
+        'product_uom_qty': 'float',
+        'price_unit': 'float',
+        'price_subtotal': 'float',
+        'name': 'str',
+    },
+    'account.move': {
+        'id': 'id',
+        'name': 'str',
+        'move_type': 'str',
+        'partner_id': 'm2o',
+        'invoice_origin': 'str',
+        'invoice_date': 'date',
+        'amount_total': 'float',
+        'amount_residual': 'float',
+        'amount_total_signed': 'float',
+        'currency_id': 'm2o',
+        'state': 'str',
+        'payment_state': 'str',
+        'invoice_payment_state': 'str',
+    },
+    'account.move.line': {
+        'id': 'id',
+        'move_id': 'm2o',
+        'date': 'date',
+        'name': 'str',
+        'partner_id': 'm2o',
+        'account_id': 'm2o',
+        'debit': 'float',
+        'credit': 'float',
+        'balance': 'float',
+        'account_internal_type': 'str',
+        'internal_type': 'str',
+    },
+    'account.partial.reconcile': {
+        'id': 'id',
+        'debit_move_id': 'm2o',
+        'credit_move_id': 'm2o',
+        'amount': 'float',
+        'amount_currency': 'float',
+        'max_date': 'date',
+        'create_date': 'datetime',
+    },
+    'account.payment': {
+        'id': 'id',
+        'name': 'str',
+        'date': 'date',
+        'amount': 'float',
+        'payment_type': 'str',
+        'partner_id': 'm2o',
+        'ref': 'str',
+        'journal_id': 'm2o',
+        'move_id': 'm2o',
+        'reconciled_invoice_ids': 'ids',
+        'state': 'str',
+    },
+    'crm.team': {
+        'id': 'id',
+        'name': 'str',
+    },
+}
+
+
+def _sin_falsos(serie):
+    """Reemplaza el `False` de Odoo (campo vacío) por NA."""
+    if serie.dtype == bool:
+        return pd.Series(pd.NA, index=serie.index, dtype=object)
+    if serie.dtype != object:
+        return serie
+    return serie.mask(serie.map(lambda v: v is False))
+
+
+def _a_float(serie):
+    return pd.to_numeric(_sin_falsos(serie), errors='coerce').fillna(0.0).astype(float)
+
+
+def _a_int(serie):
+    return pd.to_numeric(_sin_falsos(serie), errors='coerce').round().astype('Int64')
+
+
+def _a_str(serie):
+    serie = _sin_falsos(serie)
+    return serie.where(serie.notna(), '').astype(str)
+
+
+def _a_fecha(serie):
+    return pd.to_datetime(_sin_falsos(serie), errors='coerce')
+
+
+def _a_ids(serie):
+    return serie.map(lambda v: list(v) if isinstance(v, (list, tuple)) else [])
+
+
+_CONVERSORES = {
+    'float': _a_float,
+    'int': _a_int,
+    'id': _a_int,
+    'str': _a_str,
+    'date': _a_fecha,
+    'datetime': _a_fecha,
+    'ids': _a_ids,
+}
+
+
+def coerce_frame(df, model):
+    """Convierte en bloque las columnas de `df` según el schema declarado para `model`.
+
+    Las columnas sin declaración se dejan como vienen. Los many2one se separan en el id
+    (columna original) y el nombre ('<campo>_name').
+    """
+    schema = SCHEMAS.get(model, {})
+    for campo, tipo in schema.items():
+        if campo not in df.columns:
+            continue
+        if tipo == 'm2o':
+            pares = df[campo].map(lambda v: v if isinstance(v, (list, tuple)) and len(v) >= 2 else (None, None))
+            df[f'{campo}_name'] = _a_str(pares.map(lambda v: v[1]))
+            df[campo] = _a_int(pares.map(lambda v: v[0]))
+        else:
+            df[campo] = _CONVERSORES[tipo](df[campo])
+    return df
+
+
+def to_frame(model, records, fields=None):
+    """Construye un DataFrame tipado a partir de registros de search_read.
+
+    Si se indican `fields`, los campos que Odoo no devolvió se agregan vacíos (con el valor
+    por defecto de su tipo), para que el código posterior no tenga que verificar columnas.
+    """
+    df = pd.DataFrame(records)
+    for campo in fields or []:
+        if campo not in df.columns:
+            df[campo] = pd.Series([False] * len(df), index=df.index, dtype=object)
+    return coerce_frame(df, model)
+
+
+def load_frame(odoo, model, domain=None, fields=None, page_size=None, m2o_ids=False, nombres_m2o=None):
+    """search_read + conversión de tipos en un solo paso (en páginas si se indica `page_size`).
+
+    `m2o_ids`/`nombres_m2o`: many2one leídos solo como id (ver OdooClient.search_read).
+    """
+    opciones = {'m2o_ids': m2o_ids, 'nombres_m2o': nombres_m2o} if m2o_ids else {}
+    if page_size:
+        records = odoo.search_read_paginado(model, domain=domain, fields=fields, page_size=page_size, **opciones)
+    else:
+        records = odoo.search_read(model, domain=domain, fields=fields, **opciones)
+    return to_frame(model, records, fields)
@@ -0,0 +1,229 @@
+# seat_counters.py
+"""Plazas reservadas, pagadas y disponibles calculadas localmente desde las líneas de venta.
+
+x_studio_boletos_reservados, x_product_count_pagados_stat_inf y x_studio_boletos_disponibles
+son campos calculados: Odoo los evalúa registro por registro en cada search_read del catálogo.
+Con `CONTADORES_PLAZAS_LOCALES=1` en el entorno, los paquetes se leen sin esos campos y las
+plazas se calculan con un read_group sobre sale.order.line de órdenes confirmadas:
+
+- pagadas: cantidad de las líneas ya facturadas (invoice_status en ESTADOS_PAGADO)
+- reservadas: cantidad del resto de las líneas
+- disponibles: totales - reservadas - pagadas
+
+La regla aproxima a los campos de Odoo, así que se valida contra Odoo: la primera consulta (y
+la primera después de `TTL_VALIDACION` segundos) pide igual los campos de Odoo y compara una
+muestra de los paquetes consultados con los contadores locales. Mientras la validación esté
+vigente, si coincidió las plazas se calculan aquí; si no, las consultas piden los campos a Odoo.
+Los contadores quedan en memoria por paquete durante `TTL_CONTADORES` segundos.
+"""
+import os
+import random
+import threading
+import time
+
+import pandas as pd
+
+from schemas import load_frame, to_frame
+
+CAMPOS_PLAZAS = [
+    'x_studio_boletos_reservados',
+    'x_product_count_pagados_stat_inf',
+    'x_studio_boletos_disponibles',
+]
+
+# Órdenes cuyas líneas ocupan plazas, y estados de facturación de línea que cuentan como pagadas
+ESTADOS_CONFIRMADOS = ['sale', 'done']
+ESTADOS_PAGADO = ['invoiced']
+
+TAMANO_MUESTRA = 20
+TTL_CONTADORES = 300
+TTL_VALIDACION = 3600
+
+_CONTADORES = {}
+_VALIDACION = {'ok': None, 'hora': 0.0}
+_LOCK = threading.Lock()
+
+
+def contadores_locales_activos():
+    """True si el entorno pide calcular las plazas localmente (CONTADORES_PLAZAS_LOCALES)."""
+    return os.getenv('CONTADORES_PLAZAS_LOCALES', '').strip().lower() in ('1', 'true', 'si', 'sí')
+
+
+def modo_plazas():
+    """Cómo obtener las plazas en la próxima consulta.
+
+    'odoo': se piden los campos a Odoo (modo local inactivo o validación fallida vigente).
+    'local': se calculan aquí (validación vigente y correcta).
+    'validar': se piden a Odoo y se validan los contadores locales con esos valores.
+    """
+    if not contadores_locales_activos():
+        return 'odoo'
+    with _LOCK:
+        if _VALIDACION['ok'] is None or time.monotonic() - _VALIDACION['hora'] > TTL_VALIDACION:
+            return 'validar'
+        return 'local' if _VALIDACION['ok'] else 'odoo'
+
+
+def _calcular(odoo, template_ids):
+    """Reservadas y pagadas por plantilla, agregadas en Odoo por producto y estado de facturación."""
+    productos = odoo.search_read(
+        'product.product',
+        domain=[('product_tmpl_id', 'in', template_ids)],
+        fields=['id', 'product_tmpl_id']
+    )
+    plantilla_de = {p['id']: p['product_tmpl_id'][0] for p in productos if p.get('product_tmpl_id')}
+
+    grupos = odoo.read_group(
+        'sale.order.line',
+        domain=[
+            ('product_id.product_tmpl_id', 'in', template_ids),
+            ('order_id.state', 'in', ESTADOS_CONFIRMADOS),
+        ],
+        fields=['product_uom_qty:sum'],
+        groupby=['product_id', 'invoice_status'],
+        lazy=False
+    )
+    filas = pd.DataFrame(
+        [
+            (plantilla_de.get(g['product_id'][0]), g.get('invoice_status'), g.get('product_uom_qty') or 0.0)
+            for g in grupos if g.get('product_id')
+        ],
+        columns=['plantilla', 'invoice_status', 'cantidad']
+    ).dropna(subset=['plantilla'])
+
+    pagada = filas['invoice_status'].isin(ESTADOS_PAGADO)
+    return pd.DataFrame({
+        'reservadas': filas[~pagada].groupby('plantilla')['cantidad'].sum(),
+        'pagadas': filas[pagada].groupby('plantilla')['cantidad'].sum(),
+    }).reindex(template_ids).fillna(0.0)
+
+
+def contadores_plazas(odoo, template_ids):
+    """Reservadas y pagadas por plantilla (índice = id de product.template), con caché por paquete."""
+    ids = sorted({int(i) for i in template_ids})
+    ahora = time.monotonic()
+    with _LOCK:
+        vigentes = {
+            i: _CONTADORES[i][1]
+            for i in ids if i in _CONTADORES and ahora - _CONTADORES[i][0] <= TTL_CONTADORES
+        }
+
+    faltantes = [i for i in ids if i not in vigentes]
+    if faltantes:
+        nuevos = _calcular(odoo, faltantes)
+        with _LOCK:
+            for i, reservadas, pagadas in nuevos.itertuples(name=None):
+                _CONTADORES[i] = (ahora, (reservadas, pagadas))
+                vigentes[i] = (reservadas, pagadas)
+
+    return pd.DataFrame.from_dict(
+        {i: vigentes[i] for i in ids}, orient='index', columns=['reservadas', 'pagadas']
+    ).reindex(ids)
+
+
+def validar_muestra(odoo, df, columna_plantilla='id', tamano=TAMANO_MUESTRA):
+    """Compara los contadores locales con los campos de Odoo ya leídos en `df`, en una muestra
+    de las plantillas de `df`."""
+    en_odoo = (
+        df.dropna(subset=[columna_plantilla])
+        .astype({columna_plantilla: int})
+        .groupby(columna_plantilla)[['x_studio_boletos_reservados', 'x_product_count_pagados_stat_inf']]
+        .first()
+    )
+    ids = en_odoo.index.tolist()
+    muestra = sorted(random.sample(ids, min(tamano, len(ids))))
+    en_odoo = en_odoo.reindex(muestra)
+    locales = contadores_plazas(odoo, muestra)
+
+    comparacion = pd.DataFrame({
+        'reservadas_odoo': en_odoo['x_studio_boletos_reservados'],
+        'reservadas_local': locales['reservadas'],
+        'pagadas_odoo': en_odoo['x_product_count_pagados_stat_inf'],
+        'pagadas_local': locales['pagadas'],
+    })
+    comparacion['coincide'] = (
+        (comparacion['reservadas_odoo'] == comparacion['reservadas_local'])
+        & (comparacion['pagadas_odoo'] == comparacion['pagadas_local'])
+    )
+    return comparacion
+
+
+def validar_contadores(odoo, df, columna_plantilla='id'):
+    """Valida los contadores locales con los valores de Odoo de `df` y guarda el resultado
+    durante `TTL_VALIDACION` segundos."""
+    comparacion = validar_muestra(odoo, df, columna_plantilla)
+    if comparacion.empty:
+        return None
+    ok = bool(comparacion['coincide'].all())
+    if not ok:
+        print(
+            f"Contadores de plazas locales no coinciden con Odoo en "
+            f"{int((~comparacion['coincide']).sum())} de {len(comparacion)} paquetes; se usan los campos de Odoo"
+        )
+    with _LOCK:
+        _VALIDACION['ok'] = ok
+        _VALIDACION['hora'] = time.monotonic()
+    return ok
+
+
+def completar_plazas(odoo, df, columna_plantilla='id'):
+    """Completa en `df` las columnas de CAMPOS_PLAZAS.
+
+    Si `df` ya trae los campos de Odoo (consulta de validación), se usan para validar los
+    contadores locales y se dejan tal cual. Si no, se calculan localmente.
+    `df` debe tener `columna_plantilla` y 'x_studio_boletos_totales'.
+    """
+    if set(CAMPOS_PLAZAS) <= set(df.columns):
+        validar_contadores(odoo, df, columna_plantilla)
+        df[CAMPOS_PLAZAS] = df[CAMPOS_PLAZAS].fillna(0.0)
+        return df
+
+    plantillas = df[columna_plantilla].dropna().astype(int).unique().tolist()
+    contadores = contadores_plazas(odoo, plantillas).reindex(df[columna_plantilla])
+    reservadas = contadores['reservadas'].fillna(0.0).to_numpy()
+    pagadas = contadores['pagadas'].fillna(0.0).to_numpy()
+    df['x_studio_boletos_reservados'] = reservadas
+    df['x_product_count_pagados_stat_inf'] = pagadas
+    df['x_studio_boletos_disponibles'] = df['x_studio_boletos_totales'].to_numpy() - reservadas - pagadas
+    return df
+
+
+def load_frame_con_plazas(odoo, model, domain=None, fields=None, page_size=None):
+    """Como schemas.load_frame; con el modo local validado, las plazas no se piden a Odoo y se
+    calculan aquí (ver modo_plazas)."""
+    modo = modo_plazas() if set(CAMPOS_PLAZAS) & set(fields or []) else 'odoo'
+    if modo == 'odoo':
+        return load_frame(odoo, model, domain=domain, fields=fields, page_size=page_size)
+
+    columna_plantilla = 'product_tmpl_id' if model == 'product.product' else 'id'
+    if modo == 'local':
+        campos = [c for c in fields if c not in CAMPOS_PLAZAS]
+    else:
+        campos = list(dict.fromkeys(list(fields) + CAMPOS_PLAZAS))
+    for campo in ['id', columna_plantilla, 'x_studio_boletos_totales']:
+        if campo not in campos:
+            campos.append(campo)
+
+    df = load_frame(odoo, model, domain=domain, fields=campos, page_size=page_size)
+    df = completar_plazas(odoo, df, columna_plantilla)
+    return df[[c for c in fields if c in df.columns] + [c for c in df.columns if c not in fields]]
+
+
+def completar_plazas_registros(odoo, registros, model='product.product'):
+    """Versión de completar_plazas para registros de search_read (listas de dicts), en el lugar.
+
+    Los registros deben traer `product_tmpl_id` (o 'id' para plantillas); si además traen los
+    campos de plazas (modo 'validar'), solo se validan los contadores locales.
+    """
+    columna_plantilla = 'product_tmpl_id' if model == 'product.product' else 'id'
+    df = to_frame(model, registros, ['id', columna_plantilla, 'x_studio_boletos_totales'])
+    if df.empty:
+        return registros
+    plazas = completar_plazas(odoo, df, columna_plantilla).set_index('id')[CAMPOS_PLAZAS]
+    for registro in registros:
+        # Enteros como los devuelve Odoo (los campos de plazas son enteros)
+        registro.update({
+            campo: int(valor) if float(valor).is_integer() else valor
+            for campo, valor in plazas.loc[registro['id']].items()
+        })
+    return registros
@@ -0,0 +1,93 @@
+# staleness.py
+"""Datos en caché servidos aunque estén vencidos (stale-while-revalidate), con su antigüedad visible.
+
+Una entrada en memoria más antigua que su TTL, pero dentro de la antigüedad máxima que acepta la
+página, se devuelve de inmediato y se refresca en segundo plano (`revalidar`, un refresco por
+clave a la vez). Más allá de esa antigüedad se consulta Odoo antes de mostrar.
+
+Cada página define su antigüedad máxima (`antiguedad_maxima`, configurable por entorno con
+ANTIGUEDAD_MAXIMA_<PAGINA>) y muestra la edad de sus datos con `mostrar_antiguedad`: mientras
+hay un refresco en curso de las claves que muestra, la página se vuelve a ejecutar sola cuando
+termina.
+"""
+import os
+import threading
+import time
+
+import streamlit as st
+
+REVISION_REVALIDACION = 3
+
+_EN_CURSO = set()
+_LOCK = threading.Lock()
+
+
+def antiguedad_maxima(pagina, por_defecto):
+    """Segundos que `pagina` acepta mostrar datos vencidos (ANTIGUEDAD_MAXIMA_<PAGINA> o `por_defecto`)."""
+    return int(os.getenv(f'ANTIGUEDAD_MAXIMA_{pagina.upper()}', str(por_defecto)))
+
+
+def servir_vencido(edad, ttl, maxima):
+    """True si una entrada de `edad` segundos está vencida pero aún se puede servir mientras se refresca."""
+    return edad > ttl and maxima is not None and edad <= maxima
+
+
+def _ejecutar(grupo, clave, funcion):
+    try:
+        funcion()
+    except Exception as e:
+        print(f"Error al refrescar {grupo} en segundo plano: {str(e)}")
+    finally:
+        with _LOCK:
+            _EN_CURSO.discard((grupo, clave))
+
+
+def revalidar(grupo, clave, funcion):
+    """Ejecuta `funcion()` en un hilo aparte, salvo que ya haya un refresco de (grupo, clave) en curso."""
+    with _LOCK:
+        if (grupo, clave) in _EN_CURSO:
+            return False
+        _EN_CURSO.add((grupo, clave))
+    threading.Thread(
+        target=_ejecutar, args=(grupo, clave, funcion), name=f'revalidar-{grupo}', daemon=True
+    ).start()
+    return True
+
+
+def revalidando(grupo, claves=None):
+    """True si hay algún refresco en segundo plano en curso para `grupo` (solo de `claves`, si se indican)."""
+    with _LOCK:
+        return any(g == grupo and (claves is None or c in claves) for g, c in _EN_CURSO)
+
+
+def _texto_antiguedad(cargado):
+    minutos = int((time.time() - cargado) // 60)
+    if minutos < 1:
+        return "Datos actualizados hace menos de un minuto"
+    return f"Datos de hace {minutos} min"
+
+
+@st.fragment(run_every=REVISION_REVALIDACION)
+def _esperar_revalidacion(grupo, cargado, al_actualizar, claves):
+    if revalidando(grupo, claves):
+        st.caption(f"🕒 {_texto_antiguedad(cargado)} · actualizando en segundo plano...")
+        return
+    if al_actualizar is not None:
+        al_actualizar()
+    st.rerun()
+
+
+def mostrar_antiguedad(grupo, cargado, al_actualizar=None, claves=None):
+    """Muestra la antigüedad de los datos (`cargado`: time.time() de la carga más antigua).
+
+    Si `grupo` se está refrescando en segundo plano, revisa cada REVISION_REVALIDACION segundos y,
+    al terminar, llama a `al_actualizar()` (p. ej. para volver a cargar los resultados de la sesión)
+    y vuelve a ejecutar la página con los datos nuevos. Con `claves` (p. ej. las particiones que
+    muestra la sesión) solo cuentan los refrescos de esas claves, no los de otras sesiones.
+    """
+    if cargado is None:
+        return
+    if revalidando(grupo, claves):
+        _esperar_revalidacion(grupo, cargado, al_actualizar, claves)
+    else:
+        st.caption(f"🕒 {_texto_antiguedad(cargado)}")
@@ -0,0 +1,113 @@
+# tables.py
+"""Capa de renderizado de tablas para las páginas.
+
+Las columnas se mantienen numéricas: el formato de visualización (moneda, enteros, porcentajes)
+se declara por columna y se aplica con un Styler (separador de miles '.'). Los colores se
+calculan como máscaras vectorizadas (`semaforo`) sobre las columnas numéricas y se entregan ya
+resueltos, sin callbacks por celda ni por fila. Sobre `MAX_CELDAS_ESTILO` celdas la tabla se
+muestra sin Styler, para no serializarlo entero: sin colores y con el formato de
+`st.column_config`.
+
+También están aquí el cálculo de ocupación y los semáforos que comparten las páginas.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Sobre este número de celdas no se aplican colores (el Styler envía cada celda como texto)
+MAX_CELDAS_ESTILO = 50_000
+
+# Formatos de columna: (formato de column_config para tablas grandes, formato para Styler).
+# Los formatos printf de column_config no separan miles; sin formato, Streamlit muestra los
+# números con separador, así que moneda y enteros se dejan sin formato en ese caso.
+FORMATOS = {
+    'moneda': (None, '${:,.0f}'),
+    'clp': (None, 'CLP {:,.0f}'),
+    'entero': (None, '{:,.0f}'),
+    'porcentaje': ('%d%%', '{:.0f}%'),
+}
+
+# Colores de fondo usados por las páginas
+VERDE = 'background-color: #8eff8e'
+AMARILLO = 'background-color: #ffeb82'
+ROJO = 'background-color: #ff8e8e'
+GRIS = 'background-color: #f0f0f0'
+
+
+def semaforo(condiciones, colores, default=''):
+    """Devuelve un array de CSS (uno por fila) según la primera condición que se cumpla.
+
+    `condiciones` son máscaras booleanas (Series o arrays) evaluadas en orden; los NA cuentan
+    como False.
+    """
+    condiciones = [np.asarray(pd.Series(c).fillna(False), dtype=bool) for c in condiciones]
+    return np.select(condiciones, colores, default=default)
+
+
+def calcular_ocupacion(ocupadas, totales, maximo=None):
+    """Porcentaje de ocupación entero (truncado, hasta `maximo` si se indica). 0 si no hay plazas totales."""
+    ocupadas = pd.to_numeric(ocupadas, errors='coerce').fillna(0).to_numpy(dtype=float)
+    totales = pd.to_numeric(totales, errors='coerce').fillna(0).to_numpy(dtype=float)
+    ocupacion = np.divide(ocupadas * 100, totales, out=np.zeros_like(ocupadas), where=totales > 0)
+    if maximo is not None:
+        ocupacion = np.minimum(ocupacion, maximo)
+    return np.floor(ocupacion).astype(int)
+
+
+def color_ocupacion(ocupacion, verde_desde=80, rojo=ROJO):
+    """Semáforo de ocupación: verde desde `verde_desde`%, amarillo desde 50%, `rojo` bajo eso."""
+    return semaforo([ocupacion >= verde_desde, ocupacion >= 50, ocupacion.notna()], [VERDE, AMARILLO, rojo])
+
+
+def color_tiempo_restante(dias, rojo=ROJO, gris=GRIS):
+    """Semáforo de días a la salida: `gris` ya salió, `rojo` una semana o menos, amarillo un mes o menos."""
+    return semaforo([dias < 0, dias <= 7, dias <= 30, dias.notna()], [gris, rojo, AMARILLO, VERDE])
+
+
+def column_config_numerico(formatos):
+    """Traduce {columna: tipo de formato} a column_config de Streamlit."""
+    return {
+        columna: st.column_config.NumberColumn(format=FORMATOS[tipo][0])
+        for columna, tipo in (formatos or {}).items()
+    }
+
+
+def construir_styler(df, formatos=None, colores=None, colores_fila=None):
+    """Construye un Styler con el CSS ya calculado (una sola asignación por columna)."""
+    css = pd.DataFrame('', index=df.index, columns=df.columns)
+    if colores_fila is not None:
+        css.loc[:, :] = np.repeat(np.asarray(colores_fila, dtype=object)[:, None], len(df.columns), axis=1)
+    for columna, valores in (colores or {}).items():
+        if columna in css.columns:
+            css[columna] = np.asarray(valores, dtype=object)
+
+    styler = df.style.apply(lambda _: css, axis=None)
+    for columna, tipo in (formatos or {}).items():
+        if columna in df.columns:
+            styler = styler.format(FORMATOS[tipo][1], subset=[columna], thousands='.', na_rep='')
+    return styler
+
+
+def mostrar_tabla(df, formatos=None, colores=None, colores_fila=None, column_config=None, **kwargs):
+    """Muestra un DataFrame con formato numérico por columna y colores precalculados.
+
+    Args:
+        df: DataFrame con columnas numéricas sin formatear.
+        formatos: {columna: 'moneda' | 'clp' | 'entero' | 'porcentaje'}.
+        colores: {columna: array de CSS, uno por fila} (ver `semaforo`).
+        colores_fila: array de CSS por fila, aplicado a todas las columnas.
+        column_config: configuración adicional de columnas para st.dataframe.
+    """
+    formatos = {c: t for c, t in (formatos or {}).items() if c in df.columns}
+    kwargs.setdefault('hide_index', True)
+    kwargs.setdefault('use_container_width', True)
+
+    con_estilo = bool(formatos) or bool(colores) or colores_fila is not None
+    if con_estilo and 0 < df.size <= MAX_CELDAS_ESTILO:
+        # El Styler ya trae el texto formateado: column_config solo con lo que agrega la página
+        styler = construir_styler(df, formatos, colores, colores_fila)
+        return st.dataframe(styler, column_config=column_config, **kwargs)
+
+    config = column_config_numerico(formatos)
+    config.update(column_config or {})
+    return st.dataframe(df, column_config=config, **kwargs)